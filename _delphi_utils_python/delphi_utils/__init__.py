@@ -4,15 +4,16 @@
 from __future__ import absolute_import
 
 from .archive import ArchiveDiffer, GitArchiveDiffer, S3ArchiveDiffer
-from .export import create_export_csv
+from .export import create_export_csv, write_export_text
 from .utils import read_params
 
 from .slack_notifier import SlackNotifier
 from .logger import get_structured_logger
 from .geomap import GeoMapper
-from .smooth import Smoother
+from .smooth import IncrementalSmoother, Smoother
 from .signal import add_prefix
 from .nancodes import Nans
+from .profiling import profile
 from .weekday import Weekday
 
 __version__ = "0.3.15"
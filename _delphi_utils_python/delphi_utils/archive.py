@@ -25,25 +25,33 @@ Example workflow regardless of specific ArchiveDiffer used. Should only differ i
 Author: Eu Jing Chua
 Created: 2020-08-06
 """
+# pylint: disable=too-many-lines
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import contextmanager
+from datetime import date
 import filecmp
 from glob import glob
-from os import remove, replace
-from os.path import join, basename, abspath
+from os import close, makedirs, remove, replace
+from os.path import join, basename, abspath, dirname, exists, getsize, relpath
+import re
 import shutil
+import tempfile
 import time
 from typing import Tuple, List, Dict, Optional
 
 from boto3 import Session
 from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
 from git import Repo
 from git.refs.head import Head
 import pandas as pd
+from pandas.api.types import is_numeric_dtype
 import numpy as np
 
 from .utils import read_params
 from .logger import get_structured_logger
+from .manifest import MANIFEST_FILE, Manifest, hash_file
 from .nancodes import Nans
 
 Files = List[str]
@@ -54,6 +62,18 @@ EXPORT_CSV_DTYPES = {
     "missing_val": "Int64", "missing_se": "Int64", "missing_sample_size": "Int64"
 }
 
+EXPORT_FILENAME_REGEX = re.compile(
+    r"^(?P<time_value>\d{8}|weekly_\d{6})_(?P<geo_type>[a-z]+)_(?P<signal>\w+)\.csv$")
+
+_EXPORT_CSV_FLOAT_DTYPES = {
+    column: float if dtype == "Int64" else dtype for column, dtype in EXPORT_CSV_DTYPES.items()
+}
+
+def _with_export_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the missingness columns of an export read with _EXPORT_CSV_FLOAT_DTYPES."""
+    return df.astype({column: dtype for column, dtype in EXPORT_CSV_DTYPES.items()
+                      if dtype == "Int64" and column in df.columns})
+
 def diff_export_csv(
     before_csv: str,
     after_csv: str
@@ -79,12 +99,22 @@ def diff_export_csv(
         changed_df is the pd.DataFrame of common rows from after_csv with changed values.
         added_df is the pd.DataFrame of added rows from after_csv.
     """
-    before_df = pd.read_csv(before_csv, dtype=EXPORT_CSV_DTYPES)
+    # Missingness codes are parsed as floats, which is much faster than parsing nullable
+    # integers, and only converted to nullable integers for the rows returned.
+    before_df = pd.read_csv(before_csv, dtype=_EXPORT_CSV_FLOAT_DTYPES)
     before_df.set_index("geo_id", inplace=True)
     before_df = before_df.round({"val": 7, "se": 7})
-    after_df = pd.read_csv(after_csv, dtype=EXPORT_CSV_DTYPES)
+    after_df = pd.read_csv(after_csv, dtype=_EXPORT_CSV_FLOAT_DTYPES)
     after_df.set_index("geo_id", inplace=True)
     after_df = after_df.round({"val": 7, "se": 7})
+
+    diffs = _diff_sorted_exports(before_df, after_df)
+    if diffs is not None:
+        return diffs
+
+    before_df = _with_export_dtypes(before_df)
+    after_df = _with_export_dtypes(after_df)
+
     deleted_idx = before_df.index.difference(after_df.index)
     common_idx = before_df.index.intersection(after_df.index)
     added_idx = after_df.index.difference(before_df.index)
@@ -114,6 +144,104 @@ def diff_export_csv(
         after_df.loc[added_idx, :])
 
 
+def _diff_sorted_exports(
+    before_df: pd.DataFrame,
+    after_df: pd.DataFrame
+) -> Optional[Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]]:
+    """
+    Diff exports whose geo_id indexes are sorted and unique, using a merge-join on the indexes.
+
+    This is the common case for files written by create_export_csv, and avoids building aligned
+    copies of both frames. Returns the same frames as diff_export_csv, or None if the exports
+    are not sorted, or have columns that cannot be compared as floats.
+    """
+    new_missingness = "missing_val" not in before_df.columns and \
+        "missing_val" in after_df.columns
+    sorted_unique = all(df.index.is_monotonic_increasing and df.index.is_unique
+                        for df in [before_df, after_df])
+    numeric = all(is_numeric_dtype(dtype)
+                  for dtype in list(before_df.dtypes) + list(after_df.dtypes))
+    if not (sorted_unique and numeric and
+            (new_missingness or list(before_df.columns) == list(after_df.columns))):
+        return None
+
+    before_ids = before_df.index.to_numpy()
+    after_ids = after_df.index.to_numpy()
+    after_pos = np.searchsorted(after_ids, before_ids)
+    in_after = after_pos < len(after_ids)
+    in_after[in_after] = after_ids[after_pos[in_after]] == before_ids[in_after]
+    common_before = np.flatnonzero(in_after)
+    common_after = after_pos[in_after]
+    in_before = np.zeros(len(after_ids), dtype=bool)
+    in_before[common_after] = True
+
+    if new_missingness:
+        # If new CSV has missingness columns, but old doesn't, mark all values as new
+        changed = np.ones(len(common_after), dtype=bool)
+    else:
+        changed = np.zeros(len(common_after), dtype=bool)
+        for column in after_df.columns:
+            before = before_df[column].to_numpy(dtype=float, na_value=np.nan)[common_before]
+            after = after_df[column].to_numpy(dtype=float, na_value=np.nan)[common_after]
+            before_na, after_na = np.isnan(before), np.isnan(after)
+            # Exact comparisons, treating NA == NA as True. As in the pandas comparison,
+            # nullable integer columns ignore entries where only one side is NA.
+            same = (before == after) | (before_na & after_na)
+            if EXPORT_CSV_DTYPES.get(column) == "Int64":
+                same |= before_na ^ after_na
+            changed |= ~same
+
+    # Any deleted entries become rows with nans and the deleted missing code
+    deleted_df = _with_export_dtypes(before_df.iloc[np.flatnonzero(~in_after)])
+    deleted_df[["val", "se", "sample_size"]] = np.nan
+    deleted_df[["missing_val", "missing_se", "missing_sample_size"]] = Nans.DELETED
+
+    return (
+        deleted_df,
+        _with_export_dtypes(after_df.iloc[common_after[changed]]),
+        _with_export_dtypes(after_df.iloc[np.flatnonzero(~in_before)]))
+
+
+def _diff_export_file(
+    before_file: str,
+    after_file: str,
+    compare_bytes: bool = True
+) -> Tuple[Optional[str], int, float]:
+    """
+    Diff a common export file, writing the ADDED, CHANGED and DELETED rows to a .diff file.
+
+    Parameters
+    ----------
+    before_file: str
+        The cached CSV file to diff from
+    after_file: str
+        The exported CSV file to diff to
+    compare_bytes: bool
+        Whether to check if the files are byte-for-byte identical before diffing them.
+
+    Returns
+    -------
+        (diff_file, n_deleted, elapsed_time)
+        diff_file is the name of the .diff file written next to after_file, or None if no rows
+        were added, changed or deleted.
+        n_deleted is the number of rows deleted from before_file.
+        elapsed_time is the time taken in seconds.
+    """
+    start_time = time.time()
+    if compare_bytes and filecmp.cmp(before_file, after_file, shallow=False):
+        return None, 0, time.time() - start_time
+
+    deleted_df, changed_df, added_df = diff_export_csv(before_file, after_file)
+    new_issues_df = pd.concat([deleted_df, changed_df, added_df], axis=0)
+
+    # Write the diffs to diff_file, if applicable
+    diff_file = None
+    if len(new_issues_df) > 0:
+        diff_file = after_file + ".diff"
+        new_issues_df.to_csv(diff_file, na_rep="NA")
+    return diff_file, len(deleted_df), time.time() - start_time
+
+
 def archiver_from_params(params):
     """Build an ArchiveDiffer from `params`.
 
@@ -127,18 +255,30 @@ def archiver_from_params(params):
             - "export_dir": str, directory to which indicator output files have been exported
         - "archive":
             - "cache_dir": str, directory containing cached data from previous indicator runs
+            - "diff_workers" (optional): int, number of files to diff concurrently
+            - "diff_pool" (optional): str, "thread" or "process", kind of pool used to diff files
             - "branch_name" (required for git archiver): str, name of git branch
             - "override_dirty" (optional for git archiver): bool, whether to allow overwriting of
                 untracked & uncommitted changes in `cache_dir`
             - "commit_partial_success" (optional for git archiver): bool, whether to still commit
                 even if some files were not archived and staged due to `override_dirty=False`
             - "commit_message" (optional for git archiver): str, commit message to use
+            - "batched" (optional for git archiver): bool, whether to copy files with a thread pool
+                and stage them with a single `git add`
+            - "copy_workers" (optional for git archiver): int, number of files to copy
+                concurrently in batched mode
+            - "sparse_checkout" (optional for git archiver): bool, whether to restrict the
+                checkout to cache_dir; if false, any sparse checkout of the repository is disabled
             - "bucket_name" (required for S3 archiver): str, name of S3 bucket to which to upload
                 files
             - "indicator_prefix" (required for S3 archiver): str, S3 prefix for files from this
                 indicator
             - "aws_credentials" (required for S3 archiver): Dict[str, str], authentication
                 parameters for S3 to create a boto3.Session
+            - "transfer_workers" (optional for S3 archiver): int, number of files to download or
+                upload concurrently
+            - "store" (optional for filesystem archiver): str, "parquet" to keep cache_dir as
+                one versioned Parquet store per signal instead of CSV files
 
     Returns
     -------
@@ -159,8 +299,13 @@ def archiver_from_params(params):
         assert "aws_credentials" in kwargs, "Missing aws_credentials in params"
         return S3ArchiveDiffer(**kwargs)
 
+    if kwargs.get("store", "csv") == "parquet":
+        del kwargs["store"]
+        return ParquetArchiveDiffer(**kwargs)
+
     # Don't run the filesystem archiver if the user misspecified the archiving params
-    assert set(kwargs.keys()) == set(["cache_dir", "export_dir"]),\
+    assert set(kwargs.keys()) - set(["diff_workers", "diff_pool"]) == \
+        set(["cache_dir", "export_dir"]),\
         'If you intended to run a filesystem archiver, please remove all options other than '\
         '"cache_dir" from the "archive" params.  Otherwise, please include either "branch_name" '\
         'or "bucket_name" to run the git or S3 archivers, respectively.'
@@ -170,7 +315,8 @@ def archiver_from_params(params):
 class ArchiveDiffer:
     """Base class for performing diffing and archiving of exported covidcast CSVs."""
 
-    def __init__(self, cache_dir: str, export_dir: str):
+    def __init__(self, cache_dir: str, export_dir: str,
+                 diff_workers: int = 1, diff_pool: str = "thread"):
         """
         Initialize an ArchiveDiffer.
 
@@ -182,9 +328,18 @@ class ArchiveDiffer:
         export_dir: str
             The directory with most recent exported CSVs to diff to.
             Usually 'receiving'.
+        diff_workers: int
+            Number of files to diff concurrently in diff_exports(). Files are diffed serially
+            if 1.
+        diff_pool: str
+            Either "thread" or "process", the kind of pool used when diff_workers > 1.
         """
+        assert diff_pool in ("thread", "process"), \
+            f"diff_pool must be 'thread' or 'process', got '{diff_pool}'"
         self.cache_dir = cache_dir
         self.export_dir = export_dir
+        self.diff_workers = diff_workers
+        self.diff_pool = diff_pool
 
         self._cache_updated = False
         self._exports_archived = False
@@ -198,13 +353,23 @@ class ArchiveDiffer:
         """
         raise NotImplementedError
 
-    def diff_exports(self) -> Tuple[Files, FileDiffMap, Files]:
+    def diff_exports(self, logger=None) -> Tuple[Files, FileDiffMap, Files]:
         """
         Find diffs across and within CSV files, from cache_dir to export_dir.
 
         Should be called after update_cache() succeeds. Only works on *.csv files,
         ignores every other file.
 
+        Common files whose hashes are recorded in the manifests of both cache_dir and
+        export_dir are compared by hash, without reading either file. Otherwise, they are
+        compared byte-by-byte. Files that differ are diffed by a pool of diff_workers threads
+        or processes, if configured.
+
+        Parameters
+        ----------
+        logger: Optional[logging.Logger]
+            If given, the time taken to diff each file is logged at debug level.
+
         Returns
         -------
         (deleted_files, common_diffs, new_files): Tuple[Files, FileDiffMap, Files]
@@ -229,34 +394,47 @@ class ArchiveDiffer:
         new_files = sorted(join(self.export_dir, f)
                            for f in exported_files - previous_files)
 
-        common_diffs: Dict[str, Optional[str]] = {}
-        for filename in common_filenames:
-            before_file = join(self.cache_dir, filename)
-            after_file = join(self.export_dir, filename)
-
-            common_diffs[after_file] = None
+        cached_manifest = Manifest(self.cache_dir)
+        exported_manifest = Manifest(self.export_dir)
 
-            # Check for simple file similarity before doing CSV diffs
-            if filecmp.cmp(before_file, after_file, shallow=False):
+        to_diff = []
+        for filename in common_filenames:
+            # Check for simple file similarity by hash before reading the files
+            before_hash = cached_manifest.get(filename)
+            after_hash = exported_manifest.get(filename)
+            hashed = before_hash is not None and after_hash is not None
+            if hashed and before_hash == after_hash:
                 continue
-
-            deleted_df, changed_df, added_df = diff_export_csv(
-                before_file, after_file)
-            new_issues_df = pd.concat([deleted_df, changed_df, added_df], axis=0)
-
-            if len(deleted_df) > 0:
+            to_diff.append((join(self.cache_dir, filename),
+                            join(self.export_dir, filename),
+                            not hashed))
+
+        common_diffs: Dict[str, Optional[str]] = {
+            join(self.export_dir, filename): None for filename in common_filenames}
+        for after_file, (diff_file, n_deleted, elapsed) in zip(
+                (args[1] for args in to_diff), self._map_diffs(to_diff)):
+            if n_deleted > 0:
                 print(
                     f"Diff has deleted indices in {after_file} that have been coded as nans.")
-
-            # Write the diffs to diff_file, if applicable
-            if len(new_issues_df) > 0:
-                diff_file = join(self.export_dir, filename + ".diff")
-
-                new_issues_df.to_csv(diff_file, na_rep="NA")
-                common_diffs[after_file] = diff_file
+            if logger:
+                logger.debug("Diffed export file",
+                             phase="archiving",
+                             filename=basename(after_file),
+                             changed=diff_file is not None,
+                             elapsed_time_in_seconds=round(elapsed, 4))
+            common_diffs[after_file] = diff_file
 
         return deleted_files, common_diffs, new_files
 
+    def _map_diffs(self, to_diff):
+        """Run _diff_export_file over (before_file, after_file, compare_bytes) tuples, in order."""
+        if self.diff_workers <= 1 or len(to_diff) <= 1:
+            return [_diff_export_file(*args) for args in to_diff]
+        executor_class = ProcessPoolExecutor if self.diff_pool == "process" \
+            else ThreadPoolExecutor
+        with executor_class(max_workers=self.diff_workers) as executor:
+            return list(executor.map(_diff_export_file, *zip(*to_diff)))
+
     def archive_exports(self, exported_files: Files) -> Tuple[Files, Files]:
         """
         Handle actual archiving of files, depending on specific backend.
@@ -276,6 +454,23 @@ class ArchiveDiffer:
         """
         raise NotImplementedError
 
+    def record_archived(self, archived_files: Files):
+        """
+        Record the hashes of newly archived files in the manifest of cache_dir.
+
+        Should be called by archive_exports() implementations for the files they copied into
+        cache_dir, so that the next diff_exports() and exports can use the manifest.
+
+        Parameters
+        ----------
+        archived_files: Files
+            List of exported files that were successfully copied into cache_dir.
+        """
+        cached_manifest = Manifest(self.cache_dir)
+        for archived_file in archived_files:
+            cached_manifest.record(basename(archived_file))
+        cached_manifest.save()
+
     def filter_exports(self, common_diffs: FileDiffMap):
         """
         Filter export directory to only contain relevant files.
@@ -308,12 +503,17 @@ class ArchiveDiffer:
                 replace(diff_file, exported_file)
 
     def run(self, logger=None):
-        """Run the differ and archive the changed and new files."""
+        """Run the differ and archive the changed and new files.
+
+        The cache is only updated if update_cache has not been called already, so that it can
+        be updated ahead of time, e.g. while the exports are validated.
+        """
         start_time = time.time()
-        self.update_cache()
+        if not self._cache_updated:
+            self.update_cache()
 
         # Diff exports, and make incremental versions
-        _, common_diffs, new_files = self.diff_exports()
+        _, common_diffs, new_files = self.diff_exports(logger)
 
         # Archive changed and new files only
         to_archive = [f for f, diff in common_diffs.items()
@@ -350,6 +550,9 @@ class S3ArchiveDiffer(ArchiveDiffer):
 
     Archives CSV files into a S3 bucket, with keys "{indicator_prefix}/{csv_file_name}".
     Ideally, versioning should be enabled in this bucket to track versions of each CSV file.
+
+    The ETag of each cached object is kept in the manifest of cache_dir, so update_cache only
+    downloads objects that are missing or have changed since they were cached.
     """
 
     def __init__(
@@ -357,6 +560,9 @@ class S3ArchiveDiffer(ArchiveDiffer):
         bucket_name: str,
         indicator_prefix: str,
         aws_credentials: Dict[str, str],
+        diff_workers: int = 1,
+        diff_pool: str = "thread",
+        transfer_workers: int = 1,
     ):
         """
         Initialize a S3ArchiveDiffer.
@@ -378,11 +584,50 @@ class S3ArchiveDiffer(ArchiveDiffer):
             The prefix for S3 keys related to this indicator.
         aws_credentials: Dict[str, str]
             kwargs to create a boto3.Session, containing AWS credentials/profile to use.
+        diff_workers: int
+            Number of files to diff concurrently in diff_exports().
+        diff_pool: str
+            Either "thread" or "process", the kind of pool used when diff_workers > 1.
+        transfer_workers: int
+            Number of files to download or upload concurrently. Each file is transferred in a
+            single thread when transfer_workers > 1, so at most transfer_workers requests are
+            in flight at once.
         """
-        super().__init__(cache_dir, export_dir)
+        super().__init__(cache_dir, export_dir, diff_workers, diff_pool)
         self.s3 = Session(**aws_credentials).resource("s3")
         self.bucket = self.s3.Bucket(bucket_name)
         self.indicator_prefix = indicator_prefix
+        self.transfer_workers = transfer_workers
+        self.transfer_config = TransferConfig(use_threads=transfer_workers <= 1)
+
+    def _map_transfers(self, transfer, items):
+        """Apply transfer to each item, using a pool of transfer_workers threads if configured."""
+        if self.transfer_workers <= 1 or len(items) <= 1:
+            return [transfer(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.transfer_workers) as executor:
+            return list(executor.map(transfer, items))
+
+    def _local_etag(self, path: str) -> Optional[str]:
+        """Return the ETag S3 gives a file uploaded with transfer_config, if not multipart."""
+        if getsize(path) >= self.transfer_config.multipart_threshold:
+            return None
+        return f'"{hash_file(path, "md5")}"'
+
+    def _is_cached(self, cached_manifest: Manifest, obj) -> bool:
+        """Check whether the cached copy of an S3 object is up to date."""
+        archive_file = basename(obj.key)
+        entry = cached_manifest.entry(archive_file)
+        if entry is not None:
+            return entry.get("e_tag") == obj.e_tag and entry["size"] == obj.size
+
+        # Caches without a manifest entry: compare the contents, if the ETag is a plain MD5
+        cached_file = join(self.cache_dir, archive_file)
+        if not exists(cached_file) or getsize(cached_file) != obj.size or "-" in obj.e_tag:
+            return False
+        if self._local_etag(cached_file) != obj.e_tag:
+            return False
+        cached_manifest.record(archive_file, e_tag=obj.e_tag)
+        return True
 
     def update_cache(self):
         """Make sure cache_dir is updated with all latest files from the S3 bucket."""
@@ -392,16 +637,21 @@ class S3ArchiveDiffer(ArchiveDiffer):
         archive_objects = [
             obj for obj in archive_objects if obj.key.endswith(".csv")]
 
-        # Check against what we have locally and download missing ones
-        cached_files = set(basename(f)
-                           for f in glob(join(self.cache_dir, "*.csv")))
-        for obj in archive_objects:
-            archive_file = basename(obj.key)
-            cached_file = join(self.cache_dir, archive_file)
+        # Check against what we have locally and download missing or stale ones
+        cached_manifest = Manifest(self.cache_dir)
+        stale_objects = [obj for obj in archive_objects
+                         if not self._is_cached(cached_manifest, obj)]
+
+        def download(obj):
+            cached_file = join(self.cache_dir, basename(obj.key))
+            print(f"Updating cache with {cached_file}")
+            self.s3.meta.client.download_file(
+                self.bucket.name, obj.key, cached_file, Config=self.transfer_config)
 
-            if archive_file not in cached_files:
-                print(f"Updating cache with {cached_file}")
-                obj.Object().download_file(cached_file)
+        self._map_transfers(download, stale_objects)
+        for obj in stale_objects:
+            cached_manifest.record(basename(obj.key), e_tag=obj.e_tag)
+        cached_manifest.save()
 
         self._cache_updated = True
 
@@ -424,10 +674,7 @@ class S3ArchiveDiffer(ArchiveDiffer):
             successes: List of successfully archived files
             fails: List of unsuccessfully archived files
         """
-        archive_success = []
-        archive_fail = []
-
-        for exported_file in exported_files:
+        def archive(exported_file):
             cached_file = abspath(
                 join(self.cache_dir, basename(exported_file)))
             archive_key = join(self.indicator_prefix, basename(exported_file))
@@ -438,34 +685,59 @@ class S3ArchiveDiffer(ArchiveDiffer):
                     shutil.copyfile(exported_file, cached_file)
 
                 if update_s3:
-                    self.bucket.Object(archive_key).upload_file(exported_file)
+                    self.s3.meta.client.upload_file(
+                        exported_file, self.bucket.name, archive_key,
+                        Config=self.transfer_config)
 
-                archive_success.append(exported_file)
+                return True
             except FileNotFoundError:
-                archive_fail.append(exported_file)
+                return False
             except shutil.SameFileError:
                 # no need to copy if the cached file is the same
-                archive_success.append(exported_file)
-
+                return True
+
+        archived = self._map_transfers(archive, exported_files)
+        archive_success = [f for f, success in zip(exported_files, archived) if success]
+        archive_fail = [f for f, success in zip(exported_files, archived) if not success]
+
+        if update_cache:
+            cached_manifest = Manifest(self.cache_dir)
+            for exported_file in archive_success:
+                cached_file = join(self.cache_dir, basename(exported_file))
+                e_tag = self._local_etag(cached_file) if update_s3 else None
+                cached_manifest.record(basename(exported_file), e_tag=e_tag)
+            cached_manifest.save()
         self._exports_archived = True
 
         return archive_success, archive_fail
 
 
-class GitArchiveDiffer(ArchiveDiffer):
+class GitArchiveDiffer(ArchiveDiffer):  # pylint: disable=too-many-instance-attributes
     """
     Local git repo backend for archiving.
 
     Archives CSV files into a local git repo as commits.
     Assumes that a git repository is already set up.
+
+    The checkout of the archive branch can be restricted to cache_dir with sparse_checkout.
+    Shallow clones are not supported, since the archive is a local repository that is never
+    cloned or fetched from by the differ.
     """
 
+    # Local git config key recording the cache_dir that update_cache() restricted the checkout to
+    SPARSE_CHECKOUT_KEY = "delphi.archiveSparseCheckout"
+
     def __init__(
         self, cache_dir: str, export_dir: str,
         branch_name: Optional[str] = None,
         override_dirty: bool = False,
         commit_partial_success: bool = False,
         commit_message: str = "Automated archive",
+        diff_workers: int = 1,
+        diff_pool: str = "thread",
+        batched: bool = False,
+        copy_workers: int = 1,
+        sparse_checkout: bool = False,
     ):
         """
         Initialize a GitArchiveDiffer.
@@ -487,8 +759,25 @@ class GitArchiveDiffer(ArchiveDiffer):
             to override_dirty=False
         commit_message: str
             The automatic commit message to use for the commit.
+        diff_workers: int
+            Number of files to diff concurrently in diff_exports().
+        diff_pool: str
+            Either "thread" or "process", the kind of pool used when diff_workers > 1.
+        batched: bool
+            Whether to archive files in a batch: files are copied by a pool of copy_workers
+            threads and staged with a single `git add`, instead of being hashed into the object
+            store one at a time by GitPython.
+        copy_workers: int
+            Number of files to copy concurrently in batched mode.
+        sparse_checkout: bool
+            Whether update_cache() should restrict the checkout to cache_dir with
+            `git sparse-checkout`, so switching to the archive branch does not materialize
+            unrelated files in the rest of the repository. The sparse checkout is stored in the
+            repository config and outlives the run, so when this is False, update_cache()
+            disables a sparse checkout that an earlier run set up. Sparse checkouts set up by
+            anything else are left alone.
         """
-        super().__init__(cache_dir, export_dir)
+        super().__init__(cache_dir, export_dir, diff_workers, diff_pool)
 
         assert override_dirty or not commit_partial_success, \
             "Only can commit_partial_success=True when override_dirty=True"
@@ -500,6 +789,9 @@ class GitArchiveDiffer(ArchiveDiffer):
         self.override_dirty = override_dirty
         self.commit_partial_success = commit_partial_success
         self.commit_message = commit_message
+        self.batched = batched
+        self.copy_workers = copy_workers
+        self.sparse_checkout = sparse_checkout
 
     def get_branch(self, branch_name: Optional[str] = None) -> Head:
         """
@@ -545,23 +837,57 @@ class GitArchiveDiffer(ArchiveDiffer):
         Check if cache_dir is clean: has everything nicely committed if override_dirty=False.
 
         Since we are using a local git repo, assumes there is nothing to update from.
+        The untracked manifest of cache_dir does not count as an uncommitted change.
+        If sparse_checkout is set, the checkout is first restricted to cache_dir. Otherwise,
+        the full checkout is restored if an earlier run left its sparse checkout enabled.
         """
+        cache_path = relpath(abspath(self.cache_dir), self.repo.working_tree_dir)
+        if self.sparse_checkout and cache_path != ".":
+            # Refresh stale stat info first, or git keeps files it thinks were modified
+            self.repo.git.update_index("-q", "--refresh")
+            self.repo.git.sparse_checkout("set", cache_path)
+            self.repo.git.config("--local", self.SPARSE_CHECKOUT_KEY, cache_path)
+        else:
+            self._disable_own_sparse_checkout()
+
         # Make sure cache directory is clean: has everything nicely committed
         if not self.override_dirty:
-            cache_clean = not self.repo.is_dirty(
-                untracked_files=True, path=abspath(self.cache_dir))
+            cache_dir = abspath(self.cache_dir)
+            untracked_files = [abspath(join(self.repo.working_tree_dir, f))
+                               for f in self.repo.untracked_files]
+            cache_clean = not self.repo.is_dirty(path=cache_dir) and all(
+                f == join(cache_dir, MANIFEST_FILE) or not f.startswith(join(cache_dir, ""))
+                for f in untracked_files)
             assert cache_clean, f"There are uncommitted changes in the cache dir '{self.cache_dir}'"
 
         self._cache_updated = True
 
-    def diff_exports(self) -> Tuple[Files, FileDiffMap, Files]:
+    def _disable_own_sparse_checkout(self):
+        """Disable the sparse checkout set up by an earlier update_cache(), if still in place."""
+        cache_path = self.repo.git.config("--local", "--default=", "--get",
+                                          self.SPARSE_CHECKOUT_KEY)
+        if not cache_path:
+            return
+        # Leave the sparse checkout alone if it was changed since update_cache() set it up
+        if self._sparse_checkout_enabled() and \
+                self.repo.git.sparse_checkout("list") == cache_path:
+            self.repo.git.sparse_checkout("disable")
+        self.repo.git.config("--local", "--unset", self.SPARSE_CHECKOUT_KEY)
+
+    def _sparse_checkout_enabled(self) -> bool:
+        """Return whether the repository has a sparse checkout, as set in any git config."""
+        # `git sparse-checkout` writes to the worktree config, which GitPython does not read
+        return self.repo.git.config("--type=bool", "--default=false",
+                                    "--get", "core.sparseCheckout") == "true"
+
+    def diff_exports(self, logger=None) -> Tuple[Files, FileDiffMap, Files]:
         """
         Find diffs across and within CSV files, from cache_dir to export_dir.
 
         Same as base class diff_exports, but in context of specified branch.
         """
         with self.archiving_branch():
-            return super().diff_exports()
+            return super().diff_exports(logger)
 
     def archive_exports(self, exported_files: Files) -> Tuple[Files, Files]:
         """
@@ -590,29 +916,28 @@ class GitArchiveDiffer(ArchiveDiffer):
             dirty_files += [join(working_tree_dir, d.a_path)
                             for d in self.repo.index.diff(None)]
 
+            to_copy = []
             for exported_file in exported_files:
                 archive_file = abspath(
                     join(self.cache_dir, basename(exported_file)))
 
                 # Archive and explicitly stage new export, depending if override
                 if self.override_dirty or archive_file not in dirty_files:
-                    try:
-                        # Archive
-                        shutil.copyfile(exported_file, archive_file)
-
-                        archived_files.append(archive_file)
-                        archive_success.append(exported_file)
-
-                    except (FileNotFoundError, S3UploadFailedError) as ex:
-                        print(ex)
-                        archive_fail.append(exported_file)
+                    to_copy.append((exported_file, archive_file))
 
                 # Otherwise ignore the archiving for this file
                 else:
                     archive_fail.append(exported_file)
 
+            for (exported_file, archive_file), copied in zip(to_copy, self._copy_files(to_copy)):
+                if copied:
+                    archived_files.append(archive_file)
+                    archive_success.append(exported_file)
+                else:
+                    archive_fail.append(exported_file)
+
             # Stage
-            self.repo.index.add(archived_files)
+            self._stage(archived_files)
 
             # Commit staged files
             if len(exported_files) > 0:
@@ -624,10 +949,41 @@ class GitArchiveDiffer(ArchiveDiffer):
                 if len(archive_success) == len(exported_files) or partial_success:
                     self.repo.index.commit(message=self.commit_message)
 
+            self.record_archived(archive_success)
+
         self._exports_archived = True
 
         return archive_success, archive_fail
 
+    def _copy_files(self, to_copy: List[Tuple[str, str]]) -> List[bool]:
+        """Copy (exported_file, archive_file) pairs, returning whether each copy succeeded."""
+        def copy(paths):
+            try:
+                # Archive
+                shutil.copyfile(*paths)
+                return True
+            except (FileNotFoundError, S3UploadFailedError) as ex:
+                print(ex)
+                return False
+
+        if not self.batched or self.copy_workers <= 1:
+            return [copy(paths) for paths in to_copy]
+        with ThreadPoolExecutor(max_workers=self.copy_workers) as executor:
+            return list(executor.map(copy, to_copy))
+
+    def _stage(self, archived_files: Files):
+        """Stage archived files, with a single `git add` in batched mode."""
+        if not self.batched:
+            self.repo.index.add(archived_files)
+            return
+        if not archived_files:
+            return
+        with tempfile.NamedTemporaryFile("w", suffix=".pathspec") as pathspec:
+            pathspec.write("\n".join(relpath(f, self.repo.working_tree_dir)
+                                      for f in archived_files))
+            pathspec.flush()
+            self.repo.git.add(f"--pathspec-from-file={pathspec.name}")
+
 class FilesystemArchiveDiffer(ArchiveDiffer):
     """Filesystem-based backend for archiving.
 
@@ -670,6 +1026,7 @@ class FilesystemArchiveDiffer(ArchiveDiffer):
                 print(ex)
                 archive_fail.append(exported_file)
 
+        self.record_archived(archive_success)
         self._exports_archived = True
         return archive_success, archive_fail
 
@@ -682,6 +1039,289 @@ class FilesystemArchiveDiffer(ArchiveDiffer):
         """
         self._cache_updated = True
 
+class ParquetArchiveDiffer(FilesystemArchiveDiffer):
+    """Filesystem-based backend keeping a versioned Parquet store per signal.
+
+    Instead of one CSV per date, geo type and signal, cache_dir holds one Parquet dataset per
+    signal, "{signal}.parquet", partitioned by issue. Each run appends the snapshots of the CSVs
+    it archives to its own "issue={issue}" partition, with the columns of the exported CSVs
+    plus "geo_type" and "time_value", so earlier versions are kept and never rewritten. The
+    cached version of a CSV is its snapshot with the latest issue.
+
+    Exported CSVs are diffed against the cached versions with a single join per signal, and
+    signals are diffed by a pool of diff_workers threads or processes, if configured. The
+    diffs written to export_dir are the same as those of the other backends.
+
+    Exported files must be named "{time_value}_{geo_type}_{signal}.csv", where time_value is
+    either YYYYMMDD or weekly_YYYYWW. Other files cannot be stored, and are reported as new
+    files that fail to archive.
+    """
+
+    KEY_COLUMNS = ["geo_type", "time_value", "geo_id"]
+    VALUE_COLUMNS = ["val", "se", "sample_size",
+                     "missing_val", "missing_se", "missing_sample_size"]
+
+    def __init__(self, cache_dir: str, export_dir: str,
+                 diff_workers: int = 1, diff_pool: str = "thread",
+                 issue: Optional[int] = None):
+        """
+        Initialize a ParquetArchiveDiffer.
+
+        Parameters
+        ----------
+        cache_dir: str
+            The directory holding the Parquet stores. Usually 'cache'.
+        export_dir: str
+            The directory with most recent exported CSVs to diff to.
+            Usually 'receiving'.
+        diff_workers: int
+            Number of signals to diff concurrently in diff_exports().
+        diff_pool: str
+            Either "thread" or "process", the kind of pool used when diff_workers > 1.
+        issue: Optional[int]
+            Issue under which exports are archived, as YYYYMMDD. Defaults to today.
+        """
+        super().__init__(cache_dir, export_dir, diff_workers, diff_pool)
+        self.issue = int(date.today().strftime("%Y%m%d")) if issue is None else issue
+
+    @staticmethod
+    def parse_filename(filename: str) -> Optional[Tuple[str, str, str]]:
+        """Return the (time_value, geo_type, signal) of an export file name, if it has one."""
+        match = EXPORT_FILENAME_REGEX.match(basename(filename))
+        if match is None:
+            return None
+        return match.group("time_value"), match.group("geo_type"), match.group("signal")
+
+    def store_file(self, signal: str) -> str:
+        """Return the path of the Parquet store of `signal`."""
+        return join(self.cache_dir, f"{signal}.parquet")
+
+    def partition_file(self, signal: str, issue: int) -> str:
+        """Return the path of the Parquet file holding the snapshots of `issue` for `signal`."""
+        return join(self.store_file(signal), f"issue={issue}", "part-0.parquet")
+
+    def read_store(self, signal: str, latest: bool = True) -> pd.DataFrame:
+        """
+        Read the Parquet store of `signal`.
+
+        Parameters
+        ----------
+        signal: str
+            Name of the signal.
+        latest: bool
+            If True, only return the rows of the latest issue of each cached CSV.
+
+        Returns
+        -------
+        pd.DataFrame with the key, value and issue columns, empty if there is no store.
+        """
+        partitions = sorted(glob(join(self.store_file(signal), "issue=*", "part-0.parquet")))
+        if not partitions:
+            return pd.DataFrame(
+                {column: pd.Series(dtype=str if column in self.KEY_COLUMNS else float)
+                 for column in self.KEY_COLUMNS + self.VALUE_COLUMNS}
+            ).assign(issue=pd.Series(dtype="int64"))
+        store = pd.concat(
+            [pd.read_parquet(partition).assign(
+                issue=np.int64(basename(dirname(partition))[len("issue="):]))
+             for partition in partitions],
+            ignore_index=True)
+        if not latest:
+            return store
+        latest_issue = store.groupby(["geo_type", "time_value"])["issue"].transform("max")
+        return store[store["issue"] == latest_issue].reset_index(drop=True)
+
+    def _read_exports(self, exported_files: Files) -> Tuple[pd.DataFrame, Dict[str, list]]:
+        """Read export CSVs into one frame with key columns, and return the columns of each."""
+        frames, columns = [], {}
+        for exported_file in exported_files:
+            time_value, geo_type, _ = self.parse_filename(exported_file)
+            df = pd.read_csv(exported_file, dtype=_EXPORT_CSV_FLOAT_DTYPES)
+            columns[exported_file] = [c for c in self.VALUE_COLUMNS if c in df.columns]
+            frames.append(df.assign(geo_type=geo_type, time_value=time_value))
+        exports = pd.concat(frames, ignore_index=True)
+        return exports.reindex(columns=self.KEY_COLUMNS + self.VALUE_COLUMNS), columns
+
+    def diff_exports(self, logger=None) -> Tuple[Files, FileDiffMap, Files]:
+        """
+        Find diffs across and within CSV files, from the Parquet stores to export_dir.
+
+        Should be called after update_cache() succeeds. Only works on *.csv files,
+        ignores every other file. Values are compared after rounding val and se to 7 decimal
+        places, treating NA == NA as True.
+
+        Parameters
+        ----------
+        logger: Optional[logging.Logger]
+            If given, the time taken to diff each signal is logged at debug level.
+
+        Returns
+        -------
+        (deleted_files, common_diffs, new_files): Tuple[Files, FileDiffMap, Files]
+            Same as ArchiveDiffer.diff_exports(). deleted_files are the paths in cache_dir that
+            the cached versions would have as CSV files.
+        """
+        assert self._cache_updated
+
+        by_signal: Dict[str, Files] = {}
+        new_files = []
+        for exported_file in sorted(glob(join(self.export_dir, "*.csv"))):
+            parsed = self.parse_filename(exported_file)
+            if parsed is None:
+                new_files.append(exported_file)
+            else:
+                by_signal.setdefault(parsed[2], []).append(exported_file)
+
+        deleted_files, common_diffs = [], {}
+        signals = sorted(by_signal.items())
+        for (signal, _), (deleted, diffs, new, elapsed) in zip(
+                signals, self._map_signal_diffs(signals)):
+            deleted_files += deleted
+            common_diffs.update(diffs)
+            new_files += new
+            if logger:
+                logger.debug("Diffed signal store",
+                             phase="archiving",
+                             signal=signal,
+                             common_files_count=len(diffs),
+                             elapsed_time_in_seconds=round(elapsed, 4))
+
+        return sorted(deleted_files), dict(sorted(common_diffs.items())), sorted(new_files)
+
+    def _map_signal_diffs(self, signals):
+        """Run _diff_signal over (signal, exported_files) pairs, in order."""
+        if self.diff_workers <= 1 or len(signals) <= 1:
+            return [self._diff_signal(*args) for args in signals]
+        executor_class = ProcessPoolExecutor if self.diff_pool == "process" \
+            else ThreadPoolExecutor
+        with executor_class(max_workers=self.diff_workers) as executor:
+            return list(executor.map(self._diff_signal, *zip(*signals)))
+
+    def _diff_signal(
+        self,
+        signal: str,
+        exported_files: Files
+    ) -> Tuple[Files, FileDiffMap, Files, float]:
+        """
+        Diff the exported CSVs of one signal against its store, writing .diff files.
+
+        Returns the deleted files, common diffs and new files of the signal, and the time taken
+        in seconds.
+        """
+        start_time = time.time()
+        file_keys = ["geo_type", "time_value"]
+        cached = self.read_store(signal)
+        exported, columns = self._read_exports(exported_files)
+
+        exported_names = {f"{time_value}_{geo_type}_{signal}.csv": name for name, (
+            time_value, geo_type, _) in ((f, self.parse_filename(f)) for f in exported_files)}
+        cached_names = set(
+            f"{time_value}_{geo_type}_{signal}.csv"
+            for geo_type, time_value in cached[file_keys].drop_duplicates().itertuples(
+                index=False))
+        deleted_files = [join(self.cache_dir, name) for name in cached_names - set(exported_names)]
+        new_files = [exported_names[name] for name in set(exported_names) - cached_names]
+        common_files = [exported_names[name] for name in set(exported_names) & cached_names]
+        common_diffs: FileDiffMap = {exported_file: None for exported_file in common_files}
+        if not common_files:
+            return deleted_files, common_diffs, new_files, time.time() - start_time
+
+        # Restrict both sides to the common files, and join them on geo_type, time_value, geo_id
+        common_keys = pd.MultiIndex.from_tuples(
+            [self.parse_filename(f)[1::-1] for f in common_files], names=file_keys)
+        exported = exported[pd.MultiIndex.from_frame(exported[file_keys]).isin(common_keys)]
+        cached = cached[pd.MultiIndex.from_frame(cached[file_keys]).isin(common_keys)]
+        joined = exported.merge(cached.drop(columns="issue"), how="outer", on=self.KEY_COLUMNS,
+                                suffixes=("", "_before"), indicator=True)
+
+        # Exact comparisons after rounding, treating NA == NA as True
+        changed = np.zeros(len(joined), dtype=bool)
+        for column in self.VALUE_COLUMNS:
+            after, before = joined[column].to_numpy(), joined[column + "_before"].to_numpy()
+            if column in ("val", "se"):
+                after, before = np.round(after, 7), np.round(before, 7)
+            changed |= ~((after == before) | (np.isnan(after) & np.isnan(before)))
+        kind = np.select([joined["_merge"] == "right_only", joined["_merge"] == "left_only"],
+                         [0, 2], 1)
+
+        # Any deleted entries become rows with nans and the deleted missing code
+        diffs = joined.assign(kind=kind)[(kind != 1) | changed]
+        deleted = diffs["kind"].to_numpy() == 0
+        diffs.loc[deleted, ["val", "se", "sample_size"]] = np.nan
+        diffs.loc[deleted, ["missing_val", "missing_se", "missing_sample_size"]] = Nans.DELETED
+        diffs = diffs.sort_values(file_keys + ["kind", "geo_id"])
+
+        exported_files_by_key = {self.parse_filename(f)[1::-1]: f for f in common_files}
+        for key, file_diffs in diffs.groupby(file_keys, sort=False):
+            exported_file = exported_files_by_key[key]
+            n_deleted = (file_diffs["kind"] == 0).sum()
+            if n_deleted > 0:
+                print(f"Diff has deleted indices in {exported_file} "
+                      "that have been coded as nans.")
+                file_columns = list(dict.fromkeys(columns[exported_file] + self.VALUE_COLUMNS[3:]))
+            else:
+                file_columns = columns[exported_file]
+            diff_file = exported_file + ".diff"
+            _with_export_dtypes(file_diffs.set_index("geo_id")[file_columns]).to_csv(
+                diff_file, na_rep="NA")
+            common_diffs[exported_file] = diff_file
+
+        return deleted_files, common_diffs, new_files, time.time() - start_time
+
+    def archive_exports(self, exported_files: Files) -> Tuple[Files, Files]:
+        """
+        Archive exported CSVs into the Parquet stores of their signals, under self.issue.
+
+        Only the partition of self.issue is written. A CSV archived again under the same issue
+        replaces its earlier snapshot.
+
+        Parameters
+        ----------
+        exported_files: Files
+            List of files to be archived. Usually new and changed files.
+
+        Returns
+        -------
+        (successes, fails): Tuple[Files, Files]
+            successes: List of successfully archived files
+            fails: List of files that are missing or not named like export files
+        """
+        archive_success, archive_fail = [], []
+        by_signal: Dict[str, Files] = {}
+        for exported_file in exported_files:
+            parsed = self.parse_filename(exported_file)
+            if parsed is None or not exists(exported_file):
+                print(f"Cannot archive {exported_file}")
+                archive_fail.append(exported_file)
+            else:
+                by_signal.setdefault(parsed[2], []).append(exported_file)
+
+        for signal, signal_files in by_signal.items():
+            archived, _ = self._read_exports(signal_files)
+            partition_file = self.partition_file(signal, self.issue)
+            if exists(partition_file):
+                earlier = pd.read_parquet(partition_file)
+                replaced = pd.MultiIndex.from_frame(earlier[["geo_type", "time_value"]]).isin(
+                    pd.MultiIndex.from_frame(archived[["geo_type", "time_value"]]))
+                archived = pd.concat([earlier[~replaced], archived], ignore_index=True)
+            archived = archived.sort_values(self.KEY_COLUMNS, ignore_index=True)
+
+            # Replace the partition atomically, so an interrupted run leaves the previous version
+            makedirs(dirname(partition_file), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            close(fd)
+            try:
+                archived.to_parquet(tmp_path, index=False)
+                replace(tmp_path, partition_file)
+            except OSError:
+                remove(tmp_path)
+                raise
+            archive_success += signal_files
+
+        self._exports_archived = True
+        return archive_success, archive_fail
+
+
 if __name__ == "__main__":
     _params = read_params()
 
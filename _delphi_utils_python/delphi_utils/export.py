@@ -1,7 +1,9 @@
 """Export data in the format expected by the Delphi API."""
 # -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from os.path import join
+from os import makedirs
+from os.path import basename, dirname, join
 from typing import Optional
 import logging
 
@@ -9,6 +11,7 @@ from epiweeks import Week
 import numpy as np
 import pandas as pd
 
+from .manifest import Manifest, hash_bytes
 from .nancodes import Nans
 
 def filter_contradicting_missing_codes(df, sensor, metric, date, logger=None):
@@ -30,6 +33,93 @@ def filter_contradicting_missing_codes(df, sensor, metric, date, logger=None):
             df = df.loc[~mask]
     return df
 
+PARQUET_DATASET = "parquet"
+
+def _date_str(date, weekly_dates):
+    """Return the date label used in export file names."""
+    if weekly_dates:
+        t = Week.fromdate(pd.to_datetime(str(date)))
+        return "weekly_" + str(t.year) + str(t.week).zfill(2)
+    return date.strftime('%Y%m%d')
+
+def _export_file(export_dir, date_str, geo_res, sensor, metric, output_format):
+    """Return the path of the file holding the values for a single date.
+
+    CSV files are written directly into export_dir. Parquet files are written into a single
+    hive-partitioned dataset under export_dir/parquet, with one partition per geo_res, signal
+    and date.
+    """
+    signal = sensor if metric is None else f"{metric}_{sensor}"
+    if output_format == "parquet":
+        return join(export_dir, PARQUET_DATASET, f"geo_res={geo_res}", f"signal={signal}",
+                    f"date={date_str}", "part-0.parquet")
+    return join(export_dir, f"{date_str}_{geo_res}_{signal}.csv")
+
+def write_export_text(content: str, export_file: str, exported: Optional[Manifest] = None):
+    """Write the contents of an export CSV file.
+
+    Parameters
+    ----------
+    content: str
+        The full contents of the CSV file.
+    export_file: str
+        Path of the CSV file.
+    exported: Optional[Manifest]
+        Manifest of the export directory. If given, the hash of content is recorded in it, and
+        a file already holding the same contents is left in place instead of being rewritten.
+        The caller saves the manifest once all files are written.
+    """
+    if exported is None:
+        with open(export_file, "w", encoding="utf-8") as f:
+            f.write(content)
+        return
+    encoded = content.encode()
+    digest = hash_bytes(encoded)
+    if digest != exported.get(basename(export_file)):
+        with open(export_file, "wb") as f:
+            f.write(encoded)
+    exported.record(basename(export_file), digest)
+
+def _write_export_file(export_df, export_file, output_format, exported=None):
+    """Write the values for a single date in the requested format.
+
+    If the manifest of export_dir is given, the CSV contents are written with write_export_text.
+    """
+    if output_format == "parquet":
+        makedirs(dirname(export_file), exist_ok=True)
+        export_df.to_parquet(export_file, index=False)
+    elif exported is None:
+        export_df.to_csv(export_file, index=False, na_rep="NA")
+    else:
+        write_export_text(export_df.to_csv(index=False, na_rep="NA"), export_file, exported)
+
+def _write_export_files(writes, output_format, max_workers=None, exported=None):
+    """Write each (DataFrame, filename) pair, optionally using a bounded thread pool."""
+    if max_workers is None or max_workers <= 1:
+        for export_df, export_file in writes:
+            _write_export_file(export_df, export_file, output_format, exported)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_write_export_file, export_df, export_file, output_format, exported)
+            for export_df, export_file in writes
+        ]
+        for future in futures:
+            future.result()
+
+def _export_dates(timestamps, start_date, end_date, write_empty_days):
+    """Return the dates for which files are written."""
+    if start_date is None:
+        start_date = min(timestamps)
+    if end_date is None:
+        end_date = max(timestamps)
+    if not write_empty_days:
+        return pd.Series(
+            timestamps[np.logical_and(timestamps >= start_date,
+                                      timestamps <= end_date)].unique()
+        ).sort_values()
+    return pd.date_range(start_date, end_date)
+
 def create_export_csv(
     df: pd.DataFrame,
     export_dir: str,
@@ -42,7 +132,10 @@ def create_export_csv(
     write_empty_days: Optional[bool] = False,
     logger: Optional[logging.Logger] = None,
     weekly_dates = False,
-    sort_geos: bool = False
+    sort_geos: bool = False,
+    max_workers: Optional[int] = None,
+    output_format: str = "csv",
+    record_hashes: bool = False
 ):
     """Export data in the format expected by the Delphi API.
 
@@ -51,7 +144,8 @@ def create_export_csv(
     Parameters
     ----------
     df: pd.DataFrame
-        Columns: geo_id, timestamp, val, se, sample_size
+        Columns: geo_id, timestamp, val, se, sample_size, and optionally direction, which is
+        only written when output_format is "parquet"
     export_dir: str
         Export directory
     geo_res: str
@@ -77,56 +171,75 @@ def create_export_csv(
     sort_geos: bool
         If True, the dataframe is sorted by geo before writing. Otherwise, the dataframe is
         written as is.
+    max_workers: Optional[int]
+        If greater than 1, the CSV files are written by a thread pool of this size.
+        Otherwise they are written one at a time.
+    output_format: str
+        Either "csv", to write one CSV file per date into export_dir, or "parquet", to write a
+        single Parquet dataset under export_dir/parquet, partitioned by geo_res, signal and date.
+        The Parquet files have the same columns as the CSV files; days without any rows are
+        not written. The validator and the archivers only read the CSV files, so indicators
+        write the Parquet dataset as a side output, in addition to the CSV files.
+    record_hashes: bool
+        If True, the hashes of the CSV files are recorded in the manifest of export_dir, so the
+        archiver can compare them to their archived copies without reading either file. The CSV
+        contents are still formatted in memory to be hashed, but files already in export_dir
+        with the same contents are not written again. Ignored when output_format is "parquet".
 
     Returns
     ---------
     dates: pd.Series[datetime]
         Series of dates for which CSV files were exported.
     """
-    df = df.copy()
+    if output_format not in ("csv", "parquet"):
+        raise ValueError(f"Unsupported output_format '{output_format}', "
+                         "must be one of ['csv', 'parquet']")
+    timestamps = pd.to_datetime(df["timestamp"])
+    dates = _export_dates(timestamps, start_date, end_date, write_empty_days)
 
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
-    if start_date is None:
-        start_date = min(df["timestamp"])
-    if end_date is None:
-        end_date = max(df["timestamp"])
-    if not write_empty_days:
-        dates = pd.Series(
-            df[np.logical_and(df["timestamp"] >= start_date,
-                          df["timestamp"] <= end_date)]["timestamp"].unique()
-        ).sort_values()
-    else:
-        dates = pd.date_range(start_date, end_date)
+    expected_columns = [
+        "geo_id",
+        "val",
+        "se",
+        "sample_size",
+        "missing_val",
+        "missing_se",
+        "missing_sample_size"
+    ]
+    if output_format == "parquet":
+        # Parquet side outputs keep the direction column that some indicators' CSV files have
+        expected_columns.insert(3, "direction")
+    # Sort the rows by date once, so that each date is a contiguous block of rows
+    order = np.argsort(timestamps.to_numpy(), kind="stable")
+    sorted_timestamps = timestamps.to_numpy()[order]
+    export_data = df.filter(items=expected_columns).take(order)
+    export_data = export_data.round({"val": 7, "se": 7})
+    if "missing_val" in export_data.columns:
+        has_contradictions = np.zeros(len(export_data), dtype=bool)
+        for column in ["val", "se", "sample_size"]:
+            missing = export_data["missing_" + column].eq(Nans.NOT_MISSING)
+            has_contradictions |= ~(export_data[column].isna() ^ missing).to_numpy()
 
+    writes = []
     for date in dates:
-        if weekly_dates:
-            t = Week.fromdate(pd.to_datetime(str(date)))
-            date_str = "weekly_" + str(t.year) + str(t.week).zfill(2)
-        else:
-            date_str = date.strftime('%Y%m%d')
-        if metric is None:
-            export_filename = f"{date_str}_{geo_res}_{sensor}.csv"
-        else:
-            export_filename = f"{date_str}_{geo_res}_{metric}_{sensor}.csv"
-        export_file = join(export_dir, export_filename)
-        expected_columns = [
-            "geo_id",
-            "val",
-            "se",
-            "sample_size",
-            "missing_val",
-            "missing_se",
-            "missing_sample_size"
-        ]
-        export_df = df[df["timestamp"] == date].filter(items=expected_columns)
-        if "missing_val" in export_df.columns:
+        export_file = _export_file(export_dir, _date_str(date, weekly_dates),
+                                   geo_res, sensor, metric, output_format)
+        first = np.searchsorted(sorted_timestamps, np.datetime64(date), side="left")
+        last = np.searchsorted(sorted_timestamps, np.datetime64(date), side="right")
+        export_df = export_data.iloc[first:last]
+        if "missing_val" in export_df.columns and has_contradictions[first:last].any():
             export_df = filter_contradicting_missing_codes(
                 export_df, sensor, metric, date, logger=logger
             )
         if remove_null_samples:
             export_df = export_df[export_df["sample_size"].notnull()]
-        export_df = export_df.round({"val": 7, "se": 7})
         if sort_geos:
             export_df = export_df.sort_values(by="geo_id")
-        export_df.to_csv(export_file, index=False, na_rep="NA")
+        if output_format == "csv" or not export_df.empty:
+            writes.append((export_df, export_file))
+
+    exported = Manifest(export_dir) if record_hashes and output_format == "csv" else None
+    _write_export_files(writes, output_format, max_workers, exported)
+    if exported is not None:
+        exported.save()
     return dates
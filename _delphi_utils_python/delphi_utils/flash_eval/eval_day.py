@@ -212,16 +212,13 @@ def setup_fips():
 
     Output: conversion dictionary state to fips & population per fips df
     """
-    gmpr = GeoMapper()
+    gmpr = GeoMapper.get_shared()
     STATE_to_fips = gmpr.get_crosswalk("state", "state")
     STATE_to_fips = pd.DataFrame(STATE_to_fips)[["state_id",
         "state_code"]].set_index("state_id").to_dict()["state_code"]
-    state_df = gmpr.get_crosswalk("state_code", "pop")
-    state_df.columns = ['geo', 'pop']
-    fips_df = gmpr.get_crosswalk("fips", "pop")
-    fips_df.columns = ['geo', 'pop']
-    natl_df = gmpr.get_crosswalk("nation", "pop")
-    natl_df.columns = ['geo', 'pop']
+    state_df = gmpr.get_crosswalk("state_code", "pop").rename(columns={"state_code": "geo"})
+    fips_df = gmpr.get_crosswalk("fips", "pop").rename(columns={"fips": "geo"})
+    natl_df = gmpr.get_crosswalk("nation", "pop").rename(columns={"nation": "geo"})
     fips_pop_table = pd.concat([state_df, fips_df, natl_df])
     fips_pop_table = fips_pop_table.set_index('geo')
 
@@ -2,21 +2,28 @@
 
 Authors: Dmitry Shemetov @dshemetov, James Sharpnack @jsharpna, Maria Jahja
 Created: 2020-06-01
-
-TODO:
-- use a caching utility to store the crossfiles
-  see: https://github.com/cmu-delphi/covidcast-indicators/issues/282
 """
 # pylint: disable=too-many-lines
+import gc
+import os
+import tempfile
+import threading
+from io import BytesIO
+from zipfile import BadZipFile
 from os.path import join
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 
+import numpy as np
 import pandas as pd
 import pkg_resources
-from pandas.api.types import is_string_dtype
+from pandas.api.types import is_bool_dtype, is_numeric_dtype, is_string_dtype
+from scipy import sparse
+
+
+_GeoPanels = namedtuple("_GeoPanels", ["date_index", "geo_index", "presence", "values", "dtypes"])
 
 
-class GeoMapper:  # pylint: disable=too-many-public-methods
+class GeoMapper:  # pylint: disable=too-many-public-methods,too-many-instance-attributes
     """Geo mapping tools commonly used in Delphi.
 
     The GeoMapper class provides utility functions for translating between different
@@ -46,11 +53,14 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
     - [x] nation
     - [ ] zip -> dma (postponed)
 
-    The GeoMapper instance loads crosswalk tables from the package data_dir. The
-    crosswalk tables are assumed to have been built using the geo_data_proc.py script
-    in data_proc/geomap. If a mapping between codes is NOT one to many, then the table has
-    just two colums. If the mapping IS one to many, then a third column, the weight column,
-    exists (e.g. zip, fips, weight; satisfying (sum(weights) where zip==ZIP) == 1).
+    The GeoMapper instance loads crosswalk tables from the package data_dir the first time
+    a (from_code, to_code) pair is requested. Each table is also compiled to a NumPy .npz
+    file in cache_dir, which is reused by later instances as long as the size and modification
+    time of the source CSV are unchanged. The crosswalk tables are assumed to have been built
+    using the geo_data_proc.py script in data_proc/geomap. If a mapping between codes is NOT one to
+    many, then the table has just two colums. If the mapping IS one to many, then a third
+    column, the weight column, exists (e.g. zip, fips, weight; satisfying
+    (sum(weights) where zip==ZIP) == 1).
 
     Example Usage
     ==========
@@ -70,6 +80,9 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
     > gmpr = GeoMapper()
     > df = gmpr.replace_geocode(df, "fips", "zip", from_col="fips", new_col="geo_id",
                                 date_col="timestamp", dropna=False)
+
+    Example 3: to reuse the crosswalks already loaded elsewhere in the process:
+    > gmpr = GeoMapper.get_shared()
     """
 
     CROSSWALK_FILENAMES = {
@@ -106,16 +119,43 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
         "nation": {"pop": "nation_pop.csv"},
     }
 
-    def __init__(self, census_year=2020):
+    # Default cache_dir, resolved to the directory in the CACHE_DIR_ENV_VAR environment variable
+    # or to ~/.cache/delphi_utils/geomap when the cache is first used
+    DEFAULT_CACHE_DIR = "default"
+    CACHE_DIR_ENV_VAR = "DELPHI_GEOMAP_CACHE_DIR"
+
+    # (contained, container) geo types supported by get_geos_within
+    CONTAINMENT_PAIRS = [("state", "nation"), ("state", "hhs"), ("fips", "state"),
+                         ("chng-fips", "state")]
+
+    # Largest (fips x day) array built by the vectorized megacounty computation
+    MAX_DENSE_MEGACOUNTY_CELLS = 50_000_000
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, census_year=2020, cache_dir=DEFAULT_CACHE_DIR):
         """Initialize geomapper.
 
+        Crosswalk tables are not read here; each one is loaded on first use.
+
         Parameters
         ---------
         census_year: int
             Year of Census population data. 2019 estimates and 2020 full Census supported.
+        cache_dir: str or None
+            Directory for the precompiled crosswalk cache. If None, crosswalks are always
+            parsed from the package CSVs. By default, the directory in the
+            DELPHI_GEOMAP_CACHE_DIR environment variable at the time a crosswalk is loaded, or
+            ~/.cache/delphi_utils/geomap if it is not set.
         """
+        self.census_year = census_year
+        self.cache_dir = cache_dir
         self._crosswalks = defaultdict(dict)
+        self._sparse_crosswalks = {}
         self._geo_sets = dict()
+        self._geo_vocabularies = {}
+        self._containment = {}
 
         # Include all unique geos from first-level and second-level keys in
         # CROSSWALK_FILENAMES, with a few exceptions
@@ -126,19 +166,88 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
                 set(self.CROSSWALK_FILENAMES.keys())
             ) - set(["state", "pop"])
 
-        for from_code, to_codes in self.CROSSWALK_FILENAMES.items():
-            for to_code, file_path in to_codes.items():
-                self._crosswalks[from_code][to_code] = \
-                    self._load_crosswalk_from_file(from_code,
-                                                   to_code,
-                                                   join(f"data/{census_year}", file_path)
-                                                   )
+    @classmethod
+    def get_shared(cls, census_year=2020, read_only=False):
+        """Return the process-wide GeoMapper for a census year.
+
+        The first call creates the instance; later calls return the same object, so
+        crosswalks loaded by one caller are reused by every other caller in the process.
 
+        Parameters
+        ---------
+        census_year: int
+            Year of Census population data. 2019 estimates and 2020 full Census supported.
+        read_only: bool
+            If True, fully load and freeze the shared instance (see `freeze()`), e.g. in the
+            parent process right before creating a multiprocessing.Pool.
+        """
+        with cls._shared_lock:
+            if census_year not in cls._shared:
+                cls._shared[census_year] = cls(census_year=census_year)
+            gmpr = cls._shared[census_year]
+        if read_only:
+            gmpr.freeze()
+        return gmpr
+
+    def freeze(self):
+        """Load every crosswalk and geo set, then exclude them from garbage collection.
+
+        After this call the mapper never reads from disk or modifies its own state again.
+        Forked workers (e.g. from a multiprocessing.Pool) therefore share the parent's
+        pages for the loaded tables instead of each parsing and holding their own copy;
+        `gc.freeze()` keeps the collector from touching, and so copying, those pages.
+        """
+        for from_code, to_codes in self.CROSSWALK_FILENAMES.items():
+            for to_code in to_codes:
+                self._load_crosswalk(from_code, to_code)
         for geo_type in self._geos:
-            self._geo_sets[geo_type] = self._load_geo_values(geo_type)
+            self.get_geo_values(geo_type)
+            self.get_geo_vocabulary(geo_type)
+        for contained_geocode_type, container_geocode_type in self.CONTAINMENT_PAIRS:
+            self._get_containment_index(contained_geocode_type, container_geocode_type)
+        gc.freeze()
+        return self
+
+    def _load_crosswalk(self, from_code, to_code):
+        """Return the crosswalk for (from_code, to_code), loading it on first use."""
+        if to_code not in self._crosswalks[from_code]:
+            file_path = self.CROSSWALK_FILENAMES[from_code][to_code]
+            self._crosswalks[from_code][to_code] = self._load_crosswalk_from_file(
+                from_code, to_code, join(f"data/{self.census_year}", file_path)
+            )
+        return self._crosswalks[from_code][to_code]
+
+    def _get_cache_dir(self):
+        """Return the crosswalk cache directory, or None if the cache is disabled."""
+        if self.cache_dir != self.DEFAULT_CACHE_DIR:
+            return self.cache_dir
+        return os.environ.get(
+            self.CACHE_DIR_ENV_VAR,
+            join(os.path.expanduser("~"), ".cache", "delphi_utils", "geomap")
+        )
 
     def _load_crosswalk_from_file(self, from_code, to_code, data_path):
-        stream = pkg_resources.resource_stream(__name__, data_path)
+        cache_dir = self._get_cache_dir()
+        source_key = None
+        if cache_dir is not None:
+            try:
+                stat = os.stat(pkg_resources.resource_filename(__name__, data_path))
+                source_key = f"{stat.st_size}:{stat.st_mtime_ns}"
+            except OSError:
+                pass
+        if source_key is None:
+            return self._parse_crosswalk(
+                from_code, to_code, pkg_resources.resource_string(__name__, data_path))
+
+        cache_path = join(cache_dir, str(self.census_year), f"{from_code}_{to_code}.npz")
+        crosswalk = self._read_crosswalk_cache(cache_path, source_key)
+        if crosswalk is None:
+            crosswalk = self._parse_crosswalk(
+                from_code, to_code, pkg_resources.resource_string(__name__, data_path))
+            self._write_crosswalk_cache(cache_path, source_key, crosswalk)
+        return crosswalk
+
+    def _parse_crosswalk(self, from_code, to_code, source):
         dtype = {
             from_code: str,
             to_code: str,
@@ -148,11 +257,52 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
         }
 
         usecols = [from_code, "pop"] if to_code == "pop" else None
-        return pd.read_csv(stream, dtype=dtype, usecols=usecols)
+        return pd.read_csv(BytesIO(source), dtype=dtype, usecols=usecols)
+
+    @staticmethod
+    def _read_crosswalk_cache(cache_path, source_key):
+        """Read a compiled crosswalk, or return None if it is missing or stale.
+
+        source_key identifies the version of the source CSV, by its size and modification time.
+        """
+        try:
+            with np.load(cache_path, allow_pickle=False) as cache:
+                if str(cache["__source__"]) != source_key:
+                    return None
+                columns = list(cache["__columns__"])
+                data = {}
+                for i, col in enumerate(columns):
+                    values = cache[f"col_{i}"]
+                    data[col] = values.astype(object) if values.dtype.kind == "U" else values
+        except (OSError, KeyError, ValueError, BadZipFile):
+            return None
+        return pd.DataFrame(data, columns=columns)
+
+    @staticmethod
+    def _write_crosswalk_cache(cache_path, source_key, crosswalk):
+        """Compile a crosswalk to an .npz file; failures only disable the cache."""
+        arrays = {"__source__": np.array(source_key),
+                  "__columns__": np.array(crosswalk.columns, dtype=str)}
+        for i, col in enumerate(crosswalk.columns):
+            if is_string_dtype(crosswalk[col]):
+                if crosswalk[col].isna().any():
+                    return
+                arrays[f"col_{i}"] = crosswalk[col].to_numpy(dtype=str)
+            else:
+                arrays[f"col_{i}"] = crosswalk[col].to_numpy()
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(cache_path), suffix=".npz", delete=False
+            ) as tmp:
+                np.savez(tmp, **arrays)
+            os.replace(tmp.name, cache_path)
+        except OSError:
+            pass
 
     def _load_geo_values(self, geo_type):
         if geo_type == "nation":
-            return {"us"}
+            return frozenset({"us"})
 
         if geo_type.startswith("state"):
             to_code = from_code = "state"
@@ -163,8 +313,8 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
             from_code = "fips"
             to_code = geo_type
 
-        crosswalk = self._crosswalks[from_code][to_code]
-        return set(crosswalk[geo_type])
+        crosswalk = self._load_crosswalk(from_code, to_code)
+        return frozenset(crosswalk[geo_type])
 
     @staticmethod
     def convert_fips_to_mega(data, fips_col="fips", mega_col="megafips"):
@@ -183,6 +333,7 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
         fips_col="fips",
         date_col="timestamp",
         mega_col="megafips",
+        history=None,
     ):
         """Create megacounty column.
 
@@ -195,6 +346,11 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
         fips_col: str, fips (county) column to create
         date_col: str, date column (is not aggregated, groupby), if None then no dates
         mega_col: str, the megacounty column to create
+        history: pd.DataFrame, default None
+            Earlier rows of the same data, used for the rolling windows of the first days
+            in data. Only the rows dated within thr_win_len days before the first date in
+            data are read, so the full history or just its tail can be passed. This allows
+            megacounties to be computed for newly appended days only.
 
         Return
         ---------
@@ -205,16 +361,49 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
         if "_thr_col_roll" in data.columns:
             raise ValueError("Column name '_thr_col_roll' is reserved.")
 
+        mega = GeoMapper._megacounty_codes(
+            data, thr_count, thr_win_len, thr_col, fips_col, date_col, history
+        )
+        if mega is None:
+            return GeoMapper._megacounty_creation_groupby(
+                data, thr_count, thr_win_len, thr_col, fips_col, date_col, mega_col, history
+            )
+        fips = data[fips_col].to_numpy()
+        order = np.argsort(pd.factorize(data[fips_col], sort=True)[0], kind="stable")
+        order = order[pd.notna(fips[order]) & pd.notna(mega[order])]
+        index = pd.MultiIndex.from_arrays(
+            [data[fips_col].take(order), data[date_col].take(order)],
+            names=[fips_col, date_col]
+        )
+        return pd.Series(mega[order], index=index, name=mega_col)
+
+    @staticmethod
+    def _megacounty_creation_groupby(
+        data, thr_count, thr_win_len, thr_col, fips_col, date_col, mega_col, history
+    ):
+        """Compute `megacounty_creation()` with a rolling sum per fips group.
+
+        Used when the data cannot be laid out as a dense (fips x day) array.
+        """
+        cols = [fips_col, date_col, thr_col]
+        n_history = 0
+        if history is not None:
+            history = GeoMapper._megacounty_history_window(history[cols], data, thr_win_len,
+                                                           date_col)
+            n_history = len(history)
+            data = pd.concat([history, data[cols]], ignore_index=True)
+
         def agg_sum_iter(data):
             data_gby = (
-                data[[fips_col, date_col, thr_col]]
+                data[cols]
+                .assign(_new_row=np.arange(len(data)) >= n_history)
                 .set_index(date_col)
                 .groupby(fips_col)
             )
             for _, subdf in data_gby:
                 subdf_roll = subdf[thr_col].rolling(f"{thr_win_len}D").sum()
                 subdf["_thr_col_roll"] = subdf_roll
-                yield subdf
+                yield subdf[subdf["_new_row"]].drop(columns="_new_row")
 
         data_roll = pd.concat(agg_sum_iter(data))
         data_roll.reset_index(inplace=True)
@@ -226,6 +415,75 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
         ]
         return data_roll.set_index([fips_col, date_col])[mega_col]
 
+    @staticmethod
+    def _megacounty_history_window(history, data, thr_win_len, date_col):
+        """Return the rows of history that fall in the rolling window of data's first day."""
+        first_date = data[date_col].min()
+        in_window = (history[date_col] < first_date) & \
+            (history[date_col] > first_date - pd.Timedelta(days=thr_win_len))
+        return history[in_window]
+
+    @staticmethod
+    def _megacounty_codes(  # pylint: disable=too-many-locals
+        data, thr_count, thr_win_len, thr_col, fips_col, date_col, history=None
+    ):
+        """Return the megacounty code of every row of data, in row order.
+
+        The rolling window sums of thr_col are computed for every fips at once, as
+        differences of cumulative sums over a dense (fips x day) array. Returns None if the
+        data does not fit that layout (dates that are not whole days, repeated
+        (fips, date) pairs or a very sparse date range), in which case the caller falls
+        back to a groupby.
+        """
+        cols = [fips_col, date_col, thr_col]
+        n_new = len(data)
+        if history is not None:
+            history = GeoMapper._megacounty_history_window(history[cols], data, thr_win_len,
+                                                           date_col)
+            data = pd.concat([history, data[cols]], ignore_index=True)
+        if not pd.api.types.is_datetime64_any_dtype(data[date_col]) or len(data) == 0:
+            return None
+
+        dates = data[date_col].to_numpy(dtype="datetime64[ns]")
+        days = dates.astype("datetime64[D]")
+        if (days != dates).any():
+            return None
+        fips_rows, fips_index = pd.factorize(data[fips_col], sort=True)
+        valid_rows = (fips_rows >= 0) & ~np.isnat(days)
+        if not valid_rows.any():
+            return np.full(n_new, np.nan, dtype=object)
+        day_rows = np.zeros(len(data), dtype=np.int64)
+        day_rows[valid_rows] = (days[valid_rows] - days[valid_rows].min()).astype(np.int64)
+        n_days = day_rows.max() + 1
+        if len(fips_index) * (n_days + 1) > GeoMapper.MAX_DENSE_MEGACOUNTY_CELLS:
+            return None
+        cells = fips_rows[valid_rows] * (n_days + 1) + day_rows[valid_rows] + 1
+        if len(np.unique(cells)) < len(cells):
+            return None
+
+        values = data[thr_col].to_numpy(dtype=float)[valid_rows]
+        observed = ~np.isnan(values)
+        sums = np.zeros(len(fips_index) * (n_days + 1))
+        counts = np.zeros(len(fips_index) * (n_days + 1), dtype=np.int64)
+        sums[cells] = np.where(observed, values, 0)
+        counts[cells] = observed
+        sums = sums.reshape(len(fips_index), n_days + 1).cumsum(axis=1)
+        counts = counts.reshape(len(fips_index), n_days + 1).cumsum(axis=1)
+
+        # The window "{thr_win_len}D" ending on day t covers days t - thr_win_len + 1 .. t
+        rows, ends = fips_rows[valid_rows], day_rows[valid_rows] + 1
+        starts = np.maximum(ends - thr_win_len, 0)
+        roll = sums[rows, ends] - sums[rows, starts]
+        n_observed = counts[rows, ends] - counts[rows, starts]
+        above = (n_observed > 0) & (roll > thr_count)
+
+        megafips = pd.Series(fips_index).astype(str).str.zfill(5).str.slice_replace(
+            start=2, stop=5, repl="000"
+        ).to_numpy()
+        mega = np.full(len(data), np.nan, dtype=object)
+        mega[valid_rows] = np.where(above, data[fips_col].to_numpy()[valid_rows], megafips[rows])
+        return mega[len(data) - n_new:]
+
     # Conversion functions
     def add_geocode(
         self, df, from_code, new_code, from_col=None, new_col=None, dropna=True
@@ -284,17 +542,17 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
 
         # state codes are all stored in one table
         if from_code in state_codes and new_code in state_codes:
-            crosswalk = self._crosswalks["state"]["state"]
+            crosswalk = self._load_crosswalk("state", "state")
             crosswalk = crosswalk.rename(
                 columns={from_code: from_col, new_code: new_col}
             )
         elif new_code in state_codes:
-            crosswalk = self._crosswalks[from_code]["state"]
+            crosswalk = self._load_crosswalk(from_code, "state")
             crosswalk = crosswalk.rename(
                 columns={from_code: from_col, new_code: new_col}
             )
         else:
-            crosswalk = self._crosswalks[from_code][new_code]
+            crosswalk = self._load_crosswalk(from_code, new_code)
             crosswalk = crosswalk.rename(
                 columns={from_code: from_col, new_code: new_col}
             )
@@ -342,6 +600,8 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
         date_col="timestamp",
         data_cols=None,
         dropna=True,
+        engine="pandas",
+        categorical=False,
     ):
         """Replace a geocode column in a dataframe.
 
@@ -376,6 +636,15 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
             and if False, the join is left. The inner join will drop records from the input database
             that have no translation in the crosswalk, while the outer join will keep those records
             as NA.
+        engine: {'pandas', 'sparse'}, default 'pandas'
+            How the aggregation is computed. 'pandas' merges the crosswalk into the data and
+            groups the result. 'sparse' multiplies a (date x from_code) panel of each numeric
+            column by a cached sparse crosswalk matrix, which avoids materializing the merged
+            frame for weighted many-to-many mappings. Both give the same result up to
+            floating point summation order.
+        categorical: bool, default False
+            If True, return new_col as a pd.Categorical over the GeoMapper's vocabulary for
+            new_code (see `encode_geo()`), so later merges and groupbys run on integer codes.
 
         Return
         ---------
@@ -384,6 +653,12 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
         """
         from_col = from_code if from_col is None else from_col
         new_col = new_code if new_col is None else new_col
+        if engine == "sparse":
+            return self._replace_geocode_sparse(
+                df, from_code, new_code, from_col, new_col, date_col, data_cols, categorical
+            )
+        if engine != "pandas":
+            raise ValueError(f"Unknown engine '{engine}'; use 'pandas' or 'sparse'")
 
         df = self.add_geocode(
             df, from_code, new_code, from_col=from_col, new_col=new_col, dropna=dropna
@@ -401,8 +676,254 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
             df = df.groupby([date_col, new_col]).sum(numeric_only=True).reset_index()
         else:
             df = df.groupby([new_col]).sum(numeric_only=True).reset_index()
+        if categorical:
+            df[new_col] = self.encode_geo(df[new_col], new_code, as_categorical=True)
         return df
 
+    def fan_out(
+        self,
+        df,
+        from_code,
+        to_codes,
+        from_col=None,
+        new_col=None,
+        date_col="timestamp",
+        data_cols=None,
+        via_state=False,
+        categorical=False,
+    ):
+        """Aggregate a dataframe to several geocodes in one pass.
+
+        Gives the same result as calling `replace_geocode(df, from_code, to_code, ...,
+        engine="sparse")` for every to_code in to_codes, but the source geo ids and dates
+        are factorized, and the numeric columns summed into (date x geo) panels, only once.
+        Each requested resolution is then one sparse product of those panels.
+
+        Parameters
+        ---------
+        df: pd.DataFrame
+            Input dataframe.
+        from_code: {'fips', 'zip', 'chng-fips', 'state_code', 'state_id', 'state_name'}
+            Specifies the geocode type of the data in from_col.
+        to_codes: list of str
+            The geocodes to aggregate to, e.g. ["state_id", "msa", "hrr", "hhs", "nation"].
+        from_col: str, default None
+            Name of the column in dataframe containing from_code. If None, then the name
+            is assumed to be from_code.
+        new_col: str, default None
+            Name of the geocode column in every output. If None, each output uses its
+            to_code as the name.
+        date_col: str or None, default "timestamp"
+            Specify which column contains the date values. Used for value aggregation.
+            If None, then the aggregation is done only on geo_id.
+        data_cols: list, default None
+            A list of data column names to aggregate when doing a weighted coding. If set to
+            None, then all the numeric columns are used.
+        via_state: bool, default False
+            If True, build "hhs" and "nation" from the state-level sums (from_code ->
+            state_code -> hhs/nation) instead of from from_code directly. Geo ids that do
+            not map to a state are then left out of the hhs and nation totals.
+        categorical: bool, default False
+            If True, return each geocode column as a pd.Categorical over the GeoMapper's
+            vocabulary for that geocode (see `encode_geo()`).
+
+        Return
+        ---------
+        dict
+            A dataframe for each entry of to_codes, keyed by that entry.
+        """
+        from_col = from_code if from_col is None else from_col
+        panels = self._geo_panels(df, from_code, from_col, date_col)
+        state_panels = None
+        out = {}
+        for to_code in to_codes:
+            col = to_code if new_col is None else new_col
+            assert from_col != col, \
+                f"Can't use the same column '{from_col}' for both from_col and to_col"
+            if via_state and to_code in ("hhs", "nation") and from_code != "state_code":
+                if state_panels is None:
+                    state_panels = self._reduce_panels(
+                        panels,
+                        *self._data_crosswalk(from_code, "state_code", panels.geo_index),
+                        data_cols
+                    )
+                source_code, source_panels = "state_code", state_panels
+            else:
+                source_code, source_panels = from_code, panels
+            reduced = self._reduce_panels(
+                source_panels,
+                *self._data_crosswalk(source_code, to_code, source_panels.geo_index),
+                data_cols
+            )
+            out[to_code] = self._panels_to_frame(
+                reduced, col, date_col,
+                self.get_geo_vocabulary(to_code) if categorical else None
+            )
+        return out
+
+    def _get_sparse_crosswalk(self, from_code, new_code):
+        """Return the crosswalk from_code -> new_code as cached sparse matrices.
+
+        Returns a tuple (from_index, to_index, weights, pattern), where from_index and
+        to_index are sorted pd.Index objects of geo ids, weights is a CSR matrix of shape
+        (len(from_index), len(to_index)) holding the summed crosswalk weights (1 for
+        unweighted crosswalks) and pattern counts the crosswalk rows for each pair.
+        """
+        key = (from_code, new_code)
+        if key not in self._sparse_crosswalks:
+            state_codes = ["state_code", "state_id", "state_name"]
+            if from_code in state_codes and new_code in state_codes:
+                crosswalk = self._load_crosswalk("state", "state")
+            elif new_code in state_codes:
+                crosswalk = self._load_crosswalk(from_code, "state")
+            else:
+                crosswalk = self._load_crosswalk(from_code, new_code)
+
+            from_codes, from_index = pd.factorize(crosswalk[from_code], sort=True)
+            to_codes, to_index = pd.factorize(crosswalk[new_code], sort=True)
+            shape = (len(from_index), len(to_index))
+            ones = np.ones(len(crosswalk))
+            pattern = sparse.csr_matrix((ones, (from_codes, to_codes)), shape=shape)
+            if "weight" in crosswalk.columns:
+                weights = sparse.csr_matrix(
+                    (crosswalk["weight"].to_numpy(dtype=float), (from_codes, to_codes)),
+                    shape=shape
+                )
+            else:
+                weights = pattern
+            self._sparse_crosswalks[key] = (
+                pd.Index(from_index), pd.Index(to_index), weights, pattern
+            )
+        return self._sparse_crosswalks[key]
+
+    def _data_crosswalk(self, from_code, new_code, geo_index):
+        """Return the sparse crosswalk from_code -> new_code with rows aligned to geo_index.
+
+        Returns a tuple (to_index, weights, pattern) as in `_get_sparse_crosswalk()`, except
+        that row i of both matrices belongs to geo_index[i]. Geo ids missing from the
+        crosswalk get an empty row.
+        """
+        if new_code == "nation":
+            valid_from_codes = ["fips", "zip", "state_code", "state_name", "state_id"]
+            if from_code not in valid_from_codes:
+                raise ValueError(
+                    f"Conversion to the nation level is not supported "
+                    f"from {from_code}; try {valid_from_codes}"
+                )
+            pattern = sparse.csr_matrix(np.ones((len(geo_index), 1)))
+            return pd.Index(["us"]), pattern, pattern
+
+        from_index, to_index, weights, pattern = self._get_sparse_crosswalk(from_code, new_code)
+        rows = from_index.get_indexer(geo_index)
+        found = np.flatnonzero(rows >= 0)
+        select = sparse.csr_matrix(
+            (np.ones(len(found)), (found, rows[found])), shape=(len(geo_index), len(from_index))
+        )
+        if weights is pattern:
+            pattern = select @ pattern
+            return to_index, pattern, pattern
+        return to_index, select @ weights, select @ pattern
+
+    @staticmethod
+    def _geo_panels(df, from_code, from_col, date_col):
+        """Sum every numeric column of df into a sparse (date x geo) panel.
+
+        The geo axis is the vocabulary of geo ids found in df[from_col], after the same
+        zero-padding that `add_geocode()` applies. Returns a _GeoPanels tuple.
+        """
+        geo_ids = df[from_col]
+        if not is_string_dtype(geo_ids):
+            if from_code in ["fips", "zip", "chng-fips"]:
+                geo_ids = geo_ids.astype(str).str.zfill(5)
+            else:
+                geo_ids = geo_ids.astype(str)
+        geo_rows, geo_index = pd.factorize(geo_ids.fillna(""))
+
+        if date_col is None:
+            date_rows, date_index = np.zeros(len(df), dtype=int), None
+        else:
+            date_rows, date_index = pd.factorize(df[date_col], sort=True)
+        keep = date_rows >= 0
+        geo_rows, date_rows = geo_rows[keep], date_rows[keep]
+        n_dates = 1 if date_index is None else len(date_index)
+        shape = (n_dates, len(geo_index))
+
+        values, dtypes = {}, {}
+        for col in df.columns:
+            if col in (from_col, date_col) or not is_numeric_dtype(df[col]):
+                continue
+            col_values = df[col].to_numpy(dtype=float)[keep]
+            col_values = np.where(np.isnan(col_values), 0, col_values)
+            values[col] = sparse.csr_matrix((col_values, (date_rows, geo_rows)), shape=shape)
+            dtypes[col] = np.dtype(np.int64) if is_bool_dtype(df[col]) else df[col].dtype
+        presence = sparse.csr_matrix((np.ones(len(geo_rows)), (date_rows, geo_rows)), shape=shape)
+        return _GeoPanels(date_index, pd.Index(geo_index), presence, values, dtypes)
+
+    @staticmethod
+    def _reduce_panels(panels, to_index, weights, pattern, data_cols=None):
+        """Aggregate the geo axis of panels through a sparse crosswalk.
+
+        Columns in data_cols (all columns if None) are multiplied by the crosswalk weights,
+        the others are summed over every crosswalk row, as in `replace_geocode()`.
+        """
+        if data_cols is None:
+            data_cols = list(panels.values)
+        values, dtypes = {}, dict(panels.dtypes)
+        for col, panel in panels.values.items():
+            if col in data_cols and weights is not pattern:
+                values[col] = panel @ weights
+                dtypes[col] = np.dtype(float)
+            else:
+                values[col] = panel @ pattern
+        return _GeoPanels(panels.date_index, to_index, panels.presence @ pattern, values, dtypes)
+
+    @staticmethod
+    def _panels_to_frame(panels, new_col, date_col, categories=None):
+        """Convert panels to the long format returned by `replace_geocode()`.
+
+        If categories is given, new_col is returned as a pd.Categorical with those
+        categories instead of as strings.
+        """
+        # Which (date, geo) groups exist does not depend on the values
+        support = panels.presence.tocoo()
+        n_geos = len(panels.geo_index)
+        out_keys = np.sort(support.row.astype(np.int64) * n_geos + support.col)
+        out_dates, out_geos = np.divmod(out_keys, n_geos)
+
+        out = {}
+        if date_col is not None:
+            out[date_col] = panels.date_index.take(out_dates)
+        if categories is None:
+            out[new_col] = panels.geo_index.take(out_geos).to_numpy(dtype=object)
+        else:
+            codes = categories.get_indexer(panels.geo_index).astype(np.int32)
+            out[new_col] = pd.Categorical.from_codes(codes[out_geos], categories=categories)
+        for col, panel in panels.values.items():
+            product = panel.tocoo()
+            product_keys = product.row.astype(np.int64) * n_geos + product.col
+            result = np.zeros(len(out_keys))
+            result[np.searchsorted(out_keys, product_keys)] = product.data
+            out[col] = result.astype(panels.dtypes[col])
+        return pd.DataFrame(out)
+
+    def _replace_geocode_sparse(  # pylint: disable=too-many-arguments
+        self, df, from_code, new_code, from_col, new_col, date_col, data_cols, categorical
+    ):
+        """Compute `replace_geocode()` with sparse matrix products.
+
+        See `replace_geocode()` documentation for argument description.
+        """
+        assert from_col != new_col, \
+            f"Can't use the same column '{from_col}' for both from_col and to_col"
+        panels = self._geo_panels(df, from_code, from_col, date_col)
+        panels = self._reduce_panels(
+            panels, *self._data_crosswalk(from_code, new_code, panels.geo_index), data_cols
+        )
+        return self._panels_to_frame(
+            panels, new_col, date_col,
+            self.get_geo_vocabulary(new_code) if categorical else None
+        )
+
     def add_population_column(self, data, geocode_type, geocode_col=None, dropna=True):
         """
         Append a population column to a dataframe, based on the FIPS or ZIP code.
@@ -433,7 +954,7 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
             raise ValueError(
                 f"Only {supported_geos} geocodes supported. For other codes, aggregate those."
             )
-        pop_df = self._crosswalks[geocode_type]["pop"]
+        pop_df = self._load_crosswalk(geocode_type, "pop")
         if not is_string_dtype(data[geocode_col]):
             if geocode_type in ["zip", "fips"]:
                 data[geocode_col] = data[geocode_col].astype(str).str.zfill(5)
@@ -459,6 +980,7 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
         date_col="timestamp",
         mega_col="megafips",
         count_cols=None,
+        history=None,
     ):
         """Convert and aggregate from FIPS or chng-fips to megaFIPS.
 
@@ -473,6 +995,8 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
             mega_col: str, the megacounty column to create
             count_cols: list, the count data columns to aggregate, if None (default) all non
                         data/geo are used
+            history: pd.DataFrame, earlier rows of data used for the rolling windows of its
+                     first days, see `megacounty_creation()`. Only data is aggregated.
 
         Return
         ---------
@@ -486,6 +1010,18 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
 
         if not is_string_dtype(data[fips_col]):
             data[fips_col] = data[fips_col].astype(str).str.zfill(5)
+        if history is not None and not is_string_dtype(history[fips_col]):
+            history = history.assign(**{fips_col: history[fips_col].astype(str).str.zfill(5)})
+
+        if "_thr_col_roll" in data.columns:
+            raise ValueError("Column name '_thr_col_roll' is reserved.")
+        mega = GeoMapper._megacounty_codes(
+            data, thr_count, thr_win_len, thr_col, fips_col, date_col, history
+        )
+        if mega is not None:
+            data[mega_col] = mega
+            data = data.groupby([date_col, mega_col]).sum(numeric_only=True)
+            return data.reset_index()
 
         mega_data = GeoMapper.megacounty_creation(
             data,
@@ -495,6 +1031,7 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
             fips_col=fips_col,
             date_col=date_col,
             mega_col=mega_col,
+            history=history,
         )
         data.set_index([fips_col, date_col], inplace=True)
         data = data.join(mega_data)
@@ -525,10 +1062,11 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
 
         Returns
         -------
-        A dataframe containing columbs with the two specified geo types.
+        A dataframe containing columbs with the two specified geo types. The dataframe is a
+        copy, so callers may modify it without affecting the loaded crosswalk.
         """
         try:
-            return self._crosswalks[from_code][to_code]
+            return self._load_crosswalk(from_code, to_code).copy()
         except KeyError as e:
             raise ValueError(f'Mapping from "{from_code}" to "{to_code}" not found.') from e
 
@@ -544,12 +1082,109 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
 
         Returns
         -------
-        Set of geo values, all in string format.
+        Frozen set of geo values, all in string format.
         """
-        try:
-            return self._geo_sets[geo_type]
-        except KeyError as e:
-            raise ValueError(f'Given geo type "{geo_type}" not found') from e
+        if geo_type not in self._geos:
+            raise ValueError(f'Given geo type "{geo_type}" not found')
+        if geo_type not in self._geo_sets:
+            self._geo_sets[geo_type] = self._load_geo_values(geo_type)
+        return self._geo_sets[geo_type]
+
+    def get_geo_vocabulary(self, geo_type):
+        """
+        Return the sorted index of every known value of a geography type.
+
+        The position of a value in this index is its integer code in `encode_geo()`. Besides
+        the values from `get_geo_values()`, it holds every value of geo_type that appears in
+        a crosswalk table from or to geo_type, so any crosswalk output can be encoded. Only
+        those crosswalk tables are loaded.
+
+        Parameters
+        ----------
+        geo_type: str
+          One of "zip", "fips", "hrr", "state_id", "state_code", "state_name", "hhs", "msa",
+          "chng-fips" and "nation"
+
+        Returns
+        -------
+        pd.Index of geo values, all in string format.
+        """
+        if geo_type not in self._geo_vocabularies:
+            values = set(self.get_geo_values(geo_type))
+            # The state crosswalks hold every state geo type
+            table_code = "state" if geo_type.startswith("state") else geo_type
+            for from_code, to_codes in self.CROSSWALK_FILENAMES.items():
+                for to_code in to_codes:
+                    if table_code not in (from_code, to_code) and \
+                            geo_type not in (from_code, to_code):
+                        continue
+                    crosswalk = self._load_crosswalk(from_code, to_code)
+                    if geo_type in crosswalk.columns:
+                        values.update(crosswalk[geo_type].dropna())
+            self._geo_vocabularies[geo_type] = pd.Index(sorted(values), dtype=object)
+        return self._geo_vocabularies[geo_type]
+
+    def encode_geo(self, values, geo_type, as_categorical=False):
+        """
+        Encode geo values as compact integer codes.
+
+        Numeric fips, zip, chng-fips and state_code values are zero-padded first, as in
+        `add_geocode()`. Use `decode_geo()` to get the strings back, e.g. right before export.
+
+        Parameters
+        ----------
+        values: array-like
+          Geo values of type geo_type.
+        geo_type: str
+          Any geography type supported by `get_geo_vocabulary()`.
+        as_categorical: bool, default False
+          If True, return a pd.Categorical whose categories are the vocabulary, so that
+          pandas merges, groupbys and reindexes use the codes. Otherwise return the codes.
+
+        Returns
+        -------
+        np.ndarray of int32 codes, -1 for missing values, or pd.Categorical.
+
+        Raises
+        ------
+        ValueError if any value is not in the vocabulary of geo_type.
+        """
+        vocabulary = self.get_geo_vocabulary(geo_type)
+        values = pd.Series(values)
+        if not is_string_dtype(values):
+            widths = {"fips": 5, "zip": 5, "chng-fips": 5, "state_code": 2}
+            values = values.astype(str)
+            if geo_type in widths:
+                values = values.str.zfill(widths[geo_type])
+        codes = vocabulary.get_indexer(values).astype(np.int32)
+        unknown = (codes < 0) & values.notna().to_numpy()
+        if unknown.any():
+            raise ValueError(f"Unknown {geo_type} values: "
+                             f"{sorted(set(values[unknown]))[:10]}")
+        if as_categorical:
+            return pd.Categorical.from_codes(codes, categories=vocabulary)
+        return codes
+
+    def decode_geo(self, codes, geo_type):
+        """
+        Decode the output of `encode_geo()` back to zero-padded geo strings.
+
+        Parameters
+        ----------
+        codes: np.ndarray, pd.Series or pd.Categorical
+          Integer codes or a categorical of geo values of type geo_type.
+        geo_type: str
+          Any geography type supported by `get_geo_vocabulary()`.
+
+        Returns
+        -------
+        np.ndarray of geo strings, with NaN for missing values.
+        """
+        if isinstance(getattr(codes, "dtype", None), pd.CategoricalDtype):
+            return np.asarray(codes, dtype=object)
+        codes = np.asarray(codes)
+        values = self.get_geo_vocabulary(geo_type).to_numpy()[np.maximum(codes, 0)]
+        return np.where(codes >= 0, values, np.nan)
 
     def get_geos_within(self, container_geocode, contained_geocode_type, container_geocode_type):
         """
@@ -577,24 +1212,72 @@ class GeoMapper:  # pylint: disable=too-many-public-methods
         Returns
         -------
         Set of geo code strings of the given type that lie within the given container geocode.
+        Lookups use an index of the crosswalks that is built once per combination.
         """
-        if contained_geocode_type == "state":
-            if container_geocode_type == "nation" and container_geocode == "us":
-                crosswalk = self._crosswalks["state"]["state"]
-                return set(crosswalk["state_id"])   # pylint: disable=unsubscriptable-object
-            if container_geocode_type == "hhs":
-                crosswalk_hhs = self._crosswalks["fips"]["hhs"]
-                crosswalk_state = self._crosswalks["fips"]["state"]
-                fips_hhs = crosswalk_hhs[crosswalk_hhs["hhs"] == container_geocode]["fips"]
-                return set(crosswalk_state[crosswalk_state["fips"].isin(fips_hhs)]["state_id"])
-        elif (contained_geocode_type in ("county", "fips", "chng-fips") and
-                container_geocode_type == "state"):
-            contained_geocode_type = self.as_mapper_name(contained_geocode_type)
-            crosswalk = self._crosswalks[contained_geocode_type]["state"]
-            return set(
-                crosswalk[crosswalk["state_id"] == container_geocode][contained_geocode_type]
-            )
-        raise ValueError("(contained_geocode_type, container_geocode_type) was "
+        if (contained_geocode_type, container_geocode_type) == ("state", "nation") and \
+                container_geocode != "us":
+            raise self._unsupported_containment(contained_geocode_type, container_geocode_type)
+        index = self._get_containment_index(contained_geocode_type, container_geocode_type)
+        return index.get(container_geocode, frozenset())
+
+    def get_geos_within_many(self, container_geocodes, contained_geocode_type,
+                             container_geocode_type):
+        """
+        Return the contained regions of each of several container geocodes.
+
+        Bulk version of `get_geos_within()`, supporting the same combinations of geo types.
+
+        Parameters
+        ----------
+        container_geocodes: iterable of str
+            Instances of nation/state/hhs to find the sub-regions of
+        contained_geocode_type: str
+            The subregion type to retrieve. One of "state", "county", "fips", "chng-fips"
+        container_geocode_type: str
+            The parent region type. One of "state", "nation", "hhs"
+
+        Returns
+        -------
+        Dict from each container geocode to the set of geo code strings within it.
+        """
+        index = self._get_containment_index(contained_geocode_type, container_geocode_type)
+        return {geo: index.get(geo, frozenset()) for geo in container_geocodes}
+
+    def _get_containment_index(self, contained_geocode_type, container_geocode_type):
+        """Return a dict from every container geocode to the frozenset of geos within it.
+
+        Built from the crosswalks on first use of a (contained, container) pair.
+        """
+        contained_geocode_type = self.as_mapper_name(contained_geocode_type, state="state")
+        key = (contained_geocode_type, container_geocode_type)
+        if key not in self._containment:
+            if key == ("state", "nation"):
+                crosswalk = self._load_crosswalk("state", "state")
+                index = {"us": frozenset(crosswalk["state_id"])}
+            elif key == ("state", "hhs"):
+                crosswalk = self._load_crosswalk("fips", "hhs").merge(
+                    self._load_crosswalk("fips", "state"), on="fips"
+                )
+                index = self._group_sets(crosswalk, "hhs", "state_id")
+            elif key in (("fips", "state"), ("chng-fips", "state")):
+                crosswalk = self._load_crosswalk(contained_geocode_type, "state")
+                index = self._group_sets(crosswalk, "state_id", contained_geocode_type)
+            else:
+                raise self._unsupported_containment(*key)
+            self._containment[key] = index
+        return self._containment[key]
+
+    @staticmethod
+    def _group_sets(crosswalk, container_col, contained_col):
+        """Return a dict from each value of container_col to its frozenset of contained_col."""
+        return {
+            container: frozenset(contained)
+            for container, contained in crosswalk.groupby(container_col)[contained_col]
+        }
+
+    @staticmethod
+    def _unsupported_containment(contained_geocode_type, container_geocode_type):
+        return ValueError("(contained_geocode_type, container_geocode_type) was "
                          f"({contained_geocode_type}, {container_geocode_type}), but "
                          "must be one of (state, nation), (state, hhs), (county, state)"
                          ", (fips, state), (chng-fips, state)")
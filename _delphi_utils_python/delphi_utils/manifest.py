@@ -0,0 +1,151 @@
+"""Content-hash manifests of export CSVs.
+
+A manifest records the SHA-256 hash of each CSV file in a directory, so that unchanged files
+can be recognized without reading them. Exporters record the files they write in export_dir,
+and archivers record the files they archive in cache_dir.
+
+Each entry also stores the size and modification time of the file when it was hashed, and is
+only trusted while the file on disk still matches them. Files that are rewritten, replaced or
+removed by anything else are therefore never compared using a stale hash.
+"""
+import hashlib
+import json
+import os
+from os.path import join
+import tempfile
+from typing import Dict, Optional
+
+MANIFEST_FILE = ".manifest.json"
+
+
+def hash_bytes(content: bytes) -> str:
+    """Return the hex SHA-256 digest of `content`."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_file(path: str, algorithm: str = "sha256") -> str:
+    """Return the hex digest of the contents of the file at `path`."""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Map from file names within a directory to the content hashes of those files."""
+
+    def __init__(self, directory: str):
+        """
+        Load the manifest of `directory`, if there is one.
+
+        Parameters
+        ----------
+        directory: str
+            Directory holding the files, and the manifest itself.
+        """
+        self.directory = directory
+        self.path = join(directory, MANIFEST_FILE)
+        self.entries = self._read(self.path)
+        self._updated = {}
+
+    @staticmethod
+    def _read(path: str) -> Dict[str, dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _stat(self, filename: str):
+        try:
+            stat = os.stat(join(self.directory, filename))
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def entry(self, filename: str) -> Optional[dict]:
+        """
+        Return the recorded entry of `filename`, or None if it is missing or out of date.
+
+        Parameters
+        ----------
+        filename: str
+            Name of the file, relative to the manifest directory.
+
+        Returns
+        ---------
+        Dictionary with the "sha256", "size" and "mtime_ns" of the file, and any other metadata
+        recorded with it, if the file is unchanged since it was recorded.
+        """
+        entry = self.entries.get(filename)
+        if not isinstance(entry, dict):
+            return None
+        stat = self._stat(filename)
+        if stat is None or [entry.get("size"), entry.get("mtime_ns")] != list(stat):
+            return None
+        return entry
+
+    def get(self, filename: str) -> Optional[str]:
+        """
+        Return the recorded hash of `filename`, or None if it is missing or out of date.
+
+        Parameters
+        ----------
+        filename: str
+            Name of the file, relative to the manifest directory.
+
+        Returns
+        ---------
+        The hex SHA-256 digest of the file, if the file is unchanged since it was recorded.
+        """
+        entry = self.entry(filename)
+        return None if entry is None else entry.get("sha256")
+
+    def record(self, filename: str, digest: Optional[str] = None, **metadata):
+        """
+        Record the hash of `filename` as it is currently on disk.
+
+        Parameters
+        ----------
+        filename: str
+            Name of the file, relative to the manifest directory.
+        digest: Optional[str]
+            The hex SHA-256 digest of the file contents, if already known. Otherwise the file
+            is read and hashed.
+        metadata:
+            Other JSON-serializable values to store in the entry, such as the S3 ETag of the
+            file.
+        """
+        stat = self._stat(filename)
+        if stat is None:
+            return
+        if digest is None:
+            digest = hash_file(join(self.directory, filename))
+        entry = {**metadata, "sha256": digest, "size": stat[0], "mtime_ns": stat[1]}
+        self.entries[filename] = entry
+        self._updated[filename] = entry
+
+    def save(self):
+        """
+        Write the recorded entries to the manifest file.
+
+        The manifest on disk is re-read first, so entries recorded concurrently by other
+        writers of other files are kept. The file is replaced atomically.
+        """
+        if not self._updated:
+            return
+        entries = self._read(self.path)
+        entries.update(self._updated)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.entries = entries
+        self._updated = {}
@@ -0,0 +1,232 @@
+"""Timing and memory profiling of pipeline stages.
+
+A Profiler records named spans of work. Each span measures its wall time, the CPU time of the
+process, the peak resident set size of the process so far and, if memory tracing is enabled,
+the peak memory allocated through tracemalloc while the span ran. Spans nest, and each finished
+span is logged to the structured logger of the profiler.
+
+The runner installs a profiler for the whole pipeline run, so indicators can profile their
+inner phases with `profile`, either as a context manager:
+
+    with profile("load"):
+        data = load_data(...)
+
+or as a decorator:
+
+    @profile("fit")
+    def fit(...):
+        ...
+
+Spans are recorded in the installed profiler when they are entered, so decorated functions can
+be defined at import time, before the runner installs it. Each thread has its own stack of open
+spans, so spans in worker threads do not nest in each other, but the traced memory is that of the
+whole process.
+"""
+from contextlib import ContextDecorator
+import json
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from typing import List, Optional
+
+
+class Profiler:
+    """Recorder of the timing and memory use of nested spans of work."""
+
+    def __init__(self, logger=None, trace_memory: bool = False):
+        """
+        Create a profiler without any recorded spans.
+
+        Parameters
+        ----------
+        logger: Optional[structlog.stdlib.BoundLogger]
+            Structured logger to log each finished span to. Spans are only recorded if None.
+        trace_memory: bool
+            Whether to trace Python memory allocations with tracemalloc while spans are open,
+            to report the peak allocated memory of each span. Tracing slows down allocations.
+            Before Python 3.9, tracemalloc cannot reset its peak, so the peak of a span is the
+            peak since tracing started, which includes that of any earlier spans.
+        """
+        self.logger = logger
+        self.trace_memory = trace_memory
+        self.records: List[dict] = []
+        self._started_tracing = False
+        self._open_spans = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def _stack(self) -> List[dict]:
+        """Return the open spans of the current thread, innermost last."""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def span(self, name: str, **fields) -> "Span":
+        """
+        Return a context manager and decorator profiling a span of this profiler.
+
+        Parameters
+        ----------
+        name: str
+            Name of the span.
+        fields:
+            Other JSON-serializable values to log and record with the span.
+        """
+        return Span(name, profiler=self, **fields)
+
+    def _enter(self, name: str, fields: dict) -> dict:
+        stack = self._stack
+        with self._lock:
+            self._open_spans += 1
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+        # tracemalloc.reset_peak() is new in Python 3.9
+        if self.trace_memory and hasattr(tracemalloc, "reset_peak"):
+            if stack:
+                # Keep the peak of the enclosing span before resetting it for this one
+                stack[-1]["traced_peak"] = max(stack[-1]["traced_peak"],
+                                               tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        span = {
+            "name": name,
+            "fields": fields,
+            "start_time": time.time(),
+            "start_wall": time.perf_counter(),
+            "start_cpu": time.process_time(),
+            "traced_peak": 0,
+        }
+        stack.append(span)
+        return span
+
+    def _exit(self, span: dict):
+        stack = self._stack
+        depth = next(i for i, s in enumerate(stack) if s is span)
+        del stack[depth]
+        record = {
+            "name": span["name"],
+            "parent": "/".join(s["name"] for s in stack[:depth]) or None,
+            "start_time": span["start_time"],
+            "elapsed_time_in_seconds": round(time.perf_counter() - span["start_wall"], 3),
+            "cpu_time_in_seconds": round(time.process_time() - span["start_cpu"], 3),
+            "peak_rss_in_mb": round(_peak_rss_in_mb(), 1),
+            **span["fields"],
+        }
+        with self._lock:
+            self._open_spans -= 1
+            if self.trace_memory and tracemalloc.is_tracing():
+                peak = max(span["traced_peak"], tracemalloc.get_traced_memory()[1])
+                record["peak_traced_memory_in_mb"] = round(peak / 2 ** 20, 1)
+                if depth > 0:
+                    stack[depth - 1]["traced_peak"] = max(stack[depth - 1]["traced_peak"], peak)
+                elif self._open_spans == 0 and self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+            self.records.append(record)
+        if self.logger is not None:
+            self.logger.info("Finished profiled span",
+                             **{("span" if k == "name" else k): v
+                                for k, v in record.items() if k != "start_time"})
+
+    def write(self, path: str):
+        """
+        Write the recorded spans to a JSON file, in the order they finished.
+
+        Parameters
+        ----------
+        path: str
+            The file to write.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"spans": self.records}, f, indent=2)
+
+
+class Span(ContextDecorator):
+    """Context manager and decorator profiling a span of work."""
+
+    def __init__(self, name: str, profiler: Optional[Profiler] = None, **fields):
+        """
+        Create a span, without starting it.
+
+        Parameters
+        ----------
+        name: str
+            Name of the span.
+        profiler: Optional[Profiler]
+            Profiler to record the span in. If None, the span is recorded in the profiler
+            installed when it is entered, see set_profiler.
+        fields:
+            Other JSON-serializable values to log and record with the span.
+        """
+        self.name = name
+        self.profiler = profiler
+        self.fields = fields
+        # The profiler and stack entry of each time the span is entered, per thread
+        self._local = threading.local()
+
+    def __enter__(self):
+        """Start the span."""
+        profiler = get_profiler() if self.profiler is None else self.profiler
+        if not hasattr(self._local, "entered"):
+            self._local.entered = []
+        self._local.entered.append(
+            (profiler, profiler._enter(self.name, self.fields)))  # pylint: disable=protected-access
+        return self
+
+    def __exit__(self, *exc):
+        """Finish the span, and record it."""
+        profiler, span = self._local.entered.pop()
+        profiler._exit(span)  # pylint: disable=protected-access
+        return False
+
+
+def _peak_rss_in_mb() -> float:
+    """Return the peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+_PROFILER = Profiler()
+
+
+def get_profiler() -> Profiler:
+    """Return the installed profiler."""
+    return _PROFILER
+
+
+def set_profiler(profiler: Optional[Profiler] = None) -> Profiler:
+    """
+    Install a profiler, to record the spans created by `profile`.
+
+    Parameters
+    ----------
+    profiler: Optional[Profiler]
+        The profiler to install. If None, a profiler that only records spans is installed.
+
+    Returns
+    ---------
+    The previously installed profiler.
+    """
+    global _PROFILER  # pylint: disable=global-statement
+    previous = _PROFILER
+    _PROFILER = Profiler() if profiler is None else profiler
+    return previous
+
+
+def profile(name: str, **fields) -> Span:
+    """
+    Return a context manager and decorator profiling a span in the installed profiler.
+
+    Parameters
+    ----------
+    name: str
+        Name of the span, such as "load", "geo_aggregation", "fit" or "export".
+    fields:
+        Other JSON-serializable values to log and record with the span, such as the geo type
+        or signal being processed.
+    """
+    return Span(name, **fields)
@@ -1,5 +1,6 @@
 """Indicator running utilities."""
 import argparse as ap
+from concurrent.futures import ThreadPoolExecutor
 import importlib
 import os
 from typing import Any, Callable, Dict, Optional
@@ -7,6 +8,7 @@ import multiprocessing
 import time
 from .archive import ArchiveDiffer, archiver_from_params
 from .logger import get_structured_logger
+from .profiling import Profiler, set_profiler
 from .utils import read_params, transfer_files, delete_move_files
 from .validator.validate import Validator
 from .validator.run import validator_from_params
@@ -17,6 +19,30 @@ Params = Dict[str, Any]
 # Trivial function to use as default value for validator and archive functions.
 NULL_FN = lambda x: None
 
+def _join_flash(flash_process: multiprocessing.Process, flash_start: float, timer, logger):
+    """Wait for the flash process until timer seconds after it started, then stop it.
+
+    Logs how long the flash stage ran in the background of the other stages.
+    """
+    wait_start = time.time()
+    flash_process.join(max(timer - (wait_start - flash_start), 0))
+    terminated = flash_process.is_alive()
+    if terminated:
+        flash_process.terminate()
+        flash_process.join()
+    end = time.time()
+    logger.info("Completed flash stage",
+                elapsed_time_in_seconds=round(end - flash_start, 2),
+                wait_time_in_seconds=round(end - wait_start, 2),
+                overlap_time_in_seconds=round(wait_start - flash_start, 2),
+                terminated=terminated)
+
+def _update_cache(archiver: ArchiveDiffer) -> float:
+    """Update the cache of archiver, returning the time it took in seconds."""
+    start = time.time()
+    archiver.update_cache()
+    return time.time() - start
+
 def run_indicator_pipeline(indicator_fn:  Callable[[Params], None],
                             flash_fn: Callable[[Params], None] = NULL_FN,
                            validator_fn:  Callable[[Params], Optional[Validator]] = NULL_FN,
@@ -28,7 +54,7 @@ def run_indicator_pipeline(indicator_fn:  Callable[[Params], None],
     parameters (see details below).  This parameter dictionary should have five subdictionaries
     keyed as "indicator", "validation", "archive", "flash", and "common" corresponding to parameters
     to be used in `indicator_fn`, `validator_fn`, `archiver_fn`, `flash_fn` and shared across
-    functions, respectively.The timer function stops the flash process after a certain time.
+    functions, respectively. The timer stops the flash process after a certain time.
 
     Arguments
     ---------
@@ -42,6 +68,22 @@ def run_indicator_pipeline(indicator_fn:  Callable[[Params], None],
     archiver_fn: Callable[[Params], Optional[ArchiveDiffer]]
         function that takes a dictionary of parameters and produces the associated ArchiveDiffer or
         None if no archiving should be performed.
+
+    The flash stage runs in a separate process in the background of validation, and is stopped
+    if it is still running timer seconds after it started. It is always finished before the
+    exports are deleted on failed validation or archived, since both of those remove or replace
+    the exports that flash reads. The archive cache is updated while the exports are validated;
+    this starts whenever an archiver is configured, since it only refreshes the local copy of the
+    archive and does not touch the exports. If validation then fails, the exports are deleted
+    first, and a failed cache update is only logged.
+
+    The indicator, validation, archive and delivery stages are profiled, and their wall time,
+    CPU time and peak memory are logged. Since flash runs in its own process, only the wait for
+    it to finish is profiled, as "flash_wait"; its total run time is logged separately.
+    Indicators can profile their own phases within the indicator stage with
+    `delphi_utils.profiling.profile`. If params["common"] has a "profile_filename", all profiled
+    spans are also written there as JSON at the end of the run, and if "profile_trace_memory" is
+    true, the peak memory of each span is also measured with tracemalloc.
     """
     params = read_params()
     logger = get_structured_logger(
@@ -63,32 +105,49 @@ def run_indicator_pipeline(indicator_fn:  Callable[[Params], None],
         logger.info(f"Started {ind_name} with covidcast-indicators version {current_version}")
     else: logger.info(f"Started {ind_name} without version.cfg")
 
-    indicator_fn(params)
-    validator = validator_fn(params)
-    archiver = archiver_fn(params)
-
-    t1 = multiprocessing.Process(target=flash_fn, args=[params])
-    t1.start()
-    start = time.time()
-    while time.time()-start < timer:
-        if not t1.is_alive():
-            break
-        time.sleep(10)
-    else:
-        t1.terminate()
-        t1.join()
-    if validator:
-        validation_report = validator.validate()
-        validation_report.log(logger)
-        # Validators on dry-run always return success
-        if not validation_report.success():
-            delete_move_files()
-    if (not validator or validation_report.success()):
-        if archiver:
-            archiver.run(logger)
-        if "delivery" in params:
-            transfer_files()
+    profiler = Profiler(logger, params["common"].get("profile_trace_memory", False))
+    previous_profiler = set_profiler(profiler)
+    try:
+        with profiler.span("indicator"):
+            indicator_fn(params)
+        validator = validator_fn(params)
+        archiver = archiver_fn(params)
 
+        # Flash runs in the background of validation, and the archive cache is updated while
+        # the exports are validated.
+        flash_process = multiprocessing.Process(target=flash_fn, args=[params])
+        flash_process.start()
+        flash_start = time.time()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            cache_update = executor.submit(_update_cache, archiver) if archiver else None
+            try:
+                if validator:
+                    with profiler.span("validation"):
+                        validation_report = validator.validate()
+                        validation_report.log(logger)
+            finally:
+                # Flash reads the exports, so it must finish before they are moved or archived
+                with profiler.span("flash_wait"):
+                    _join_flash(flash_process, flash_start, timer, logger)
+            # Validators on dry-run always return success
+            if validator and not validation_report.success():
+                delete_move_files()
+                # The cache is not used, so a failed update must not stop the run
+                if cache_update and not cache_update.cancel() and cache_update.exception():
+                    logger.warning("Failed to update archive cache", phase="archiving",
+                                   exception=repr(cache_update.exception()))
+            elif archiver:
+                logger.info("Updated archive cache", phase="archiving",
+                            elapsed_time_in_seconds=round(cache_update.result(), 2))
+                with profiler.span("archive"):
+                    archiver.run(logger)
+        if (not validator or validation_report.success()) and "delivery" in params:
+            with profiler.span("delivery"):
+                transfer_files()
+    finally:
+        set_profiler(previous_profiler)
+        if params["common"].get("profile_filename"):
+            profiler.write(params["common"]["profile_filename"])
 
 if __name__ == "__main__":
     parser = ap.ArgumentParser()
@@ -11,13 +11,88 @@ These smoothers are all functions that take a 1D numpy array and return a smooth
 docstrings for details.
 """
 
-from typing import Union
+from functools import lru_cache
+import json
+from typing import Optional, Union
 import warnings
 
 import numpy as np
 import pandas as pd
 
 
+@lru_cache(maxsize=None)
+def _savgol_coeffs(nl: int, nr: int, poly_fit_degree: int,
+                   gaussian_bandwidth: Optional[float]) -> np.ndarray:
+    """Solve for the Savitzky-Golay coefficients, memoized for the whole process.
+
+    See Smoother.savgol_coeffs. The returned array is shared between callers, so it is
+    read-only.
+    """
+    A = np.vstack(  # pylint: disable=invalid-name
+        [np.arange(nl, nr + 1) ** j for j in range(poly_fit_degree + 1)]
+    ).T
+
+    if gaussian_bandwidth is None:
+        mat_inverse = np.linalg.inv(A.T @ A) @ A.T
+    else:
+        weights = np.exp(-((np.arange(nl, nr + 1)) ** 2) / gaussian_bandwidth)
+        mat_inverse = np.linalg.inv((A.T * weights) @ A) @ (A.T * weights)
+    # The coefficients are the first row of the inverse, which gives the constant term
+    coeffs = mat_inverse[0].copy()
+    coeffs.flags.writeable = False
+    return coeffs
+
+
+def truncated_left_gauss_linear(signal, bandwidth, weight_cutoff=1e-18):
+    """Smooth a signal with a left Gaussian local linear filter, in linear time.
+
+    At each time t, fits a line to the values at times t - h, ..., t with the Gaussian weights
+    exp(-(t - s)^2 / bandwidth), and returns its value at t. The fit is centered at t, and
+    values whose weight is below weight_cutoff are left out, so each fit uses a window of
+    fixed length h and the signal is smoothed in O(n) time. The result agrees with a fit on
+    the whole past to within floating point error. Unlike such a fit, a nan value only
+    affects the fits whose window contains it.
+
+    Parameters
+    ----------
+    signal: np.ndarray
+        A 1D signal.
+    bandwidth: float
+        The bandwidth of the Gaussian weights, in terms of variance.
+    weight_cutoff: float
+        The smallest weight of a value in the fit.
+
+    Returns
+    ----------
+    signal_smoothed: np.ndarray
+        A smoothed 1D signal, with nans where the fit is singular, which is at the first value.
+    """
+    signal = np.asarray(signal, dtype=float)
+    n = len(signal)
+    horizon = int(np.ceil(np.sqrt(-bandwidth * np.log(weight_cutoff))))
+    horizon = max(min(horizon, n - 1), 0)
+    offsets = np.arange(-horizon, 1)
+    weights = np.exp(-(offsets ** 2) / bandwidth)
+
+    # Weighted sums of the values and of the values times their offsets in each window
+    windows = np.lib.stride_tricks.sliding_window_view(
+        np.concatenate([np.zeros(horizon), signal]), horizon + 1)
+    sum_y = windows @ weights
+    sum_uy = windows @ (weights * offsets)
+    # Weighted sums of the powers of the offsets, over the part of the window in the signal
+    available = np.minimum(np.arange(n), horizon)
+    sum_w = np.cumsum(weights[::-1])[available]
+    sum_u = np.cumsum((weights * offsets)[::-1])[available]
+    sum_uu = np.cumsum((weights * offsets ** 2)[::-1])[available]
+
+    # The intercept of the weighted least squares line
+    det = sum_w * sum_uu - sum_u ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        signal_smoothed = (sum_uu * sum_y - sum_u * sum_uy) / det
+    signal_smoothed[det == 0] = np.nan
+    return signal_smoothed
+
+
 class Smoother:  # pylint: disable=too-many-instance-attributes
     """Smoother class.
 
@@ -74,12 +149,21 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
         same value as the raw signal. If 'identity', it just keeps the raw signal. If 'nan', it
         writes nans. For the other smoothing methods, 'moving_average' writes nans and
         'left_gauss_linear' uses a shortened window.
+    left_gauss_engine: {'quadratic', 'linear'}
+        The implementation of the 'left_gauss_linear' smoother. If 'quadratic' (default), each
+        value is fit on the whole past, in O(n^2) time. If 'linear', each value is fit on the
+        past values whose weight is not negligible, with truncated_left_gauss_linear, in O(n)
+        time. The two agree to within floating point error.
 
     Methods
     ----------
     smooth: np.ndarray or pd.Series
         Takes a 1D signal and returns a smoothed version.
         The input and the output have the same length and type.
+    smooth_panel: np.ndarray
+        Takes a 2D array with one signal per row and returns the smoothed rows.
+    smooth_frame: pd.Series
+        Takes a long dataframe and returns the smoothed values of each geo.
 
     Example Usage
     -------------
@@ -91,6 +175,9 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
     >>> smoother = Smoother(smoother_name='savgol')
     >>> df[col] = df[col].transform(smoother.smooth)
 
+    Example 2b. Smooth a dataframe column for each geo.
+    >>> df[col] = smoother.smooth_frame(df, value_col=col, geo_col="geo_id")
+
     Example 3. Apply a rolling weighted average smoother, with 95% weight on the recent 2 weeks and
                a sharp cutoff after 4 weeks.
     >>> smoother = Smoother(smoother_name='savgol', poly_fit_degree=0, window_length=28,
@@ -119,6 +206,7 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
         impute_method=None,
         minval=None,
         boundary_method="shortened_window",
+        left_gauss_engine="quadratic",
     ):
         """See class docstring."""
         self.smoother_name = smoother_name
@@ -128,6 +216,7 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
         self.impute_method = self._select_imputer(impute_method, self.smoother_name)
         self.minval = minval
         self.boundary_method = boundary_method
+        self.left_gauss_engine = left_gauss_engine
 
         valid_smoothers = {"savgol", "left_gauss_linear", "moving_average", "identity"}
         valid_impute_methods = {"savgol", "zeros", "identity"}
@@ -138,6 +227,8 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
             raise ValueError("Invalid impute_method given.")
         if self.boundary_method not in valid_boundary_methods:
             raise ValueError("Invalid boundary_method given.")
+        if self.left_gauss_engine not in {"quadratic", "linear"}:
+            raise ValueError("Invalid left_gauss_engine given.")
         if self.window_length <= 1:
             raise ValueError("Window length is too short.")
 
@@ -147,8 +238,21 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
             self.coeffs = self.savgol_coeffs(
                 -self.window_length + 1, 0, self.poly_fit_degree
             )
+            self.boundary_coeffs = [
+                self._boundary_coeffs(ix) for ix in range(len(self.coeffs))
+            ]
         else:
             self.coeffs = None
+            self.boundary_coeffs = None
+
+    def _boundary_coeffs(self, ix):
+        """Return the shortened window filter for index ix, or None if it can't be fit."""
+        if ix == 0:
+            return None
+        try:
+            return self.savgol_coeffs(-ix, 0, self.poly_fit_degree)
+        except np.linalg.LinAlgError:  # for small ix, the design matrix is singular
+            return None
 
     def _select_imputer(self, impute_method, smoother_name):
         if impute_method is None and smoother_name != "identity":
@@ -209,6 +313,162 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
             signal_smoothed.index = pandas_index
         return signal_smoothed
 
+    def smooth_panel(self, panel: np.ndarray, impute_order=2) -> np.ndarray:
+        """Apply a smoother to each row of a 2D panel of signals.
+
+        Equivalent to calling smooth() on every row, such as the time series of each geo, but
+        the imputation and the 'savgol', 'moving_average' and 'identity' smoothers are applied
+        to all rows at once. Rows may begin with different numbers of nans, which are kept.
+        The 'left_gauss_linear' smoother is applied one row at a time.
+
+        Parameters
+        ----------
+        panel: np.ndarray
+            A 2D array of shape (n_geo, n_time), with one signal to be smoothed per row.
+        impute_order: int
+            The polynomial order of the fit used for imputation. By default, this is set to
+            2.
+
+        Returns
+        ----------
+        panel_smoothed: np.ndarray
+            A 2D array of the same shape as the input, with each row smoothed.
+        """
+        panel = np.asarray(panel, dtype=float)
+        if panel.ndim != 2:
+            raise ValueError("The panel should be a 2D array.")
+        if panel.size == 0:
+            return panel.copy()
+        if self.smoother_name == "left_gauss_linear":
+            return np.vstack([self.smooth(row, impute_order) for row in panel]).reshape(
+                panel.shape)
+
+        n_time = panel.shape[1]
+        observed = ~np.isnan(panel)
+        has_data = observed.any(axis=1)
+        # Align the rows on their first non-nan value, which is where smooth() starts
+        first = np.where(has_data, np.argmax(observed, axis=1), n_time)
+        lengths = n_time - first
+        shifted = np.arange(n_time) + first[:, None]
+        aligned = np.take_along_axis(panel, np.minimum(shifted, n_time - 1), axis=1)
+        in_signal = shifted < n_time
+        aligned[~in_signal] = np.nan
+
+        aligned_smoothed = self._smooth_aligned_panel(
+            self._impute_panel(aligned, in_signal, impute_order))
+        # Don't smooth in certain edge cases
+        unsmoothed = (lengths < self.poly_fit_degree) | (lengths == 1)
+        aligned_smoothed[unsmoothed] = aligned[unsmoothed]
+
+        # Shift the rows back, with nans before the first value as in smooth()
+        unshifted = np.arange(n_time) - first[:, None]
+        panel_smoothed = np.take_along_axis(
+            aligned_smoothed, np.clip(unshifted, 0, n_time - 1), axis=1)
+        panel_smoothed[unshifted < 0] = np.nan
+        # If all nans, pass through
+        panel_smoothed[~has_data] = panel[~has_data]
+        return panel_smoothed
+
+    def _impute_panel(self, panel, in_signal, impute_order):
+        """Impute the nan values of left-aligned signals, where in_signal holds."""
+        if self.impute_method == "zeros":
+            return np.where(in_signal, np.nan_to_num(panel), np.nan)
+        if self.impute_method == "identity":
+            return np.copy(panel)
+
+        if impute_order > self.window_length:
+            raise ValueError("Impute order must be smaller than window length.")
+        panel_imputed = np.copy(panel)
+        # Each column is imputed from the previous ones, as in savgol_impute
+        for ix in np.flatnonzero((np.isnan(panel) & in_signal).any(axis=0)):
+            rows = np.isnan(panel_imputed[:, ix]) & in_signal[:, ix]
+            if ix == 1:
+                panel_imputed[rows, ix] = panel_imputed[rows, ix - 1]
+            elif ix < self.window_length:
+                coeffs = self.savgol_coeffs(-ix, -1, min(ix - 1, impute_order))
+                panel_imputed[rows, ix] = panel_imputed[rows, :ix] @ coeffs
+            else:
+                coeffs = self.savgol_coeffs(-self.window_length, -1, impute_order)
+                panel_imputed[rows, ix] = \
+                    panel_imputed[rows, ix - self.window_length : ix] @ coeffs
+        return panel_imputed
+
+    def _smooth_aligned_panel(self, panel):
+        """Apply the savgol, moving_average or identity smoother to left-aligned signals."""
+        if self.smoother_name == "identity":
+            return panel
+        if self.smoother_name == "moving_average" and not isinstance(self.window_length, int):
+            raise ValueError("k must be int.")
+
+        # Windows of the past window_length values, padded with nans before the first value
+        window_length = len(self.coeffs) if self.smoother_name == "savgol" else self.window_length
+        panel_padded = np.hstack([np.full((panel.shape[0], window_length - 1), np.nan), panel])
+        windows = np.lib.stride_tricks.sliding_window_view(panel_padded, window_length, axis=1)
+        if self.smoother_name == "moving_average":
+            return windows.sum(axis=2) / self.window_length
+
+        panel_smoothed = windows @ self.coeffs
+        if self.boundary_method == "nan":
+            return panel_smoothed
+        # As in savgol_smoother, with the same shortened window filters for every row
+        for ix in range(min(len(self.coeffs), panel.shape[1])):
+            if self.boundary_method == "identity" or self.boundary_coeffs[ix] is None:
+                panel_smoothed[:, ix] = panel[:, ix]
+            else:
+                panel_smoothed[:, ix] = panel[:, : ix + 1] @ self.boundary_coeffs[ix]
+        return panel_smoothed
+
+    def smooth_frame(
+        self,
+        df: pd.DataFrame,
+        value_col="val",
+        geo_col="geo_id",
+        time_col="timestamp",
+        impute_order=2,
+    ) -> pd.Series:
+        """Smooth the time series of each geo in a long dataframe.
+
+        Pivots the values into a panel with one row per geo and smooths it with smooth_panel(),
+        returning the smoothed values in the rows of the dataframe. This replaces
+        `df.groupby(geo_col)[value_col].transform(smoother.smooth)` on dataframes sorted by
+        time. As there, the values of each geo are smoothed as a sequence in time order, so
+        times missing for a geo are skipped rather than imputed. The panel rows are aligned on
+        their last value, and padded with leading nans, which smooth_panel() keeps.
+
+        Parameters
+        ----------
+        df: pd.DataFrame
+            A dataframe with one row per geo and time.
+        value_col: str
+            The column of values to be smoothed.
+        geo_col: str
+            The column identifying each signal.
+        time_col: str
+            The column of times, used to order the values of each geo.
+        impute_order: int
+            The polynomial order of the fit used for imputation.
+
+        Returns
+        ----------
+        values_smoothed: pd.Series
+            The smoothed values, with the same index as df.
+        """
+        if df.duplicated([geo_col, time_col]).any():
+            raise ValueError(f"The dataframe has more than one row per {geo_col} and {time_col}.")
+        geo_codes, geos = pd.factorize(df[geo_col])
+        # Order the rows by time within each geo, and right-align the geos in the panel
+        order = np.lexsort((df[time_col].to_numpy(), geo_codes))
+        counts = np.bincount(geo_codes, minlength=len(geos))
+        n_time = counts.max() if len(counts) else 0
+        starts = np.cumsum(counts) - counts
+        sorted_codes = geo_codes[order]
+        columns = np.empty(len(df), dtype=int)
+        columns[order] = n_time - counts[sorted_codes] + np.arange(len(df)) - starts[sorted_codes]
+        panel = np.full((len(geos), n_time), np.nan)
+        panel[geo_codes, columns] = df[value_col].to_numpy(dtype=float)
+        panel_smoothed = self.smooth_panel(panel, impute_order)
+        return pd.Series(panel_smoothed[geo_codes, columns], index=df.index, name=value_col)
+
     def _select_smoother(self):
         """Select a smoothing method based on the smoother type."""
         if self.smoother_name == "savgol":
@@ -301,6 +561,14 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
             "Use the savgol smoother with poly_fit_degree=1 instead.",
             DeprecationWarning,
         )
+        if self.left_gauss_engine == "linear" and self.gaussian_bandwidth is not None:
+            signal_smoothed = truncated_left_gauss_linear(signal, self.gaussian_bandwidth)
+            # The fit is singular at the first value, fall back to the raw signal
+            signal_smoothed[:1] = signal[:1]
+            if self.minval is not None:
+                signal_smoothed[signal_smoothed <= self.minval] = self.minval
+            return signal_smoothed
+
         n = len(signal)
         signal_smoothed = np.zeros_like(signal)
         # A is the regression design matrix
@@ -366,8 +634,8 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
         through the points {x_i}. The coefficients are c_i are calculated as
             c_i =  ((A.T @ A)^(-1) @ (A.T @ e_i))_0
         where A is the design matrix of the polynomial fit and e_i is the standard
-        basis vector i. This is currently done via a full inversion, which can be
-        optimized.
+        basis vector i. The coefficients are memoized for the whole process, keyed by the
+        window bounds, the degree and the gaussian_bandwidth.
 
         Parameters
         ----------
@@ -381,7 +649,7 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
         Returns
         ----------
         coeffs: np.ndarray
-            A vector of coefficients of length nr - nl + 1 that determines the savgol
+            A read-only vector of coefficients of length nr - nl + 1 that determines the savgol
             convolution filter.
         """
         if nl >= nr:
@@ -389,22 +657,7 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
         if nr > 0:
             warnings.warn("The filter is no longer causal.")
 
-        A = np.vstack(  # pylint: disable=invalid-name
-            [np.arange(nl, nr + 1) ** j for j in range(poly_fit_degree + 1)]
-        ).T
-
-        if self.gaussian_bandwidth is None:
-            mat_inverse = np.linalg.inv(A.T @ A) @ A.T
-        else:
-            weights = np.exp(-((np.arange(nl, nr + 1)) ** 2) / self.gaussian_bandwidth)
-            mat_inverse = np.linalg.inv((A.T * weights) @ A) @ (A.T * weights)
-        window_length = nr - nl + 1
-        coeffs = np.zeros(window_length)
-        for i in range(window_length):
-            basis_vector = np.zeros(window_length)
-            basis_vector[i] = 1.0
-            coeffs[i] = (mat_inverse @ basis_vector)[0]
-        return coeffs
+        return _savgol_coeffs(int(nl), int(nr), int(poly_fit_degree), self.gaussian_bandwidth)
 
     def savgol_smoother(self, signal):  # pylint: disable=inconsistent-return-statements
         """Smooth signal with the savgol smoother.
@@ -438,17 +691,12 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
 
         # boundary methods "identity" and "shortened window"
         for ix in range(min(len(self.coeffs), len(signal))):
-            if ix == 0 or self.boundary_method == "identity":
+            # At the very edge, the design matrix is often singular, in which case
+            # we just fall back to the raw signal
+            if self.boundary_method == "identity" or self.boundary_coeffs[ix] is None:
                 signal_smoothed[ix] = signal[ix]
             else:
-                # At the very edge, the design matrix is often singular, in which case
-                # we just fall back to the raw signal
-                try:
-                    signal_smoothed[ix] = self.savgol_predict(
-                        signal[: ix + 1], self.poly_fit_degree, 0
-                    )
-                except np.linalg.LinAlgError:  # for small ix, the design matrix is singular
-                    signal_smoothed[ix] = signal[ix]
+                signal_smoothed[ix] = signal[: ix + 1] @ self.boundary_coeffs[ix]
         return signal_smoothed
 
     def savgol_impute(self, signal, impute_order):
@@ -499,3 +747,182 @@ class Smoother:  # pylint: disable=too-many-instance-attributes
                     -1,
                 )
         return signal_imputed
+
+
+class IncrementalSmoother(Smoother):
+    """Smoother that keeps the state of one signal, to smooth new or revised values at its end.
+
+    Daily runs usually append a few days to a signal, or revise its last few values. Since the
+    imputation and the smoothers are causal, values before the first changed value are not
+    affected, so update() only imputes the values from the first change onwards, reusing the
+    imputed values from the previous update. Likewise, only the smoothed values from the first
+    change onwards are recomputed, by convolving the imputed values within one window of them.
+    The result is identical to calling smooth() on the whole signal. The left_gauss_linear
+    smoother is not causal in this sense, so it smooths the whole signal on every update.
+
+    The state can be saved after a run and loaded in the next one. The indicators still smooth
+    their full history with Smoother, since they do not keep any state between runs yet.
+
+    Parameters
+    ----------
+    impute_order: int
+        The polynomial order of the fit used for imputation.
+    Other parameters are the same as for Smoother.
+
+    Example Usage
+    -------------
+    >>> smoother = IncrementalSmoother(smoother_name='savgol', window_length=7)
+    >>> smoothed_signal = smoother.update(signal)
+    >>> smoother.save("state.npz")
+    >>> smoother = IncrementalSmoother.load("state.npz")
+    >>> smoothed_signal = smoother.update(revised_values, start=len(signal) - 3)
+    """
+
+    def __init__(self, *args, impute_order=2, **kwargs):
+        """See class docstring."""
+        super().__init__(*args, **kwargs)
+        self.impute_order = impute_order
+        self.signal = np.array([], dtype=float)
+        self.smoothed = np.array([], dtype=float)
+        # Imputed signal from its first non-nan value, if it was imputed
+        self.imputed = None
+
+    def update(self, values: Union[np.ndarray, pd.Series], start=None) -> np.ndarray:
+        """Replace the end of the signal and return the smoothed signal.
+
+        Parameters
+        ----------
+        values: np.ndarray or pd.Series
+            The new values of the signal from start onwards.
+        start: int or None
+            The index of the first value to replace. The values from start onwards are
+            replaced by values, so the signal may also become shorter. If None, the values are
+            appended to the signal.
+
+        Returns
+        ----------
+        signal_smoothed: np.ndarray
+            The smoothed signal, of the same length as the updated signal.
+        """
+        values = np.asarray(values, dtype=float)
+        if start is None:
+            start = len(self.signal)
+        if not 0 <= start <= len(self.signal):
+            raise ValueError("start should be within the signal.")
+        signal = np.concatenate([self.signal[:start], values])
+
+        # Find the first value that differs from the previous signal, treating nan == nan
+        n_common = min(len(signal), len(self.signal))
+        before, after = self.signal[:n_common], signal[:n_common]
+        differs = ~((before == after) | (np.isnan(before) & np.isnan(after)))
+        changed = int(np.argmax(differs)) if differs.any() else n_common
+
+        if changed < len(signal) or not self._truncatable(signal):
+            self.smoothed = self._smooth_from(signal, changed)
+        else:
+            # The signal was only shortened, so its imputed and smoothed values are prefixes
+            self.smoothed = self.smoothed[: len(signal)]
+            if self.imputed is not None:
+                self.imputed = self.imputed[: len(signal) - (len(self.signal) - len(self.imputed))]
+        self.signal = signal
+        return self.smoothed.copy()
+
+    def _truncatable(self, signal):
+        """Return whether signal, a prefix of self.signal, is smoothed like self.signal.
+
+        Signals that begin with nans only, or are too short after them, are not smoothed.
+        """
+        observed = np.flatnonzero(~np.isnan(signal))
+        if len(observed) == 0:
+            return False
+        n_trimmed = len(signal) - observed[0]
+        return n_trimmed >= self.poly_fit_degree and n_trimmed != 1
+
+    def _smooth_from(self, signal, changed):
+        """Smooth signal, whose values before index changed are those of self.signal."""
+        observed = np.flatnonzero(~np.isnan(signal))
+        if len(observed) == 0:
+            # If all nans, pass through
+            self.imputed = None
+            return signal.copy()
+
+        # Truncate the initial nans, as in smooth()
+        ix = observed[0]
+        signal_trimmed = signal[ix:]
+        if len(signal_trimmed) < self.poly_fit_degree or len(signal_trimmed) == 1 or \
+                self.smoother_name == "left_gauss_linear":
+            self.imputed = None
+            return self.smooth(signal, self.impute_order)
+
+        # The previous imputed and smoothed values are reused if the signal still starts at the
+        # same index
+        previous_ix = len(self.signal) - len(self.imputed) if self.imputed is not None else None
+        reused = changed - ix if previous_ix == ix and changed > ix else 0
+        if reused:
+            signal_trimmed = np.concatenate(
+                [self.imputed[:reused], signal_trimmed[reused:]])
+        self.imputed = self.impute(signal_trimmed, impute_order=self.impute_order)
+
+        # Append the nans back, since we want to preserve length
+        return np.hstack([np.nan * np.ones(ix), self.smoothed[ix : ix + reused],
+                          self._smooth_tail(self.imputed, reused)])
+
+    def _smooth_tail(self, imputed, start):
+        """Return the smoothed values of imputed from index start onwards.
+
+        Each smoothed value only depends on the window of imputed values ending at it, so only
+        the values within one window before start are convolved. The window filter is applied
+        to the same values as when smoothing the whole signal, so the results are identical.
+        """
+        if self.smoother_name == "identity":
+            return imputed[start:].copy()
+        window_length = len(self.coeffs) if self.smoother_name == "savgol" else self.window_length
+        # Near the left boundary, the smoothers use shortened windows, so smooth from the start
+        offset = window_length if start >= window_length else start
+        return self._select_smoother()(imputed[start - offset :])[offset:]
+
+    def save(self, path: str):
+        """Save the smoother settings and the state of the signal to an .npz file.
+
+        Parameters
+        ----------
+        path: str
+            The file to write.
+        """
+        settings = {
+            "smoother_name": self.smoother_name,
+            "poly_fit_degree": self.poly_fit_degree,
+            "window_length": self.window_length,
+            "gaussian_bandwidth": self.gaussian_bandwidth,
+            "impute_method": self.impute_method,
+            "minval": self.minval,
+            "boundary_method": self.boundary_method,
+            "left_gauss_engine": self.left_gauss_engine,
+            "impute_order": self.impute_order,
+        }
+        state = {"signal": self.signal, "smoothed": self.smoothed}
+        if self.imputed is not None:
+            state["imputed"] = self.imputed
+        with open(path, "wb") as f:
+            np.savez(f, settings=json.dumps(settings), **state)
+
+    @classmethod
+    def load(cls, path: str) -> "IncrementalSmoother":
+        """Load a smoother saved with save().
+
+        Parameters
+        ----------
+        path: str
+            The file to read.
+
+        Returns
+        ----------
+        smoother: IncrementalSmoother
+            A smoother with the saved settings and state.
+        """
+        with np.load(path) as saved:
+            smoother = cls(**json.loads(str(saved["settings"])))
+            smoother.signal = saved["signal"]
+            smoother.smoothed = saved["smoothed"]
+            smoother.imputed = saved["imputed"] if "imputed" in saved else None
+        return smoother
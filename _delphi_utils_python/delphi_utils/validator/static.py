@@ -163,9 +163,11 @@ class StaticValidator:
         else:
             geomap_type = geo_type
 
-        gmpr = GeoMapper()
+        gmpr = GeoMapper.get_shared()
         valid_geos = gmpr.get_geo_values(geomap_type)
-        valid_geos |= set(self.params.additional_valid_geo_values.get(geo_type, []))
+        additional_geos = self.params.additional_valid_geo_values.get(geo_type, [])
+        if additional_geos:
+            valid_geos = valid_geos | set(additional_geos)
         return valid_geos
 
     def check_bad_geo_id_value(self, df_to_test, filename, geo_type, report):
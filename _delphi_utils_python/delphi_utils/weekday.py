@@ -3,20 +3,86 @@ Weekday effects (code from Aaron Rumack).
 
 Created: 2020-05-06
 """
+from concurrent.futures import ProcessPoolExecutor
+import os
+from os.path import dirname, join
+import tempfile
+import time
+from zipfile import BadZipFile
+
 import cvxpy as cp
 import numpy as np
+import pandas as pd
 from cvxpy.error import SolverError
+from scipy.linalg import solve_banded
+
+# Coefficients of the third difference operator
+_DIFF3 = np.array([-1.0, 3.0, -3.0, 1.0])
+# Shifting the weekday effects into phi leaves the likelihood unchanged, so the fit only has a
+# unique solution if the penalty tells those 6 directions apart, which takes 6 third differences
+_MIN_INTERIOR_POINT_DAYS = 9
+
+
+def _diff3(x):
+    """Return the third differences of x."""
+    return x[3:] - 3 * x[2:-1] + 3 * x[1:-2] - x[:-3]
+
+
+def _diff3_transpose(v):
+    """Multiply v by the transpose of the third difference operator."""
+    out = np.zeros(len(v) + 3)
+    out[3:] += v
+    out[2:-1] -= 3 * v
+    out[1:-2] += 3 * v
+    out[:-3] -= v
+    return out
+
+
+def _diff3_gram_bands(weights, diagonal):
+    """Return D^T diag(weights) D + diag(diagonal) in the banded form of solve_banded.
+
+    D is the third difference operator, so the matrix has 3 diagonals on either side.
+    """
+    n_diffs = len(weights)
+    bands = np.zeros((7, n_diffs + 3))
+    for i in range(4):
+        for j in range(4):
+            bands[3 + i - j, j : j + n_diffs] += _DIFF3[i] * _DIFF3[j] * weights
+    bands[3] += diagonal
+    return bands
 
 
 class Weekday:
     """Class to handle weekday effects."""
 
     @staticmethod
-    def get_params(data, denominator_col, numerator_cols, date_col, scales, logger):
+    def get_params(data, denominator_col, numerator_cols, date_col, scales, logger,
+                   solver="interior_point", cache_dir=None, cache_name="weekday",
+                   refit_window=None, max_workers=None):
         r"""Fit weekday correction for each col in numerator_cols.
 
         Return a matrix of parameters: the entire vector of betas, for each time
         series column in the data.
+
+        The solver is either "interior_point", for the dedicated solver of
+        Weekday._fit_interior_point, or "cvxpy", for the reference cvxpy problem. The
+        scales are only used by the cvxpy solver. Columns for which the interior point
+        solver fails are fitted with cvxpy instead, with a warning.
+
+        If cache_dir is given, the fitted beta of each column is saved there, in
+        "{cache_name}_{col}.npz" along with the dates and counts it was fitted to, and
+        cache_name should identify the indicator and input data. The next fit of the
+        column then reuses the saved beta if the counts are unchanged, and otherwise
+        warm starts the interior point solver from it, so that only the phi of new
+        dates need to be initialized. If refit_window is also given, only the weekday
+        effects and the phi of the last refit_window dates (or of all new dates, if
+        there are more) are re-estimated, and the other phi are held at their saved
+        values.
+
+        If max_workers is greater than 1, the columns are fitted concurrently by a
+        process pool of this size. Otherwise they are fitted one at a time. In either
+        case the params are the same. The solve time and convergence of each column
+        are logged if the columns are fitted concurrently or cache_dir is given.
         """
         tmp = data.reset_index()
         denoms = tmp.groupby(date_col).sum()[denominator_col]
@@ -33,9 +99,26 @@ class Weekday:
         npnums, npdenoms = np.array(nums), np.array(denoms)
         params = np.zeros((nums.shape[1], X.shape[1]))
 
-        # Loop over the available numerator columns and smooth each separately.
-        for i in range(nums.shape[1]):
-            result = Weekday._fit(X, scales, npnums[:, i], npdenoms)
+        # Fit each of the available numerator columns separately.
+        fits = [
+            (X, scales, npnums[:, i], npdenoms, nums.index, solver,
+             None if cache_dir is None else join(cache_dir, f"{cache_name}_{col}.npz"),
+             refit_window)
+            for i, col in enumerate(numerator_cols)
+        ]
+        parallel = max_workers is not None and max_workers > 1
+        if parallel:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(Weekday._fit_column, *zip(*fits)))
+        else:
+            results = [Weekday._fit_column(*fit) for fit in fits]
+
+        for i, (result, details) in enumerate(results):
+            if details.get("fallback"):
+                logger.warning(f"Interior point solver failed for {numerator_cols[i]}, "
+                               "fitted weekday correction with cvxpy instead")
+            if parallel or cache_dir is not None:
+                logger.info(details.pop("message"), column=numerator_cols[i], **details)
             if result is None:
                 logger.error("Unable to calculate weekday correction")
             else:
@@ -44,7 +127,97 @@ class Weekday:
         return params
 
     @staticmethod
-    def _fit(X, scales, npnums, npdenoms):
+    def _fit_column(X, scales, npnums, npdenoms, dates, solver, cache_file, refit_window):
+        """Fit a single column as in Weekday._fit, starting from the fit saved in cache_file.
+
+        If cache_file is None, the column is fitted as in Weekday._fit. Otherwise the
+        fitted beta is also saved to cache_file.
+
+        Returns the fitted beta, or None if the fit fails, and a dictionary describing
+        the fit to log, with the log message under "message".
+        """
+        start_time = time.time()
+        cached = None
+        if cache_file is not None:
+            dates = np.asarray(dates, dtype="datetime64[ns]")
+            try:
+                with np.load(cache_file) as saved:
+                    cached = {key: saved[key] for key in ("dates", "nums", "denoms", "beta")}
+            except (OSError, ValueError, KeyError, BadZipFile):
+                cached = None
+            if cached is not None and np.array_equal(cached["dates"], dates) and \
+                    np.array_equal(cached["nums"], npnums) and \
+                    np.array_equal(cached["denoms"], npdenoms):
+                return cached["beta"], {"message": "Reusing cached weekday correction",
+                                        "cache_file": cache_file}
+
+        init, n_free, n_steps, beta = None, None, None, None
+        interior_point = solver == "interior_point" and X.shape[0] >= _MIN_INTERIOR_POINT_DAYS
+        if interior_point:
+            init, n_free = Weekday._warm_start(cached, dates, refit_window)
+            result = Weekday._fit_interior_point(X, npnums, npdenoms, init=init, n_free=n_free)
+            if result is not None:
+                beta, n_steps = result
+        if beta is None:
+            init, n_free = None, None
+            beta = Weekday._fit(X, scales, npnums, npdenoms, "cvxpy")
+        if beta is not None and cache_file is not None:
+            Weekday._save_fit(cache_file, dates=dates, nums=npnums, denoms=npdenoms, beta=beta)
+        details = {"message": "Fitted weekday correction",
+                   "solver": "interior_point" if n_steps is not None else "cvxpy",
+                   "fallback": interior_point and n_steps is None,
+                   "converged": beta is not None,
+                   "newton_steps": n_steps,
+                   "elapsed_time_in_seconds": round(time.time() - start_time, 3)}
+        if cache_file is not None:
+            details.update(cache_file=cache_file, warm_start=init is not None,
+                           refit_days=X.shape[0] if n_free is None else n_free)
+        return beta, details
+
+    @staticmethod
+    def _save_fit(cache_file, **arrays):
+        """Save arrays to cache_file, replacing it atomically.
+
+        Concurrent or interrupted runs never leave a partially written cache file.
+        """
+        os.makedirs(dirname(cache_file) or ".", exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname(cache_file) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, cache_file)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _warm_start(cached, dates, refit_window):
+        """Return the initial beta and number of free phi for a fit starting from cached.
+
+        The phi of dates missing from the cached fit are set to the cached phi of the
+        nearest date. The number of free phi is None unless refit_window is given and
+        every date outside the window is in the cached fit.
+        """
+        if cached is None:
+            return None, None
+        positions = pd.Index(cached["dates"]).get_indexer(dates)
+        found = positions >= 0
+        if not found.any():
+            return None, None
+        phi = pd.Series(np.where(found, cached["beta"][6:][positions], np.nan))
+        phi = phi.ffill().bfill().to_numpy()
+        init = np.concatenate([cached["beta"][:6], phi])
+        if refit_window is None:
+            return init, None
+        # The window always includes the new dates after the cached ones
+        n_free = max(refit_window, len(dates) - np.flatnonzero(found)[-1] - 1)
+        if n_free >= len(dates) or not found[:len(dates) - n_free].all():
+            return init, None
+        return init, n_free
+
+    @staticmethod
+    def _fit(X, scales, npnums, npdenoms, solver="interior_point"):
         r"""Correct a signal estimated as numerator/denominator for weekday effects.
 
         The ordinary estimate would be numerator_t/denominator_t for each time point
@@ -78,7 +251,19 @@ class Weekday:
 
         ll = (numerator * (X*b + log(denominator)) - sum(exp(X*b) + log(denominator)))
                 / num_days
+
+        The problem is solved by Weekday._fit_interior_point if solver is
+        "interior_point", falling back to cvxpy if that fails, or with cvxpy if solver
+        is "cvxpy". Series of fewer than 9 days, whose solution is not unique, are
+        always solved with cvxpy.
         """
+        if solver not in ("interior_point", "cvxpy"):
+            raise ValueError(f"Invalid solver '{solver}'")
+        if solver == "interior_point" and X.shape[0] >= _MIN_INTERIOR_POINT_DAYS:
+            result = Weekday._fit_interior_point(X, npnums, npdenoms)
+            if result is not None:
+                return result[0]
+
         b = cp.Variable((X.shape[1]))
 
         lmbda = cp.Parameter(nonneg=True)
@@ -101,6 +286,142 @@ class Weekday:
                 continue
         return None
 
+    @staticmethod
+    def _fit_interior_point(  # pylint: disable=too-many-statements
+            X, npnums, npdenoms, lmbda=10, tol=1e-8, max_steps=500,
+            init=None, n_free=None):
+        r"""Solve the problem of Weekday._fit with a log-barrier interior point method.
+
+        The L1 penalty is written with slack variables s >= |D phi|, where D is the
+        third difference operator, and the barrier problem
+
+        t * (nll + lmbda^2 * sum(s) / (num_days - 2)) - sum(log(s - D phi) + log(s + D phi))
+
+        is minimized by Newton's method for increasing t, until the duality gap is
+        below tol relative to the objective. After eliminating s, each Newton step
+        solves a system in phi with 3 diagonals on either side of the main one, plus a
+        6x6 Schur complement for the weekday effects, so it takes O(num_days) time.
+
+        If init is given, the solver starts from that beta, at a point further along
+        the central path. If n_free is also given, only the weekday effects and the
+        last n_free entries of phi are fitted, and the other entries of phi are held
+        at their values in init.
+
+        Returns the fitted beta and the number of Newton steps taken, or None if the
+        solver fails to converge.
+        """
+        n_days = X.shape[0]
+        n_free = n_days if init is None or n_free is None else min(n_free, n_days)
+        # Only the third differences involving a free entry of phi can change
+        first = max(n_days - n_free - 3, 0)
+        n_fixed = n_days - n_free - first
+        n_diffs = n_days - first - 3
+        weekdays = X[:, :6]
+        offset = np.log(npdenoms)
+        nums = np.asarray(npnums, dtype=float)
+        penalty = lmbda ** 2 / (n_days - 2)
+
+        def objective(eta, phi):
+            return np.sum(np.exp(eta) - nums * eta) / n_days + \
+                penalty * np.sum(np.abs(_diff3(phi[first:])))
+
+        if init is None:
+            # Start from the raw rates, with slack inside the feasible region
+            alpha = np.zeros(6)
+            phi = np.log((nums + 0.5) / npdenoms)
+            t = n_diffs / max(abs(objective(phi + offset, phi)), 1)
+            s = np.abs(_diff3(phi)) + 1
+        else:
+            # Start close to the end of the central path, where a slack of 1 / (t * penalty)
+            # balances the penalty and the barrier for each nonzero difference
+            alpha, phi = np.array(init[:6], dtype=float), np.array(init[6:], dtype=float)
+            t = n_diffs / (1e-5 * max(abs(objective(weekdays @ alpha + phi + offset, phi)), 1))
+            s = np.abs(_diff3(phi[first:])) + 1 / (t * penalty)
+
+        with np.errstate(over="raise", invalid="raise", divide="raise"):
+            try:
+                for n_steps in range(1, max_steps + 1):
+                    eta = weekdays @ alpha + phi + offset
+                    rates = np.exp(eta) / n_days
+                    residuals = rates - nums / n_days
+                    diffs = _diff3(phi[first:])
+                    lower, upper = s - diffs, s + diffs
+
+                    # Gradient and Hessian of the barrier problem
+                    grad_alpha = t * (weekdays.T @ residuals)
+                    grad_phi = t * residuals[-n_free:] + \
+                        _diff3_transpose(1 / lower - 1 / upper)[n_fixed:]
+                    grad_s = t * penalty - 1 / lower - 1 / upper
+                    hess_s = 1 / lower ** 2 + 1 / upper ** 2
+                    hess_s_phi = 1 / upper ** 2 - 1 / lower ** 2
+
+                    # Eliminate s, then alpha through its Schur complement
+                    reduced_grad_phi = grad_phi - \
+                        _diff3_transpose(hess_s_phi / hess_s * grad_s)[n_fixed:]
+                    weighted_weekdays = (t * rates)[:, None] * weekdays
+                    solved = solve_banded(
+                        (3, 3),
+                        _diff3_gram_bands(4 / (lower ** 2 + upper ** 2),
+                                          t * rates[first:])[:, n_fixed:],
+                        np.column_stack([weighted_weekdays[-n_free:], reduced_grad_phi]))
+                    schur = weekdays.T @ weighted_weekdays - \
+                        weighted_weekdays[-n_free:].T @ solved[:, :6]
+                    step_alpha = np.linalg.solve(
+                        schur, weighted_weekdays[-n_free:].T @ solved[:, 6] - grad_alpha)
+                    step_phi = np.zeros(n_days)
+                    step_phi[-n_free:] = -solved[:, 6] - solved[:, :6] @ step_alpha
+                    step_diff3 = _diff3(step_phi[first:])
+                    step_s = -(grad_s + hess_s_phi * step_diff3) / hess_s
+
+                    decrement = -(grad_alpha @ step_alpha + grad_phi @ step_phi[-n_free:] +
+                                  grad_s @ step_s)
+                    # The decrement can only be computed to a precision relative to the barrier
+                    # problem, whose scale grows with t, so it is compared to a relative tolerance
+                    scale = max(abs(objective(eta, phi)), 1)
+                    if decrement / 2 < max(1e-8, 1e-14 * t * scale):
+                        # Centered: stop if the duality gap is small enough, else increase t
+                        if 2 * n_diffs / t < tol * scale:
+                            return np.concatenate([alpha, phi]), n_steps
+                        t *= 20
+                        continue
+
+                    # Backtracking line search, staying inside the feasible region. The
+                    # change in the objective is computed directly to avoid cancellation.
+                    step_eta = weekdays @ step_alpha + step_phi
+                    step_lower, step_upper = step_s - step_diff3, step_s + step_diff3
+                    step = min(1, 0.99 * np.min(np.concatenate([
+                        -lower[step_lower < 0] / step_lower[step_lower < 0],
+                        -upper[step_upper < 0] / step_upper[step_upper < 0],
+                        [np.inf]])))
+                    while step > 1e-12:
+                        change = t * (
+                            np.sum(rates * np.expm1(step * step_eta)
+                                   - nums / n_days * step * step_eta)
+                            + penalty * step * np.sum(step_s)
+                        ) - np.sum(np.log1p(step * step_lower / lower)) \
+                            - np.sum(np.log1p(step * step_upper / upper))
+                        if change <= -0.01 * step * decrement:
+                            break
+                        step /= 2
+                    alpha = alpha + step * step_alpha
+                    phi = phi + step * step_phi
+                    s = s + step * step_s
+            except (FloatingPointError, np.linalg.LinAlgError):
+                return None
+        return None
+
+    @staticmethod
+    def correction_table(params):
+        """Return the weekday corrections exp(alpha) of each row of params.
+
+        Row i of the returned array holds the factors by which the numerators of the
+        i-th column are divided on Monday through Sunday, indexed by dayofweek.
+        Sunday's effect is the negative sum of the other weekdays' effects.
+        """
+        params = np.atleast_2d(params)
+        alpha = np.column_stack([params[:, :6], -np.sum(params[:, :6], axis=1)])
+        return np.exp(alpha)
+
     @staticmethod
     def calc_adjustment(params, sub_data, cols, date_col):
         """Apply the weekday adjustment to a specific time series.
@@ -120,16 +441,17 @@ class Weekday:
         this case, we only divide the numerator, leaving the denominator unchanged
         -- this has the same effect.
 
+        The weekday effects are shared by all geographies, so sub_data can also be a
+        long frame holding every geography at once. date_col can be either a column or
+        an index level of sub_data.
         """
         tmp = sub_data.copy()
+        if date_col in tmp.columns:
+            dayofweek = tmp[date_col].dt.dayofweek.to_numpy()
+        else:
+            dayofweek = tmp.index.get_level_values(date_col).dayofweek.to_numpy()
+        corrections = Weekday.correction_table(params)[:, dayofweek]
 
         for i, c in enumerate(cols):
-            wd_correction = np.zeros((len(tmp[c])))
-
-            for wd in range(7):
-                mask = tmp[date_col].dt.dayofweek == wd
-                wd_correction[mask] = tmp.loc[mask, c] / (
-                    np.exp(params[i, wd]) if wd < 6 else np.exp(-np.sum(params[i, :6]))
-                )
-            tmp.loc[:, c] = wd_correction
+            tmp[c] = tmp[c].to_numpy() / corrections[i]
         return tmp
@@ -15,10 +15,12 @@ required = [
     "moto",
     "numpy",
     "pandas>=1.1.0",
+    "pyarrow",
     "pydocstyle",
     "pylint==2.8.3",
     "pytest",
     "pytest-cov",
+    "scipy",
     "slackclient",
     "structlog",
     "xlrd"
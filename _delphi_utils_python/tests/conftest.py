@@ -0,0 +1,12 @@
+"""Common fixtures for the delphi_utils tests."""
+import pytest
+
+from delphi_utils.geomap import GeoMapper
+
+
+@pytest.fixture(autouse=True, scope="session")
+def geomap_cache_dir(tmp_path_factory):
+    """Keep the crosswalk cache of the tests out of the home directory."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv(GeoMapper.CACHE_DIR_ENV_VAR, str(tmp_path_factory.mktemp("geomap")))
+        yield
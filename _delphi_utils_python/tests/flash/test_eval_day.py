@@ -1,7 +1,8 @@
 """Tests for eval_day.py"""
 import mock
 import pandas as pd
-from delphi_utils.flash_eval.eval_day import (flash_eval)
+from delphi_utils.flash_eval.eval_day import (flash_eval, setup_fips)
+from delphi_utils.geomap import GeoMapper
 
 
 def test_flash_input():
@@ -18,3 +19,13 @@ def test_flash_input():
                                                   index_col=0, parse_dates=[0], header=0)
     last_7, type_of_outlier = flash_eval(lag, day, input_df, signal, params, logger=mock_logger, local=True)
     initial_7_day_file.to_csv(f'flash_ref/{signal}/last_7_1.csv')
+
+
+def test_setup_fips_keeps_shared_crosswalks():
+    """Test that setup_fips does not rename the columns of the shared crosswalks."""
+    _, fips_pop_table = setup_fips()
+    assert fips_pop_table.index.name == "geo"
+    gmpr = GeoMapper.get_shared()
+    assert list(gmpr.get_crosswalk("fips", "pop").columns) == ["fips", "pop"]
+    df = pd.DataFrame({"fips": ["01001"]})
+    assert "population" in gmpr.add_population_column(df, "fips").columns
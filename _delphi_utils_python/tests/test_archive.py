@@ -1,7 +1,7 @@
 from dataclasses import dataclass, field
 from io import StringIO, BytesIO
-from os import listdir, mkdir
-from os.path import join
+from os import listdir, mkdir, remove, stat
+from os.path import exists, join
 from typing import Any, Dict, List
 
 from boto3 import Session
@@ -14,7 +14,9 @@ from pandas.testing import assert_frame_equal
 import pytest
 
 from delphi_utils.archive import ArchiveDiffer, GitArchiveDiffer, S3ArchiveDiffer,\
-    archiver_from_params
+    ParquetArchiveDiffer,\
+    FilesystemArchiveDiffer, archiver_from_params, diff_export_csv
+from delphi_utils.manifest import MANIFEST_FILE, Manifest
 from delphi_utils.nancodes import Nans
 
 CSV_DTYPES = {
@@ -195,6 +197,47 @@ assert set(EXPECTEDS.new) == set(f"{csv_name}.csv" for csv_name, dfs in CSVS.ite
 def _assert_frames_equal_ignore_row_order(df1, df2, index_cols: List[str] = None):
     return assert_frame_equal(df1.set_index(index_cols).sort_index(), df2.set_index(index_cols).sort_index())
 
+class TestDiffExportCsv:
+
+    @staticmethod
+    def _random_export(rng, geo_ids, missing=True):
+        n = len(geo_ids)
+        df = pd.DataFrame({
+            "geo_id": geo_ids,
+            "val": rng.choice([1.0, 2.0, 3.00000001, np.nan], n),
+            "se": rng.choice([0.1, 0.2, np.nan], n),
+            "sample_size": rng.choice([10.0, np.nan], n),
+        })
+        if missing:
+            for column in ["val", "se", "sample_size"]:
+                df["missing_" + column] = pd.array(
+                    rng.choice([Nans.NOT_MISSING, Nans.OTHER, None], n), dtype="Int64")
+        return df
+
+    @pytest.mark.parametrize("before_missing,after_missing",
+                             [(True, True), (False, False), (False, True)])
+    def test_sorted_matches_unsorted(self, tmp_path, before_missing, after_missing):
+        rng = np.random.default_rng(0)
+        geo_ids = np.array([f"{i:05d}" for i in range(300)])
+        before = self._random_export(
+            rng, np.sort(rng.choice(geo_ids, 200, replace=False)), before_missing)
+        after = self._random_export(
+            rng, np.sort(rng.choice(geo_ids, 200, replace=False)), after_missing)
+
+        before.to_csv(join(tmp_path, "before.csv"), index=False)
+        after.to_csv(join(tmp_path, "after.csv"), index=False)
+        sorted_diffs = diff_export_csv(join(tmp_path, "before.csv"), join(tmp_path, "after.csv"))
+
+        # Shuffled files take the pandas path
+        before.sample(frac=1, random_state=1).to_csv(join(tmp_path, "before.csv"), index=False)
+        after.sample(frac=1, random_state=2).to_csv(join(tmp_path, "after.csv"), index=False)
+        unsorted_diffs = diff_export_csv(
+            join(tmp_path, "before.csv"), join(tmp_path, "after.csv"))
+
+        assert len(sorted_diffs[1]) > 0
+        for sorted_df, unsorted_df in zip(sorted_diffs, unsorted_diffs):
+            assert_frame_equal(sorted_df, unsorted_df.sort_index())
+
 class ArchiveDifferTestlike:
     def set_up(self, tmp_path):
         cache_dir = join(str(tmp_path), "cache")
@@ -285,6 +328,76 @@ class TestArchiveDiffer(ArchiveDifferTestlike):
         # Check exports directory just has incremental changes
         self.check_filtered_exports(export_dir)
 
+    @pytest.mark.parametrize("diff_pool", ["thread", "process"])
+    def test_diff_exports_parallel(self, tmp_path, diff_pool):
+        cache_dir, export_dir = self.set_up(tmp_path)
+        for csv_name, dfs in CSVS.items():
+            if dfs.before is not None:
+                dfs.before.to_csv(join(cache_dir, f"{csv_name}.csv"), index=False)
+            if dfs.after is not None:
+                dfs.after.to_csv(join(export_dir, f"{csv_name}.csv"), index=False)
+
+        arch_diff = ArchiveDiffer(cache_dir, export_dir, diff_workers=3, diff_pool=diff_pool)
+        arch_diff._cache_updated = True
+        mock_logger = mock.Mock()
+        deleted_files, common_diffs, new_files = arch_diff.diff_exports(mock_logger)
+
+        assert set(deleted_files) == {join(cache_dir, f) for f in EXPECTEDS.deleted}
+        assert list(common_diffs.keys()) == sorted(
+            join(export_dir, csv_name) for csv_name in EXPECTEDS.common_diffs)
+        assert all(
+            common_diffs[join(export_dir, csv_name)] ==
+            (None if diff_name is None else join(export_dir, diff_name))
+            for csv_name, diff_name in EXPECTEDS.common_diffs.items()
+        )
+        assert set(new_files) == {join(export_dir, f) for f in EXPECTEDS.new}
+        assert set(listdir(export_dir)) == set(EXPECTEDS.diffed_exports)
+        # One timing entry per common file
+        assert mock_logger.debug.call_count == len(EXPECTEDS.common_diffs)
+
+    def test_invalid_diff_pool(self):
+        with pytest.raises(AssertionError):
+            ArchiveDiffer("cache", "export", diff_workers=2, diff_pool="fiber")
+
+    def test_diff_exports_with_manifests(self, tmp_path):
+        cache_dir, export_dir = self.set_up(tmp_path)
+        same = CSVS["unchanged"].before
+        changed = CSVS["mod_2_del_3_add_4"]
+        same.to_csv(join(cache_dir, "same.csv"), index=False)
+        same.to_csv(join(export_dir, "same.csv"), index=False)
+        changed.before.to_csv(join(cache_dir, "changed.csv"), index=False)
+        changed.after.to_csv(join(export_dir, "changed.csv"), index=False)
+        for directory in [cache_dir, export_dir]:
+            manifest = Manifest(directory)
+            manifest.record("same.csv")
+            manifest.record("changed.csv")
+            manifest.save()
+
+        arch_diff = ArchiveDiffer(cache_dir, export_dir)
+        arch_diff._cache_updated = True
+        with mock.patch("delphi_utils.archive.filecmp.cmp") as mock_cmp:
+            _, common_diffs, _ = arch_diff.diff_exports()
+        # Both files are compared by their recorded hashes only
+        mock_cmp.assert_not_called()
+        assert common_diffs[join(export_dir, "same.csv")] is None
+        assert common_diffs[join(export_dir, "changed.csv")] == \
+            join(export_dir, "changed.csv.diff")
+
+        # An out of date manifest entry falls back to comparing the files
+        changed.before.to_csv(join(export_dir, "same.csv"), index=False)
+        _, common_diffs, _ = arch_diff.diff_exports()
+        assert common_diffs[join(export_dir, "same.csv")] == join(export_dir, "same.csv.diff")
+
+    def test_archive_records_manifest(self, tmp_path):
+        cache_dir, export_dir = self.set_up(tmp_path)
+        CSVS["unchanged"].before.to_csv(join(export_dir, "csv1.csv"), index=False)
+
+        arch_diff = FilesystemArchiveDiffer(cache_dir, export_dir)
+        arch_diff.archive_exports([join(export_dir, "csv1.csv")])
+
+        assert Manifest(cache_dir).get("csv1.csv") is not None
+        assert set(listdir(cache_dir)) == {"csv1.csv", MANIFEST_FILE}
+
 AWS_CREDENTIALS = {
     "aws_access_key_id": "FAKE_TEST_ACCESS_KEY_ID",
     "aws_secret_access_key": "FAKE_TEST_SECRET_ACCESS_KEY",
@@ -328,7 +441,51 @@ class TestS3ArchiveDiffer(ArchiveDifferTestlike):
 
         # Should download csv2 into cache folder
         arch_diff.update_cache()
-        assert set(listdir(cache_dir)) == {"csv1.csv", "csv2.csv"}
+        assert set(listdir(cache_dir)) == {"csv1.csv", "csv2.csv", MANIFEST_FILE}
+
+    @mock_s3
+    @pytest.mark.parametrize("transfer_workers", [1, 4])
+    def test_update_cache_stale(self, tmp_path, transfer_workers):
+        s3_client = Session(**AWS_CREDENTIALS).client("s3")
+        cache_dir, export_dir = self.set_up(tmp_path)
+        s3_client.create_bucket(Bucket=self.bucket_name)
+
+        before = CSVS["mod_2_del_3_add_4"].before
+        after = CSVS["mod_2_del_3_add_4"].after
+        for i in range(5):
+            csv_buf = StringIO()
+            before.to_csv(csv_buf, index=False)
+            s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=f"{self.indicator_prefix}/csv{i}.csv",
+                Body=BytesIO(csv_buf.getvalue().encode()))
+
+        arch_diff = S3ArchiveDiffer(
+            cache_dir, export_dir,
+            self.bucket_name, self.indicator_prefix,
+            AWS_CREDENTIALS, transfer_workers=transfer_workers)
+        arch_diff.update_cache()
+        assert set(listdir(cache_dir)) == {f"csv{i}.csv" for i in range(5)} | {MANIFEST_FILE}
+
+        # Replace one object in the bucket; only that one should be downloaded again
+        csv_buf = StringIO()
+        after.to_csv(csv_buf, index=False)
+        s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=f"{self.indicator_prefix}/csv3.csv",
+            Body=BytesIO(csv_buf.getvalue().encode()))
+        with mock.patch("builtins.print") as mock_print:
+            arch_diff.update_cache()
+        mock_print.assert_called_once_with(f"Updating cache with {join(cache_dir, 'csv3.csv')}")
+        assert_frame_equal(pd.read_csv(join(cache_dir, "csv3.csv"), dtype=CSV_DTYPES), after)
+
+        # Archived files are recorded with their ETags, so they are not downloaded again
+        after.to_csv(join(export_dir, "csv0.csv"), index=False)
+        arch_diff.archive_exports([join(export_dir, "csv0.csv")])
+        with mock.patch("builtins.print") as mock_print:
+            arch_diff.update_cache()
+        mock_print.assert_not_called()
+        assert_frame_equal(pd.read_csv(join(cache_dir, "csv0.csv"), dtype=CSV_DTYPES), after)
 
     @mock_s3
     def test_archive_exports(self, tmp_path):
@@ -360,7 +517,8 @@ class TestS3ArchiveDiffer(ArchiveDifferTestlike):
         assert_frame_equal(pd.read_csv(body, dtype=CSV_DTYPES), csv1)
 
     @mock_s3
-    def test_run(self, tmp_path):
+    @pytest.mark.parametrize("transfer_workers", [1, 4])
+    def test_run(self, tmp_path, transfer_workers):
         s3_client = Session(**AWS_CREDENTIALS).client("s3")
         cache_dir, export_dir = self.set_up(tmp_path)
 
@@ -382,7 +540,7 @@ class TestS3ArchiveDiffer(ArchiveDifferTestlike):
         arch_diff = S3ArchiveDiffer(
             cache_dir, export_dir,
             self.bucket_name, self.indicator_prefix,
-            AWS_CREDENTIALS)
+            AWS_CREDENTIALS, transfer_workers=transfer_workers)
         arch_diff.run()
 
         # Check that the buckets now contain the exported files.
@@ -432,6 +590,18 @@ class TestGitArchiveDiffer(ArchiveDifferTestlike):
         arch_diff2.update_cache()
         assert arch_diff2._cache_updated
 
+    def test_update_cache_ignores_manifest(self, tmp_path):
+        cache_dir, export_dir = self.set_up(tmp_path)
+
+        Repo.init(cache_dir)
+        with open(join(cache_dir, MANIFEST_FILE), "w") as f:
+            f.write("{}")
+
+        arch_diff = GitArchiveDiffer(
+            cache_dir, export_dir, override_dirty=False)
+        arch_diff.update_cache()
+        assert arch_diff._cache_updated
+
     def test_diff_exports(self, tmp_path):
         cache_dir, export_dir = self.set_up(tmp_path)
 
@@ -546,7 +716,8 @@ class TestGitArchiveDiffer(ArchiveDifferTestlike):
         assert set(fails) == {join(export_dir, "csv2.csv")}
         assert repo.active_branch.set_commit("HEAD~1").commit == orig_commit
 
-    def test_run(self, tmp_path):
+    @pytest.mark.parametrize("batched", [False, True])
+    def test_run(self, tmp_path, batched):
         cache_dir, export_dir = self.set_up(tmp_path)
 
         branch_name = "test-branch"
@@ -566,7 +737,8 @@ class TestGitArchiveDiffer(ArchiveDifferTestlike):
         # Create and run differ.
         arch_diff = GitArchiveDiffer(
             cache_dir, export_dir,
-            branch_name=branch_name, override_dirty=True)
+            branch_name=branch_name, override_dirty=True,
+            batched=batched, copy_workers=3)
         arch_diff.run()
 
         # Check that the archive branch contains 'after' files.
@@ -579,6 +751,236 @@ class TestGitArchiveDiffer(ArchiveDifferTestlike):
         # Check exports directory just has incremental changes
         self.check_filtered_exports(export_dir)
 
+    def test_archive_exports_batched(self, tmp_path):
+        cache_dir, export_dir = self.set_up(tmp_path)
+
+        repo = Repo.init(cache_dir)
+        repo.index.commit(message="Initial commit")
+        orig_commit = repo.active_branch.commit
+
+        exported_files = []
+        for i in range(5):
+            CSVS["unchanged"].before.to_csv(join(export_dir, f"csv{i}.csv"), index=False)
+            exported_files.append(join(export_dir, f"csv{i}.csv"))
+
+        arch_diff = GitArchiveDiffer(cache_dir, export_dir, override_dirty=True,
+                                     commit_partial_success=True, batched=True, copy_workers=3)
+        succs, fails = arch_diff.archive_exports(
+            exported_files + [join(export_dir, "missing.csv")])
+        assert set(succs) == set(exported_files)
+        assert set(fails) == {join(export_dir, "missing.csv")}
+
+        # A single commit holds all archived files
+        assert repo.active_branch.commit.parents == (orig_commit,)
+        assert {blob.path for blob in repo.active_branch.commit.tree.blobs} == \
+            {f"csv{i}.csv" for i in range(5)}
+        assert not repo.is_dirty()
+
+    def test_update_cache_sparse_checkout(self, tmp_path):
+        cache_dir, export_dir = self.set_up(tmp_path)
+        other_dir = join(str(tmp_path), "other")
+        mkdir(other_dir)
+
+        repo = Repo.init(str(tmp_path))
+        with open(join(other_dir, "unrelated.txt"), "w") as f:
+            f.write("123")
+        CSVS["unchanged"].before.to_csv(join(cache_dir, "csv1.csv"), index=False)
+        repo.index.add([join(other_dir, "unrelated.txt"), join(cache_dir, "csv1.csv")])
+        repo.index.commit(message="Initial commit")
+
+        arch_diff = GitArchiveDiffer(cache_dir, export_dir, sparse_checkout=True)
+        arch_diff.update_cache()
+        assert listdir(cache_dir) == ["csv1.csv"]
+        assert not exists(join(other_dir, "unrelated.txt"))
+        assert arch_diff._sparse_checkout_enabled()
+
+        # The sparse checkout does not outlive runs that do not ask for it
+        arch_diff = GitArchiveDiffer(cache_dir, export_dir)
+        arch_diff.update_cache()
+        assert exists(join(other_dir, "unrelated.txt"))
+        assert not arch_diff._sparse_checkout_enabled()
+
+    def test_update_cache_keeps_other_sparse_checkout(self, tmp_path):
+        cache_dir, export_dir = self.set_up(tmp_path)
+        other_dir = join(str(tmp_path), "other")
+        mkdir(other_dir)
+
+        repo = Repo.init(str(tmp_path))
+        with open(join(other_dir, "unrelated.txt"), "w") as f:
+            f.write("123")
+        CSVS["unchanged"].before.to_csv(join(cache_dir, "csv1.csv"), index=False)
+        repo.index.add([join(other_dir, "unrelated.txt"), join(cache_dir, "csv1.csv")])
+        repo.index.commit(message="Initial commit")
+
+        # A sparse checkout the differ did not set up is left in place
+        repo.git.sparse_checkout("set", "other")
+        arch_diff = GitArchiveDiffer(cache_dir, export_dir)
+        arch_diff.update_cache()
+        assert arch_diff._sparse_checkout_enabled()
+        assert repo.git.sparse_checkout("list") == "other"
+
+        # So is one the differ set up, but was changed since
+        GitArchiveDiffer(cache_dir, export_dir, sparse_checkout=True).update_cache()
+        repo.git.sparse_checkout("set", "other")
+        arch_diff.update_cache()
+        assert arch_diff._sparse_checkout_enabled()
+        assert repo.git.sparse_checkout("list") == "other"
+
+class TestParquetArchiveDiffer(ArchiveDifferTestlike):
+    # Export files are named by date, geo type and signal
+    NAMES = {csv_name: f"2020080{i + 1}_state_sig.csv" for i, csv_name in enumerate(CSVS)}
+
+    def write_cache(self, cache_dir, export_dir, issue=20200801):
+        for csv_name, dfs in CSVS.items():
+            if dfs.before is not None:
+                dfs.before.to_csv(join(export_dir, self.NAMES[csv_name]), index=False)
+        arch_diff = ParquetArchiveDiffer(cache_dir, export_dir, issue=issue)
+        arch_diff.archive_exports(
+            [join(export_dir, self.NAMES[csv_name]) for csv_name, dfs in CSVS.items()
+             if dfs.before is not None])
+        for f in listdir(export_dir):
+            remove(join(export_dir, f))
+
+    def write_exports(self, export_dir):
+        for csv_name, dfs in CSVS.items():
+            if dfs.after is not None:
+                dfs.after.to_csv(join(export_dir, self.NAMES[csv_name]), index=False)
+
+    def test_diff_exports(self, tmp_path):
+        cache_dir, export_dir = self.set_up(tmp_path)
+        self.write_cache(cache_dir, export_dir)
+        self.write_exports(export_dir)
+        assert listdir(cache_dir) == ["sig.parquet"]
+
+        arch_diff = ParquetArchiveDiffer(cache_dir, export_dir, issue=20200802)
+        arch_diff.update_cache()
+        mock_logger = mock.Mock()
+        deleted_files, common_diffs, new_files = arch_diff.diff_exports(mock_logger)
+
+        assert deleted_files == [join(cache_dir, self.NAMES[f.replace(".csv", "")])
+                                 for f in EXPECTEDS.deleted]
+        assert common_diffs == {
+            join(export_dir, self.NAMES[csv_name.replace(".csv", "")]):
+                None if diff_name is None
+                else join(export_dir, self.NAMES[csv_name.replace(".csv", "")] + ".diff")
+            for csv_name, diff_name in EXPECTEDS.common_diffs.items()}
+        assert new_files == [join(export_dir, self.NAMES[f.replace(".csv", "")])
+                             for f in EXPECTEDS.new]
+        # One timing entry per signal
+        assert mock_logger.debug.call_count == 1
+
+        for csv_name, diff_name in EXPECTEDS.common_diffs.items():
+            if diff_name is None:
+                continue
+            diff_file = join(export_dir, self.NAMES[csv_name.replace(".csv", "")] + ".diff")
+            _assert_frames_equal_ignore_row_order(
+                pd.read_csv(diff_file, dtype=CSV_DTYPES),
+                CSVS[csv_name.replace(".csv", "")].diff,
+                index_cols=["geo_id"]
+            )
+
+    def test_run(self, tmp_path):
+        cache_dir, export_dir = self.set_up(tmp_path)
+        self.write_cache(cache_dir, export_dir)
+        self.write_exports(export_dir)
+
+        earlier_partition = join(cache_dir, "sig.parquet", "issue=20200801", "part-0.parquet")
+        earlier_mtime = stat(earlier_partition).st_mtime_ns
+
+        arch_diff = ParquetArchiveDiffer(cache_dir, export_dir, issue=20200802)
+        arch_diff.run()
+
+        # The run appends a partition for its issue, without rewriting earlier issues
+        assert sorted(listdir(join(cache_dir, "sig.parquet"))) == \
+            ["issue=20200801", "issue=20200802"]
+        assert stat(earlier_partition).st_mtime_ns == earlier_mtime
+
+        # Check exports directory just has incremental changes
+        assert set(listdir(export_dir)) == {
+            self.NAMES[f.replace(".csv", "").replace(".diff", "")]
+            for f in EXPECTEDS.filtered_exports}
+
+        # Earlier issues are kept, and the latest issue of each file holds its exported rows
+        store = arch_diff.read_store("sig", latest=False)
+        assert set(store["issue"]) == {20200801, 20200802}
+        latest = arch_diff.read_store("sig")
+        for csv_name, dfs in CSVS.items():
+            time_value = self.NAMES[csv_name][:8]
+            cached = latest[latest["time_value"] == time_value]
+            if dfs.after is None:
+                # Deleted files keep their cached version
+                assert set(cached["issue"]) == {20200801}
+                continue
+            assert set(cached["issue"]) == {20200801 if dfs.diff is EMPTY else 20200802}
+            assert list(cached["geo_id"]) == list(dfs.after["geo_id"])
+            assert np.allclose(cached["val"], dfs.after["val"], atol=1e-7)
+
+        # A second run against the updated store finds no changes
+        self.write_exports(export_dir)
+        _, common_diffs, new_files = arch_diff.diff_exports()
+        assert new_files == []
+        assert all(diff is None for diff in common_diffs.values())
+
+    @pytest.mark.parametrize("diff_pool", ["thread", "process"])
+    def test_diff_exports_workers(self, tmp_path, diff_pool):
+        cache_dir, export_dir = self.set_up(tmp_path)
+        for signal in ["sig_a", "sig_b"]:
+            CSVS["mod_2_del_3_add_4"].before.to_csv(
+                join(export_dir, f"20200801_state_{signal}.csv"), index=False)
+        ParquetArchiveDiffer(cache_dir, export_dir, issue=20200801).archive_exports(
+            [join(export_dir, f) for f in listdir(export_dir)])
+        for signal in ["sig_a", "sig_b"]:
+            CSVS["mod_2_del_3_add_4"].after.to_csv(
+                join(export_dir, f"20200801_state_{signal}.csv"), index=False)
+
+        arch_diff = ParquetArchiveDiffer(cache_dir, export_dir, diff_workers=2,
+                                         diff_pool=diff_pool, issue=20200802)
+        arch_diff.update_cache()
+        mock_logger = mock.Mock()
+        _, common_diffs, _ = arch_diff.diff_exports(mock_logger)
+
+        assert mock_logger.debug.call_count == 2
+        for signal in ["sig_a", "sig_b"]:
+            exported_file = join(export_dir, f"20200801_state_{signal}.csv")
+            assert common_diffs[exported_file] == exported_file + ".diff"
+            _assert_frames_equal_ignore_row_order(
+                pd.read_csv(exported_file + ".diff", dtype=CSV_DTYPES),
+                CSVS["mod_2_del_3_add_4"].diff,
+                index_cols=["geo_id"]
+            )
+
+    def test_archive_same_issue(self, tmp_path):
+        cache_dir, export_dir = self.set_up(tmp_path)
+        exported_file = join(export_dir, "20200801_state_sig.csv")
+        arch_diff = ParquetArchiveDiffer(cache_dir, export_dir, issue=20200801)
+
+        CSVS["mod_2_del_3_add_4"].before.to_csv(exported_file, index=False)
+        arch_diff.archive_exports([exported_file])
+        CSVS["mod_2_del_3_add_4"].after.to_csv(exported_file, index=False)
+        arch_diff.archive_exports([exported_file])
+
+        # The second archive of the day replaces the first
+        store = arch_diff.read_store("sig", latest=False)
+        assert list(store["geo_id"]) == ["1", "2", "4"]
+        assert set(store["issue"]) == {20200801}
+
+    def test_archive_unparseable(self, tmp_path):
+        cache_dir, export_dir = self.set_up(tmp_path)
+        CSVS["unchanged"].after.to_csv(join(export_dir, "unchanged.csv"), index=False)
+
+        arch_diff = ParquetArchiveDiffer(cache_dir, export_dir)
+        arch_diff.update_cache()
+        _, common_diffs, new_files = arch_diff.diff_exports()
+        assert common_diffs == {}
+        assert new_files == [join(export_dir, "unchanged.csv")]
+
+        succs, fails = arch_diff.archive_exports(
+            new_files + [join(export_dir, "20200801_state_sig.csv")])
+        assert succs == []
+        assert set(fails) == {join(export_dir, "unchanged.csv"),
+                              join(export_dir, "20200801_state_sig.csv")}
+        assert listdir(cache_dir) == []
+
 class TestFromParams:
     """Tests for creating archive differs from params."""
 
@@ -696,6 +1098,25 @@ class TestFromParams:
             cache_dir="cache"
         )
 
+    @mock.patch("delphi_utils.archive.ParquetArchiveDiffer")
+    def test_get_parquet_archiver(self, mock_archiver):
+        """Test that ParquetArchiveDiffer is created successfully."""
+        params = {
+            "common": {
+                "export_dir": "dir"
+            },
+            "archive": {
+                "cache_dir": "cache",
+                "store": "parquet"
+            }
+        }
+
+        archiver_from_params(params)
+        mock_archiver.assert_called_once_with(
+            export_dir="dir",
+            cache_dir="cache"
+        )
+
     def test_get_filesystem_archiver_with_extra_params(self):
         """Test that FilesystemArchiveDiffer is not created with extra parameters."""
         params = {
@@ -1,15 +1,18 @@
 """Tests for exporting CSV files."""
 from datetime import datetime
-from os import listdir, remove
+from os import listdir, remove, stat, utime
 from os.path import join
+import tempfile
 from typing import Any, Dict, List
 
 import mock
 import numpy as np
 import pandas as pd
+import pytest
 from pandas.testing import assert_frame_equal
 
 from delphi_utils import create_export_csv, Nans
+from delphi_utils.manifest import MANIFEST_FILE, Manifest, hash_file
 
 
 def _clean_directory(directory):
@@ -430,3 +433,139 @@ class TestExport:
         })
         sorted_csv = _set_df_dtypes(pd.read_csv(join(self.TEST_DIR, "20200215_county_test.csv")), dtypes={"geo_id": str})
         assert_frame_equal(sorted_csv,expected_df)
+
+    def test_export_shuffled_rows(self):
+        """Test that rows out of date order are written in their original order per date."""
+        _clean_directory(self.TEST_DIR)
+        shuffled_df = self.DF.iloc[[3, 1, 2, 0]]
+        original = shuffled_df.copy()
+        create_export_csv(
+            df=shuffled_df,
+            export_dir=self.TEST_DIR,
+            geo_res="county",
+            sensor="test",
+        )
+        assert_frame_equal(shuffled_df, original)
+        feb_15 = _set_df_dtypes(pd.read_csv(join(self.TEST_DIR, "20200215_county_test.csv")),
+                                dtypes={"geo_id": str})
+        assert list(feb_15["geo_id"]) == ["51175", "51093"]
+        assert _non_ignored_files_set(self.TEST_DIR) == {
+            "20200215_county_test.csv",
+            "20200301_county_test.csv",
+            "20200315_county_test.csv",
+        }
+
+    def test_export_with_max_workers(self):
+        """Test that writing with a thread pool yields the same files as writing serially."""
+        _clean_directory(self.TEST_DIR)
+        dates = create_export_csv(
+            df=self.DF2,
+            export_dir=self.TEST_DIR,
+            geo_res="county",
+            sensor="test",
+            write_empty_days=True,
+        )
+        expected = {
+            fname: pd.read_csv(join(self.TEST_DIR, fname))
+            for fname in _non_ignored_files_set(self.TEST_DIR)
+        }
+
+        _clean_directory(self.TEST_DIR)
+        threaded_dates = create_export_csv(
+            df=self.DF2,
+            export_dir=self.TEST_DIR,
+            geo_res="county",
+            sensor="test",
+            write_empty_days=True,
+            max_workers=4,
+        )
+        assert (dates == threaded_dates).all()
+        assert _non_ignored_files_set(self.TEST_DIR) == set(expected)
+        for fname, expected_df in expected.items():
+            assert_frame_equal(pd.read_csv(join(self.TEST_DIR, fname)), expected_df)
+
+    def test_export_parquet(self):
+        """Test that the Parquet dataset holds the same rows as the CSV files."""
+        _clean_directory(self.TEST_DIR)
+        with tempfile.TemporaryDirectory() as parquet_dir:
+            create_export_csv(
+                df=self.DF2,
+                export_dir=parquet_dir,
+                geo_res="county",
+                sensor="test",
+                metric="deaths",
+                output_format="parquet",
+            )
+            dataset = pd.read_parquet(join(parquet_dir, "parquet"))
+        create_export_csv(
+            df=self.DF2,
+            export_dir=self.TEST_DIR,
+            geo_res="county",
+            sensor="test",
+            metric="deaths",
+        )
+
+        assert set(dataset["geo_res"]) == {"county"}
+        assert set(dataset["signal"]) == {"deaths_test"}
+        for date in ["20200215", "20200301", "20200315"]:
+            expected = _set_df_dtypes(
+                pd.read_csv(join(self.TEST_DIR, f"{date}_county_deaths_test.csv")),
+                dtypes={"geo_id": str})
+            partition = dataset[dataset["date"].astype(str) == date].drop(
+                columns=["geo_res", "signal", "date"]).reset_index(drop=True)
+            assert_frame_equal(partition, expected, check_dtype=False)
+
+    def test_export_direction(self):
+        """Test that a direction column is only written to the Parquet dataset."""
+        _clean_directory(self.TEST_DIR)
+        df = self.DF2.assign(direction=np.nan)
+        with tempfile.TemporaryDirectory() as parquet_dir:
+            create_export_csv(df=df, export_dir=parquet_dir, geo_res="county", sensor="test",
+                              output_format="parquet")
+            dataset = pd.read_parquet(join(parquet_dir, "parquet"))
+        create_export_csv(df=df, export_dir=self.TEST_DIR, geo_res="county", sensor="test")
+
+        assert list(dataset.columns[:4]) == ["geo_id", "val", "se", "direction"]
+        csv = pd.read_csv(join(self.TEST_DIR, "20200215_county_test.csv"))
+        assert "direction" not in csv.columns
+
+    def test_export_unsupported_format(self):
+        """Test that an unknown output format is rejected."""
+        with pytest.raises(ValueError):
+            create_export_csv(
+                df=self.DF,
+                export_dir=self.TEST_DIR,
+                geo_res="county",
+                sensor="test",
+                output_format="feather",
+            )
+
+    def test_export_with_manifest(self):
+        """Test that hashes are recorded and files with the same contents are left in place."""
+        _clean_directory(self.TEST_DIR)
+        create_export_csv(df=self.DF, export_dir=self.TEST_DIR, geo_res="county", sensor="test",
+                          record_hashes=True)
+        exported = Manifest(self.TEST_DIR)
+        before = _non_ignored_files_set(self.TEST_DIR)
+        for fname in before:
+            assert exported.get(fname) == hash_file(join(self.TEST_DIR, fname))
+            # Backdate the files, to tell rewritten files apart
+            utime(join(self.TEST_DIR, fname), ns=(0, 0))
+            exported.record(fname)
+        exported.save()
+
+        changed_df = self.DF.copy()
+        changed_df.loc[3, "val"] = 5.0
+        create_export_csv(df=changed_df, export_dir=self.TEST_DIR, geo_res="county",
+                          sensor="test", record_hashes=True)
+
+        # Every file is still exported, but only the file for the changed date is rewritten
+        assert before == _non_ignored_files_set(self.TEST_DIR)
+        rewritten = {fname for fname in before
+                     if stat(join(self.TEST_DIR, fname)).st_mtime_ns != 0}
+        assert rewritten == {"20200315_county_test.csv"}
+        exported = Manifest(self.TEST_DIR)
+        assert exported.get("20200315_county_test.csv") == \
+            hash_file(join(self.TEST_DIR, "20200315_county_test.csv"))
+        assert pd.read_csv(join(self.TEST_DIR, "20200315_county_test.csv"))["val"][0] == 5.0
+        remove(join(self.TEST_DIR, MANIFEST_FILE))
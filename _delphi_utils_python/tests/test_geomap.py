@@ -1,3 +1,5 @@
+from unittest import mock
+
 from delphi_utils.geomap import GeoMapper
 
 import pytest
@@ -395,3 +397,219 @@ class TestGeoMapper:
         df = pd.DataFrame({"fips": ["01001"]})
         assert geomapper.add_population_column(df, "fips").population[0] == 56145
         assert geomapper_2019.add_population_column(df, "fips").population[0] == 55869
+
+    def test_crosswalk_cache(self, tmp_path):
+        uncached = GeoMapper(cache_dir=None)
+        cold = GeoMapper(cache_dir=str(tmp_path))
+        assert not cold._crosswalks
+        pd.testing.assert_frame_equal(cold.get_crosswalk("zip", "fips"),
+                                      uncached.get_crosswalk("zip", "fips"))
+        assert (tmp_path / "2020" / "zip_fips.npz").exists()
+        assert set(cold._crosswalks.keys()) == {"zip"}
+
+        warm = GeoMapper(cache_dir=str(tmp_path))
+        pd.testing.assert_frame_equal(warm.get_crosswalk("zip", "fips"),
+                                      uncached.get_crosswalk("zip", "fips"))
+        assert warm.get_geo_values("zip") == uncached.get_geo_values("zip")
+
+        # A cache built from a different source CSV is ignored and rebuilt
+        cache_path = str(tmp_path / "2020" / "zip_fips.npz")
+        assert GeoMapper._read_crosswalk_cache(cache_path, "stale") is None
+        # The cache is validated without reading the source CSV
+        with mock.patch("pkg_resources.resource_string") as resource_string:
+            GeoMapper(cache_dir=str(tmp_path)).get_crosswalk("zip", "fips")
+            resource_string.assert_not_called()
+        with pytest.raises(ValueError):
+            warm.get_crosswalk("zip", "county")
+
+    def test_default_cache_dir(self, tmp_path, monkeypatch):
+        gmpr = GeoMapper()
+        monkeypatch.setenv(GeoMapper.CACHE_DIR_ENV_VAR, str(tmp_path / "geomap"))
+        gmpr.get_crosswalk("state", "state")
+        assert (tmp_path / "geomap" / "2020" / "state_state.npz").exists()
+
+    def test_get_crosswalk_copy(self):
+        gmpr = GeoMapper.get_shared()
+        crosswalk = gmpr.get_crosswalk("fips", "pop")
+        crosswalk.columns = ["geo", "pop"]
+        crosswalk.loc[0, "pop"] = -1
+        assert list(gmpr.get_crosswalk("fips", "pop").columns) == ["fips", "pop"]
+        assert (gmpr.get_crosswalk("fips", "pop")["pop"] >= 0).all()
+
+    def test_get_shared(self):
+        gmpr = GeoMapper.get_shared()
+        assert GeoMapper.get_shared(2020) is gmpr
+        assert GeoMapper.get_shared(2019) is not gmpr
+        assert GeoMapper.get_shared(2019).census_year == 2019
+
+    def test_freeze(self, geomapper):
+        frozen = GeoMapper(cache_dir=None).freeze()
+        for from_code, to_codes in GeoMapper.CROSSWALK_FILENAMES.items():
+            assert set(frozen._crosswalks[from_code].keys()) == set(to_codes.keys())
+        assert set(frozen._geo_sets.keys()) == frozen._geos
+        assert frozen.get_geo_values("fips") == geomapper.get_geo_values("fips")
+
+    @pytest.mark.parametrize("from_code,new_code,data_attr", [
+        ("fips", "state_id", "fips_data_3"),
+        ("fips", "hrr", "fips_data_3"),
+        ("fips", "msa", "fips_data_2"),
+        ("fips", "hhs", "fips_data_4"),
+        ("fips", "zip", "fips_data_5"),
+        ("fips", "chng-fips", "fips_data_5"),
+        ("fips", "nation", "fips_data_5"),
+        ("zip", "fips", "zip_data"),
+        ("zip", "hrr", "zip_data"),
+        ("zip", "state_code", "zip_data"),
+        ("zip", "hhs", "zip_data"),
+        ("zip", "nation", "zip_data"),
+    ])
+    def test_replace_geocode_sparse(self, geomapper, from_code, new_code, data_attr):
+        df = getattr(self, data_attr)
+        pd.testing.assert_frame_equal(
+            geomapper.replace_geocode(df, from_code, new_code, engine="sparse"),
+            geomapper.replace_geocode(df, from_code, new_code),
+        )
+        pd.testing.assert_frame_equal(
+            geomapper.replace_geocode(df.drop(columns="timestamp"), from_code, new_code,
+                                      date_col=None, engine="sparse"),
+            geomapper.replace_geocode(df.drop(columns="timestamp"), from_code, new_code,
+                                      date_col=None),
+        )
+        pd.testing.assert_frame_equal(
+            geomapper.replace_geocode(df, from_code, new_code, data_cols=["count"],
+                                      engine="sparse"),
+            geomapper.replace_geocode(df, from_code, new_code, data_cols=["count"]),
+        )
+
+    def test_replace_geocode_sparse_state_codes(self, geomapper):
+        df = geomapper.replace_geocode(self.zip_data, "zip", "state_code")
+        pd.testing.assert_frame_equal(
+            geomapper.replace_geocode(df, "state_code", "state_id", engine="sparse"),
+            geomapper.replace_geocode(df, "state_code", "state_id"),
+        )
+        pd.testing.assert_frame_equal(
+            geomapper.replace_geocode(df, "state_code", "hhs", engine="sparse"),
+            geomapper.replace_geocode(df, "state_code", "hhs"),
+        )
+        with pytest.raises(ValueError):
+            geomapper.replace_geocode(df, "state_code", "hhs", engine="numba")
+
+    def test_fan_out(self, geomapper):
+        to_codes = ["state_id", "msa", "hrr", "hhs", "nation"]
+        outputs = geomapper.fan_out(self.fips_data_3, "fips", to_codes)
+        assert list(outputs.keys()) == to_codes
+        for to_code in to_codes:
+            pd.testing.assert_frame_equal(
+                outputs[to_code],
+                geomapper.replace_geocode(self.fips_data_3, "fips", to_code)
+            )
+
+        outputs = geomapper.fan_out(self.zip_data, "zip", ["fips", "state_code"],
+                                    new_col="geo_id", data_cols=["count"])
+        pd.testing.assert_frame_equal(
+            outputs["fips"],
+            geomapper.replace_geocode(self.zip_data, "zip", "fips", new_col="geo_id",
+                                      data_cols=["count"])
+        )
+        assert "geo_id" in outputs["state_code"].columns
+
+    def test_fan_out_via_state(self, geomapper):
+        # 10999 has no state, so it is only dropped when aggregating through states
+        outputs = geomapper.fan_out(self.fips_data_3, "fips", ["hhs", "nation"], via_state=True)
+        pd.testing.assert_frame_equal(
+            outputs["hhs"], geomapper.replace_geocode(self.fips_data_3, "fips", "hhs")
+        )
+        nation = geomapper.replace_geocode(
+            self.fips_data_3[self.fips_data_3["fips"] != "10999"], "fips", "nation"
+        )
+        pd.testing.assert_frame_equal(outputs["nation"], nation)
+
+    def test_megacounty_vectorized(self, geomapper):
+        dates = pd.date_range("2020-01-01", periods=30)
+        data = pd.DataFrame({
+            "fips": ["01123"] * 30 + ["01125"] * 30 + ["18181"] * 30,
+            "timestamp": list(dates) * 3,
+            "visits": np.concatenate([np.arange(30), np.ones(30), np.full(30, 10.)]),
+            "count": np.arange(90),
+        })
+        data.loc[[3, 4, 40], "visits"] = np.nan
+        data = data.drop(index=[10, 11, 70]).reset_index(drop=True)
+
+        mega = geomapper.megacounty_creation(data, 20, 5)
+        expected = geomapper._megacounty_creation_groupby(
+            data, 20, 5, "visits", "fips", "timestamp", "megafips", None)
+        pd.testing.assert_series_equal(mega, expected)
+
+        # Appending days with the earlier rows as history matches the full recomputation
+        cutoff = dates[20]
+        old, new = data[data["timestamp"] < cutoff], data[data["timestamp"] >= cutoff]
+        pd.testing.assert_series_equal(
+            geomapper.megacounty_creation(new, 20, 5, history=old),
+            mega[mega.index.get_level_values("timestamp") >= cutoff]
+        )
+        full = geomapper.fips_to_megacounty(data, 20, 5)
+        pd.testing.assert_frame_equal(
+            geomapper.fips_to_megacounty(new, 20, 5, history=old),
+            full[full["timestamp"] >= cutoff].reset_index(drop=True)
+        )
+
+        # Dates with a time of day can't be laid out by day and use the groupby
+        shifted = data.assign(timestamp=data["timestamp"] + pd.Timedelta(hours=1))
+        assert geomapper._megacounty_codes(
+            shifted, 20, 5, "visits", "fips", "timestamp") is None
+        pd.testing.assert_frame_equal(
+            geomapper.fips_to_megacounty(shifted, 20, 5).drop(columns="timestamp"),
+            full.drop(columns="timestamp")
+        )
+
+    def test_encode_geo(self, geomapper):
+        fips_vocab = geomapper.get_geo_vocabulary("fips")
+        assert fips_vocab.is_monotonic_increasing
+        assert geomapper.get_geo_values("fips") <= set(fips_vocab)
+
+        codes = geomapper.encode_geo(["01123", "18181", None], "fips")
+        assert codes.dtype == np.int32
+        assert codes[2] == -1
+        decoded = geomapper.decode_geo(codes, "fips")
+        assert list(decoded[:2]) == ["01123", "18181"]
+        assert pd.isna(decoded[2])
+        with pytest.raises(ValueError, match="99999"):
+            geomapper.encode_geo([1123, 99999], "fips")
+
+        # Only the crosswalks involving the geo type are loaded
+        gmpr = GeoMapper(cache_dir=None)
+        gmpr.get_geo_vocabulary("hrr")
+        assert {(f, t) for f, ts in gmpr._crosswalks.items() for t in ts} == \
+            {("zip", "hrr"), ("fips", "hrr")}
+
+        cat = geomapper.encode_geo(["ca", "pa"], "state_id", as_categorical=True)
+        assert list(cat.categories) == list(geomapper.get_geo_vocabulary("state_id"))
+        assert list(geomapper.decode_geo(cat, "state_id")) == ["ca", "pa"]
+        assert list(geomapper.encode_geo([1, 42], "state_code", as_categorical=True)) == \
+            ["01", "42"]
+
+    @pytest.mark.parametrize("engine", ["pandas", "sparse"])
+    def test_replace_geocode_categorical(self, geomapper, engine):
+        expected = geomapper.replace_geocode(self.zip_data, "zip", "hrr")
+        result = geomapper.replace_geocode(self.zip_data, "zip", "hrr", engine=engine,
+                                           categorical=True)
+        assert isinstance(result["hrr"].dtype, pd.CategoricalDtype)
+        pd.testing.assert_frame_equal(result.astype({"hrr": object}), expected)
+
+        result = geomapper.fan_out(self.zip_data, "zip", ["fips", "nation"], categorical=True)
+        assert list(result["nation"]["nation"].cat.categories) == ["us"]
+        pd.testing.assert_frame_equal(result["fips"].astype({"fips": object}),
+                                      geomapper.replace_geocode(self.zip_data, "zip", "fips"))
+
+    def test_get_geos_within_many(self, geomapper):
+        within = geomapper.get_geos_within_many(["4", "9", "11"], "state", "hhs")
+        assert within["4"] == geomapper.get_geos_within("4", "state", "hhs")
+        assert within["9"] == {"az", "ca", "hi", "nv", "as", "gu", "mp", "pw"}
+        assert within["11"] == set()
+        within = geomapper.get_geos_within_many(["al", "pa"], "county", "state")
+        assert len(within["al"]) == 68
+        assert within["pa"] == geomapper.get_geos_within("pa", "fips", "state")
+        with pytest.raises(ValueError):
+            geomapper.get_geos_within_many(["us"], "hrr", "nation")
+        with pytest.raises(ValueError):
+            geomapper.get_geos_within("ca", "state", "nation")
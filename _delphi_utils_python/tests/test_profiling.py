@@ -0,0 +1,116 @@
+"""Tests for profiling.py."""
+import json
+import threading
+import tracemalloc
+from unittest.mock import Mock
+
+import numpy as np
+
+from delphi_utils.profiling import Profiler, get_profiler, profile, set_profiler
+
+
+class TestProfiler:
+    """Tests for Profiler and profile."""
+
+    def test_nested_spans(self):
+        logger = Mock()
+        profiler = Profiler(logger)
+
+        with profiler.span("indicator"):
+            with profiler.span("fit", geo="state"):
+                sum(range(1000))
+            with profiler.span("export"):
+                pass
+
+        assert [r["name"] for r in profiler.records] == ["fit", "export", "indicator"]
+        assert [r["parent"] for r in profiler.records] == ["indicator", "indicator", None]
+        assert profiler.records[0]["geo"] == "state"
+        for record in profiler.records:
+            assert record["elapsed_time_in_seconds"] >= 0
+            assert record["cpu_time_in_seconds"] >= 0
+            assert record["peak_rss_in_mb"] > 0
+            assert "peak_traced_memory_in_mb" not in record
+        assert logger.info.call_count == 3
+        assert logger.info.call_args.kwargs["span"] == "indicator"
+
+    def test_threads(self):
+        profiler = Profiler()
+        span = profiler.span("work")
+        barrier = threading.Barrier(2)
+
+        def work(name):
+            with profiler.span(name):
+                with span:
+                    # Both threads are inside their spans before either leaves them
+                    barrier.wait()
+                barrier.wait()
+
+        with profiler.span("indicator"):
+            threads = [threading.Thread(target=work, args=(name,)) for name in ["a", "b"]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # Spans only nest within the thread they were entered in
+        parents = sorted((r["name"], r["parent"]) for r in profiler.records)
+        assert parents == [("a", None), ("b", None), ("indicator", None),
+                           ("work", "a"), ("work", "b")]
+
+    def test_trace_memory(self):
+        profiler = Profiler(trace_memory=True)
+
+        with profiler.span("outer"):
+            with profiler.span("large"):
+                data = np.ones(2 ** 22)  # 32 MB
+                del data
+            with profiler.span("small"):
+                data = np.ones(2 ** 10)
+
+        peaks = {r["name"]: r["peak_traced_memory_in_mb"] for r in profiler.records}
+        assert peaks["large"] >= 32
+        assert peaks["small"] < 1
+        # The enclosing span includes the peak of its children
+        assert peaks["outer"] >= peaks["large"]
+
+    def test_trace_memory_without_reset_peak(self, monkeypatch):
+        # Python 3.8 has no tracemalloc.reset_peak()
+        monkeypatch.delattr(tracemalloc, "reset_peak", raising=False)
+        profiler = Profiler(trace_memory=True)
+
+        with profiler.span("outer"):
+            with profiler.span("large"):
+                data = np.ones(2 ** 22)  # 32 MB
+                del data
+            with profiler.span("small"):
+                data = np.ones(2 ** 10)
+
+        # The peaks are those since tracing started
+        peaks = {r["name"]: r["peak_traced_memory_in_mb"] for r in profiler.records}
+        assert peaks["large"] >= 32
+        assert peaks["small"] >= peaks["large"]
+        assert peaks["outer"] >= peaks["large"]
+        assert not tracemalloc.is_tracing()
+
+    def test_profile_installed(self, tmp_path):
+        @profile("decorated")
+        def add(a, b):
+            return a + b
+
+        profiler = Profiler()
+        previous = set_profiler(profiler)
+        try:
+            assert get_profiler() is profiler
+            assert add(1, 2) == 3
+            with profile("managed"):
+                add(3, 4)
+        finally:
+            set_profiler(previous)
+
+        assert get_profiler() is previous
+        assert [r["name"] for r in profiler.records] == ["decorated", "decorated", "managed"]
+        assert profiler.records[1]["parent"] == "managed"
+
+        profiler.write(tmp_path / "profile.json")
+        with open(tmp_path / "profile.json", encoding="utf-8") as f:
+            assert json.load(f)["spans"] == profiler.records
@@ -1,13 +1,34 @@
 """Tests for runner.py."""
 
+import json
+import time
+
 import mock
+import pandas as pd
 import pytest
 
+from delphi_utils.archive import FilesystemArchiveDiffer, _diff_export_file
+from delphi_utils.export import create_export_csv
+from delphi_utils.validator.datafetcher import read_filenames
 from delphi_utils.validator.report import ValidationReport
 from delphi_utils.validator.errors import ValidationFailure
 from delphi_utils.runner import run_indicator_pipeline
 
 
+def _slow_flash(params):
+    time.sleep(1)
+
+
+def _hanging_flash(params):
+    time.sleep(60)
+
+
+def _marking_flash(params):
+    time.sleep(1)
+    with open(params["flash"]["marker"], "w") as f:
+        f.write("done")
+
+
 @pytest.fixture
 def mock_indicator_fn():
     """Set up a mock indicator function."""
@@ -117,3 +138,150 @@ class TestRunIndicator:
         mock_indicator_fn.assert_called_once_with(self.PARAMS)
         mock_validator_fn.assert_called_once_with(self.PARAMS)
         mock_validator_fn.return_value.validate.assert_called_once()
+
+    @mock.patch("delphi_utils.runner.read_params")
+    def test_profile(self, mock_read_params, tmp_path,
+                     mock_indicator_fn, mock_flash_fn, mock_validator_fn, mock_archiver_fn):
+        """Test that the pipeline stages are profiled."""
+        profile_filename = str(tmp_path / "profile.json")
+        mock_read_params.return_value = {**self.PARAMS,
+                                         "common": {"profile_filename": profile_filename}}
+
+        run_indicator_pipeline(mock_indicator_fn, mock_flash_fn, mock_validator_fn, mock_archiver_fn)
+
+        with open(profile_filename, encoding="utf-8") as f:
+            spans = json.load(f)["spans"]
+        assert [span["name"] for span in spans] == \
+            ["indicator", "validation", "flash_wait", "archive"]
+        for span in spans:
+            assert span["elapsed_time_in_seconds"] >= 0
+            assert span["cpu_time_in_seconds"] >= 0
+
+    @mock.patch("delphi_utils.runner.read_params")
+    def test_background_flash(self, mock_read_params, mock_indicator_fn,
+                              mock_validator_fn, mock_archiver_fn):
+        """Test that flash runs in the background and the cache is updated before archiving."""
+        mock_read_params.return_value = self.PARAMS
+        archiver = mock_archiver_fn.return_value
+
+        start = time.time()
+        run_indicator_pipeline(mock_indicator_fn, _slow_flash, mock_validator_fn,
+                               mock_archiver_fn, timer=30)
+        # No polling delay after the flash process finishes
+        assert time.time() - start < 10
+
+        archiver.update_cache.assert_called_once()
+        archiver.run.assert_called_once()
+        mock_validator_fn.return_value.validate.assert_called_once()
+
+    @mock.patch("delphi_utils.runner.delete_move_files")
+    @mock.patch("delphi_utils.runner.read_params")
+    def test_failed_validation_cache_error(self, mock_read_params, mock_delete_move_files,
+                                           mock_indicator_fn, mock_validator_fn,
+                                           mock_archiver_fn):
+        """Test that exports failing validation are deleted even if the cache update fails."""
+        mock_read_params.return_value = self.PARAMS
+        report = mock_validator_fn.return_value.validate.return_value
+        report.add_raised_error(ValidationFailure("", "2020-10-10", ""))
+        archiver = mock_archiver_fn.return_value
+        archiver.update_cache.side_effect = AssertionError("There are uncommitted changes")
+
+        run_indicator_pipeline(mock_indicator_fn, validator_fn=mock_validator_fn,
+                               archiver_fn=mock_archiver_fn)
+
+        mock_delete_move_files.assert_called_once()
+        archiver.run.assert_not_called()
+
+    @mock.patch("delphi_utils.runner.read_params")
+    def test_cache_error(self, mock_read_params, mock_indicator_fn, mock_validator_fn,
+                         mock_archiver_fn):
+        """Test that a failed cache update stops the run before archiving."""
+        mock_read_params.return_value = self.PARAMS
+        archiver = mock_archiver_fn.return_value
+        archiver.update_cache.side_effect = AssertionError("There are uncommitted changes")
+
+        with pytest.raises(AssertionError):
+            run_indicator_pipeline(mock_indicator_fn, validator_fn=mock_validator_fn,
+                                   archiver_fn=mock_archiver_fn)
+        archiver.run.assert_not_called()
+
+    @pytest.mark.parametrize("valid", [True, False])
+    @mock.patch("delphi_utils.runner.delete_move_files")
+    @mock.patch("delphi_utils.runner.read_params")
+    def test_flash_before_exports_change(self, mock_read_params, mock_delete_move_files, valid,
+                                         tmp_path, mock_indicator_fn, mock_validator_fn,
+                                         mock_archiver_fn):
+        """Test that flash finishes before the exports are moved or archived."""
+        marker = tmp_path / "flash_done"
+        mock_read_params.return_value = {**self.PARAMS, "flash": {"marker": str(marker)}}
+        if not valid:
+            report = mock_validator_fn.return_value.validate.return_value
+            report.add_raised_error(ValidationFailure("", "2020-10-10", ""))
+        flash_done = []
+        mock_delete_move_files.side_effect = lambda: flash_done.append(marker.exists())
+        archiver = mock_archiver_fn.return_value
+        archiver.run.side_effect = lambda logger: flash_done.append(marker.exists())
+
+        run_indicator_pipeline(mock_indicator_fn, _marking_flash, mock_validator_fn,
+                               mock_archiver_fn, timer=30)
+
+        assert flash_done == [True]
+        assert mock_delete_move_files.called != valid
+        assert archiver.run.called == valid
+        # The cache is updated in the background of validation either way
+        archiver.update_cache.assert_called_once()
+
+    @mock.patch("delphi_utils.runner.read_params")
+    def test_flash_timeout(self, mock_read_params, mock_indicator_fn):
+        """Test that flash is stopped after the timer."""
+        mock_read_params.return_value = self.PARAMS
+
+        start = time.time()
+        run_indicator_pipeline(mock_indicator_fn, _hanging_flash, timer=1)
+        assert time.time() - start < 10
+
+    @mock.patch("delphi_utils.archive._diff_export_file", wraps=_diff_export_file)
+    @mock.patch("delphi_utils.runner.read_params")
+    def test_export_hashes(self, mock_read_params, mock_diff_export_file, tmp_path):
+        """Test that exports with recorded hashes are validated and archived in full."""
+        export_dir, cache_dir = tmp_path / "receiving", tmp_path / "cache"
+        export_dir.mkdir()
+        cache_dir.mkdir()
+        mock_read_params.return_value = {**self.PARAMS, "common": {"export_dir": str(export_dir)}}
+        df = pd.DataFrame({
+            "geo_id": ["01", "02"] * 3,
+            "timestamp": pd.to_datetime(["2020-03-01"] * 2 + ["2020-03-02"] * 2 +
+                                        ["2020-03-03"] * 2),
+            "val": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+            "se": [0.1] * 6,
+            "sample_size": [100.0] * 6,
+        })
+        validated = []
+
+        def indicator_fn(params):
+            create_export_csv(df, params["common"]["export_dir"], "state", "sig",
+                              record_hashes=True)
+
+        def validator_fn(params):
+            validator = mock.Mock()
+            validator.validate.side_effect = lambda: validated.append(sorted(
+                f for f, match in read_filenames(params["common"]["export_dir"]) if match
+            )) or ValidationReport([])
+            return validator
+
+        def archiver_fn(params):
+            return FilesystemArchiveDiffer(str(cache_dir), params["common"]["export_dir"])
+
+        run_indicator_pipeline(indicator_fn, validator_fn=validator_fn, archiver_fn=archiver_fn)
+        # Deliver the exports
+        for export_file in export_dir.glob("*.csv"):
+            export_file.unlink()
+        df.loc[2, "val"] = 7.0
+        run_indicator_pipeline(indicator_fn, validator_fn=validator_fn, archiver_fn=archiver_fn)
+
+        # The validator sees every file in both runs, and only the changed file is diffed
+        expected = ["20200301_state_sig.csv", "20200302_state_sig.csv", "20200303_state_sig.csv"]
+        assert validated == [expected, expected]
+        mock_diff_export_file.assert_called_once_with(str(cache_dir / "20200302_state_sig.csv"),
+                                                      str(export_dir / "20200302_state_sig.csv"),
+                                                      False)
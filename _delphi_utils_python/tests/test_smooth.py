@@ -3,11 +3,12 @@ Tests for the smoothing utility.
 Authors: Dmitry Shemetov, Addison Hu, Maria Jahja
 """
 from numpy.lib.polynomial import poly
+from unittest.mock import patch
 import pytest
 
 import numpy as np
 import pandas as pd
-from delphi_utils import Smoother
+from delphi_utils import IncrementalSmoother, Smoother
 
 
 class TestSmoothers:
@@ -63,6 +64,19 @@ class TestSmoothers:
         smoother = Smoother(smoother_name="left_gauss_linear", gaussian_bandwidth=0.1)
         assert np.allclose(smoother.smooth(signal)[1:], signal[1:])
 
+    @pytest.mark.parametrize("bandwidth", [0.1, 36, 144])
+    def test_left_gauss_linear_engines(self, bandwidth):
+        signal = np.cumsum(np.random.normal(0, 1, 300)) + 100
+        smoothers = [Smoother(smoother_name="left_gauss_linear", gaussian_bandwidth=bandwidth,
+                              left_gauss_engine=engine, minval=99)
+                     for engine in ["quadratic", "linear"]]
+        quadratic, linear = [smoother.smooth(signal) for smoother in smoothers]
+        assert linear[0] == quadratic[0] == max(signal[0], 99)
+        assert np.allclose(linear, quadratic, rtol=1e-10, atol=0)
+
+        with pytest.raises(ValueError):
+            Smoother(smoother_name="left_gauss_linear", left_gauss_engine="cubic")
+
     def test_causal_savgol_coeffs(self):
         # The coefficients should return standard average weights for M=0
         nl, nr = -10, 0
@@ -75,6 +89,24 @@ class TestSmoothers:
         )
         assert np.allclose(smoother.coeffs, np.ones(window_length) / window_length)
 
+    def test_savgol_coeffs_memoized(self):
+        smoother = Smoother(smoother_name="savgol", window_length=14, gaussian_bandwidth=36)
+        # Smoothers with the same settings share the coefficient vectors
+        other = Smoother(smoother_name="savgol", window_length=14, gaussian_bandwidth=36)
+        assert other.coeffs is smoother.coeffs
+        assert smoother.savgol_coeffs(-5, -1, 2) is other.savgol_coeffs(-5, -1, 2)
+        assert not smoother.coeffs.flags.writeable
+        # A different bandwidth gives different coefficients
+        assert not np.allclose(
+            Smoother(window_length=14, gaussian_bandwidth=None).coeffs, smoother.coeffs)
+
+        # Shortened window filters are precomputed, falling back to the raw signal if singular
+        assert len(smoother.boundary_coeffs) == 14
+        assert smoother.boundary_coeffs[0] is None and smoother.boundary_coeffs[1] is None
+        for ix in range(2, 14):
+            assert np.allclose(smoother.boundary_coeffs[ix], smoother.savgol_coeffs(-ix, 0, 2))
+        assert Smoother(smoother_name="moving_average").boundary_coeffs is None
+
     def test_causal_savgol_smoother(self):
         # The raw and smoothed lengths should match
         signal = np.ones(30)
@@ -296,3 +328,168 @@ class TestSmoothers:
         ix1 = signal.index
         ix2 = smoothed_signal.index
         assert ix1.equals(ix2)
+
+    @pytest.mark.parametrize("smoother_name", ["savgol", "moving_average", "identity"])
+    @pytest.mark.parametrize("impute_method", [None, "zeros", "identity"])
+    @pytest.mark.parametrize("boundary_method", ["shortened_window", "identity", "nan"])
+    def test_smooth_panel(self, smoother_name, impute_method, boundary_method):
+        rng = np.random.default_rng(0)
+        panel = rng.normal(10, 2, (20, 40))
+        panel[rng.random(panel.shape) < 0.1] = np.nan
+        # Rows starting at different times, including all-nan and single-value rows
+        for i in range(0, 20, 3):
+            panel[i, :i + 1] = np.nan
+        panel[1, :] = np.nan
+        panel[2, :-1] = np.nan
+
+        smoother = Smoother(smoother_name=smoother_name, window_length=7,
+                            impute_method=impute_method, boundary_method=boundary_method)
+        smoothed_panel = smoother.smooth_panel(panel)
+        expected = np.vstack([smoother.smooth(row) for row in panel])
+        assert smoothed_panel.shape == panel.shape
+        assert np.allclose(smoothed_panel, expected, equal_nan=True)
+
+    def test_smooth_panel_left_gauss_linear(self):
+        panel = np.vstack([np.arange(30.0), np.hstack([[np.nan] * 5, np.ones(25)])])
+        smoother = Smoother(smoother_name="left_gauss_linear")
+        expected = np.vstack([smoother.smooth(row) for row in panel])
+        assert np.allclose(smoother.smooth_panel(panel), expected, equal_nan=True)
+
+        with pytest.raises(ValueError):
+            smoother.smooth_panel(np.arange(30.0))
+
+    def test_smooth_frame(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            "geo_id": np.repeat(["a", "b", "c"], 30),
+            "timestamp": np.tile(pd.date_range("2020-01-01", periods=30), 3),
+            "val": rng.normal(10, 2, 90),
+        })
+        df.loc[df["geo_id"].eq("b") & (df["timestamp"] < "2020-01-05"), "val"] = np.nan
+        smoother = Smoother(smoother_name="savgol", window_length=7)
+        expected = df.groupby("geo_id")["val"].transform(smoother.smooth)
+
+        # The result is aligned with the rows of the dataframe, whatever their order
+        shuffled = df.sample(frac=1, random_state=0)
+        smoothed = smoother.smooth_frame(shuffled)
+        assert smoothed.index.equals(shuffled.index)
+        assert np.allclose(smoothed.sort_index(), expected, equal_nan=True)
+
+        with pytest.raises(ValueError):
+            smoother.smooth_frame(pd.concat([df, df.iloc[:1]]))
+        assert smoother.smooth_frame(df.iloc[:0]).empty
+
+    @pytest.mark.parametrize("smoother_kwargs", [
+        {"smoother_name": "savgol", "window_length": 7},
+        {"smoother_name": "moving_average", "window_length": 7},
+    ])
+    def test_smooth_frame_gaps(self, smoother_kwargs):
+        rng = np.random.default_rng(1)
+        df = pd.DataFrame({
+            "geo_id": np.repeat(["a", "b", "c"], 30),
+            "timestamp": np.tile(pd.date_range("2020-01-01", periods=30), 3),
+            "val": rng.normal(10, 2, 90),
+        })
+        # Geo b skips days in the middle of its series, and geo c only has its last day
+        df = df[~(df["geo_id"].eq("b") & df["timestamp"].between("2020-01-10", "2020-01-14"))]
+        df = df[~(df["geo_id"].eq("c") & (df["timestamp"] < "2020-01-30"))]
+        smoother = Smoother(**smoother_kwargs)
+
+        # The missing days are skipped rather than imputed, as by smooth() on each geo
+        expected = df.groupby("geo_id")["val"].transform(smoother.smooth)
+        assert np.allclose(smoother.smooth_frame(df), expected, equal_nan=True)
+
+    @pytest.mark.parametrize("smoother_kwargs", [
+        {},
+        {"smoother_name": "moving_average", "window_length": 7},
+        {"smoother_name": "identity"},
+        {"impute_method": "zeros", "boundary_method": "nan"},
+    ])
+    def test_incremental_smoother(self, tmp_path, smoother_kwargs):
+        rng = np.random.default_rng(0)
+        signal = rng.normal(10, 2, 60)
+        signal[:3] = np.nan
+        signal[rng.random(60) < 0.2] = np.nan
+        signal[3] = 5.0
+        smoother = Smoother(**smoother_kwargs)
+
+        incremental = IncrementalSmoother(**smoother_kwargs)
+        assert np.allclose(incremental.update(signal[:40]), smoother.smooth(signal[:40]),
+                           equal_nan=True)
+
+        # Save and load the state between runs
+        incremental.save(tmp_path / "state.npz")
+        incremental = IncrementalSmoother.load(tmp_path / "state.npz")
+
+        # Appending and revising trailing values matches smoothing the whole signal
+        smoothed = incremental.update(signal[40:50])
+        assert np.array_equal(smoothed, smoother.smooth(signal[:50]), equal_nan=True)
+        signal[45:50] += 1
+        smoothed = incremental.update(signal[45:], start=45)
+        assert np.array_equal(smoothed, smoother.smooth(signal), equal_nan=True)
+        smoothed = incremental.update([], start=55)
+        assert np.array_equal(smoothed, smoother.smooth(signal[:55]), equal_nan=True)
+
+        with pytest.raises(ValueError):
+            incremental.update(signal, start=100)
+
+    @pytest.mark.parametrize("smoother_kwargs", [
+        {},
+        {"smoother_name": "moving_average", "window_length": 5,
+         "boundary_method": "shortened_window"},
+        {"smoother_name": "left_gauss_linear"},
+    ])
+    def test_incremental_smoother_shortened(self, smoother_kwargs):
+        smoother = Smoother(**smoother_kwargs)
+        incremental = IncrementalSmoother(**smoother_kwargs)
+        signal = np.array([np.nan, 12.28, np.nan])
+
+        # Shortening the signal below the length that is smoothed passes the values through
+        for values, start in [(signal, 0), ([9.46], 2), ([], 2), ([], 1), ([7.0, 8.0], 1)]:
+            signal = np.concatenate([signal[:start], values])
+            assert np.array_equal(incremental.update(values, start=start),
+                                  smoother.smooth(signal), equal_nan=True)
+
+        # Shortening then appending matches smoothing the whole signal
+        signal = np.append(signal, np.arange(20.0))
+        signal[[5, 10]] = np.nan
+        incremental.update(signal[3:], start=3)
+        for values, start in [([], 12), ([np.nan, 1.0, 2.0], 12), ([], 6), ([4.0], 6)]:
+            signal = np.concatenate([signal[:start], values])
+            assert np.array_equal(incremental.update(values, start=start),
+                                  smoother.smooth(signal), equal_nan=True)
+
+    @pytest.mark.parametrize("smoother_kwargs, method", [
+        ({"window_length": 7}, "savgol_smoother"),
+        ({"smoother_name": "moving_average", "window_length": 7}, "moving_average_smoother"),
+    ])
+    def test_incremental_smoother_smooths_tail(self, smoother_kwargs, method):
+        signal = np.random.default_rng(0).normal(10, 2, 365)
+        incremental = IncrementalSmoother(**smoother_kwargs)
+        incremental.update(signal[:360])
+
+        # Only the values within one window of the revised and appended values are convolved
+        signal[358] += 1
+        with patch.object(incremental, method, wraps=getattr(incremental, method)) as smooth:
+            smoothed = incremental.update(signal[358:], start=358)
+        assert len(smooth.call_args.args[0]) == 7 + 7
+        assert np.array_equal(smoothed, Smoother(**smoother_kwargs).smooth(signal), equal_nan=True)
+
+    def test_incremental_smoother_reuses_imputation(self):
+        signal = np.arange(30.0)
+        signal[[5, 10, 15]] = np.nan
+        incremental = IncrementalSmoother(window_length=7)
+        incremental.update(signal)
+
+        imputed_before = incremental.imputed.copy()
+        incremental.update([np.nan, 40.0], start=30)
+        assert np.array_equal(incremental.imputed[:30], imputed_before)
+        assert not np.isnan(incremental.imputed).any()
+        assert np.array_equal(
+            incremental.smoothed,
+            Smoother(window_length=7).smooth(np.append(signal, [np.nan, 40.0])),
+            equal_nan=True)
+
+        # Shortening the signal keeps its imputed values for the next update
+        incremental.update([], start=20)
+        assert np.array_equal(incremental.imputed, imputed_before[:20])
@@ -1,7 +1,9 @@
 import logging
+from unittest.mock import Mock, patch
 
 import numpy as np
 import pandas as pd
+import pytest
 from delphi_utils.weekday import Weekday
 
 
@@ -38,6 +40,166 @@ class TestWeekday:
         ]
         assert np.allclose(result, expected_result)
 
+    @staticmethod
+    def _poisson_data(num_days, seed=0, low_count=False):
+        rng = np.random.default_rng(seed)
+        dates = pd.date_range("2020-01-01", periods=num_days)
+        if low_count:
+            den = rng.integers(10, 51, num_days).astype(float)
+        else:
+            den = rng.integers(1000, 5000, num_days).astype(float)
+        effects = np.array([0.1, -0.1, 0.05, 0, 0.2, -0.15, 0])[dates.dayofweek]
+        trend = 0.3 * np.sin(np.arange(num_days) / 30)
+        num = rng.poisson(0.05 * den * np.exp(effects + trend)).astype(float)
+        if low_count:
+            num = np.minimum(num, 8)
+        return pd.DataFrame({"num": num, "num2": num[::-1], "den": den, "date": dates})
+
+    @pytest.mark.parametrize("num_days, low_count", [
+        (5, False), (30, False), (365, False), (30, True), (365, True)])
+    def test_get_params_solver_parity(self, num_days, low_count):
+        data = self._poisson_data(num_days, low_count=low_count)
+        logger = Mock()
+        scales = [1, 1e5, 1e10, 1e15]
+
+        result = Weekday.get_params(data, "den", ["num", "num2"], "date", scales, logger)
+        reference = Weekday.get_params(data, "den", ["num", "num2"], "date", scales, logger,
+                                       solver="cvxpy")
+
+        assert result.shape == (2, 6 + num_days)
+        assert np.allclose(result, reference, atol=1e-3)
+        # The interior point solver converged without falling back to cvxpy
+        logger.warning.assert_not_called()
+
+    def test_get_params_fallback(self):
+        data = self._poisson_data(30)
+        logger = Mock()
+        with patch.object(Weekday, "_fit_interior_point", return_value=None):
+            result = Weekday.get_params(data, "den", ["num"], "date", [1, 1e5], logger)
+        reference = Weekday.get_params(data, "den", ["num"], "date", [1, 1e5], logger,
+                                       solver="cvxpy")
+        assert np.allclose(result, reference)
+        logger.warning.assert_called_once()
+
+    def test_fit_interior_point_objective(self):
+        data = self._poisson_data(100)
+        X = np.zeros((100, 106))
+        not_sunday = np.where(data["date"].dt.dayofweek != 6)[0]
+        X[not_sunday, data["date"].dt.dayofweek.to_numpy()[not_sunday]] = 1
+        X[data["date"].dt.dayofweek == 6, :6] = -1
+        X[:, 6:] = np.eye(100)
+        nums, denoms = data["num"].to_numpy(), data["den"].to_numpy()
+
+        def objective(b):
+            eta = X @ b + np.log(denoms)
+            diffs = np.diff(b[6:], 3)
+            return np.sum(np.exp(eta) - nums * eta) / 100 + 100 * np.sum(np.abs(diffs)) / 98
+
+        result = Weekday._fit(X, [1], nums, denoms)
+        reference = Weekday._fit(X, [1], nums, denoms, solver="cvxpy")
+
+        # The dedicated solver should be at least as accurate as the reference
+        assert objective(result) <= objective(reference) + 1e-7
+
+    def test_get_params_cache(self, tmp_path):
+        data = self._poisson_data(100)
+        logger = Mock()
+        args = ("den", ["num", "num2"], "date", [1, 1e5])
+
+        first = Weekday.get_params(data, *args, logger, cache_dir=tmp_path, cache_name="test")
+        assert (tmp_path / "test_num.npz").exists() and (tmp_path / "test_num2.npz").exists()
+        assert not logger.info.call_args.kwargs["warm_start"]
+
+        # Unchanged counts reuse the saved fit
+        logger.reset_mock()
+        second = Weekday.get_params(data, *args, logger, cache_dir=tmp_path, cache_name="test")
+        assert np.array_equal(first, second)
+        assert logger.info.call_args.args == ("Reusing cached weekday correction",)
+
+        # Only the cache files are left in the cache directory
+        assert sorted(f.name for f in tmp_path.iterdir()) == ["test_num.npz", "test_num2.npz"]
+
+        # A corrupt cache file is refitted and replaced
+        (tmp_path / "test_num.npz").write_bytes(b"PK\x03\x04 truncated")
+        logger.reset_mock()
+        third = Weekday.get_params(data, *args, logger, cache_dir=tmp_path, cache_name="test")
+        assert np.allclose(first, third)
+        assert logger.info.call_args_list[0].args == ("Fitted weekday correction",)
+        with np.load(tmp_path / "test_num.npz") as saved:
+            assert np.array_equal(saved["beta"], third[0])
+
+    def test_get_params_warm_start(self, tmp_path):
+        data = self._poisson_data(101)
+        logger = Mock()
+        args = ("den", ["num"], "date", [1, 1e5])
+        Weekday.get_params(data.iloc[:100], *args, logger, cache_dir=tmp_path)
+
+        data.loc[95:99, "num"] += 10
+        warm = Weekday.get_params(data, *args, logger, cache_dir=tmp_path)
+        cold = Weekday.get_params(data, *args, logger)
+
+        assert logger.info.call_args.kwargs["warm_start"]
+        assert logger.info.call_args.kwargs["converged"]
+        assert warm.shape == cold.shape
+        assert np.allclose(warm, cold, atol=1e-4)
+
+    def test_get_params_refit_window(self, tmp_path):
+        data = self._poisson_data(101)
+        logger = Mock()
+        args = ("den", ["num"], "date", [1, 1e5])
+        old = Weekday.get_params(data.iloc[:100], *args, logger, cache_dir=tmp_path)
+
+        data.loc[95:99, "num"] += 10
+        fast = Weekday.get_params(data, *args, logger, cache_dir=tmp_path, refit_window=28)
+        cold = Weekday.get_params(data, *args, logger)
+
+        assert logger.info.call_args.kwargs["refit_days"] == 28
+        # The phi outside the window are held fixed
+        assert np.array_equal(fast[0, 6:79], old[0, 6:79])
+        assert np.allclose(fast[0, :6], cold[0, :6], atol=1e-3)
+
+    def test_get_params_parallel(self, tmp_path):
+        data = self._poisson_data(60)
+        data["num3"] = data["num"] * 2
+        logger = Mock()
+        args = ("den", ["num", "num2", "num3"], "date", [1, 1e5])
+
+        serial = Weekday.get_params(data, *args, logger)
+        assert not logger.info.called
+        parallel = Weekday.get_params(data, *args, logger, max_workers=2)
+        assert np.array_equal(serial, parallel)
+        assert [call.kwargs["column"] for call in logger.info.call_args_list] == \
+            ["num", "num2", "num3"]
+        assert all("elapsed_time_in_seconds" in call.kwargs
+                   for call in logger.info.call_args_list)
+
+        cached = Weekday.get_params(data, *args, logger, cache_dir=tmp_path, max_workers=2)
+        assert np.array_equal(serial, cached)
+        assert (tmp_path / "weekday_num3.npz").exists()
+
+    def test_correction_table(self):
+        params = np.array([[1, -1, 1, -1, 1, -1, 1], [0, 0, 0, 0, 0, 0, 0]])
+        table = Weekday.correction_table(params)
+        assert np.allclose(table[0], np.exp([1, -1, 1, -1, 1, -1, 0]))
+        assert np.allclose(table[1], np.ones(7))
+
+    def test_calc_adjustment_long_frame(self):
+        params = np.array([[1, -1, 1, -1, 1, -1, 1]])
+        data = pd.concat([self.TEST_DATA.assign(geo_id=geo) for geo in ["a", "b", "c"]])
+
+        result = Weekday.calc_adjustment(params, data, ["num"], "date")
+        indexed = Weekday.calc_adjustment(params, data.set_index(["geo_id", "date"]),
+                                          ["num"], "date")
+
+        for geo in ["a", "b", "c"]:
+            expected = Weekday.calc_adjustment(params, self.TEST_DATA, ["num"], "date")
+            assert np.array_equal(result.loc[result["geo_id"] == geo, "num"], expected["num"])
+            assert np.array_equal(indexed.loc[geo, "num"], expected["num"])
+
+    def test_fit_invalid_solver(self):
+        with pytest.raises(ValueError, match="Invalid solver"):
+            Weekday._fit(np.zeros((10, 16)), [1], np.ones(10), np.ones(10), solver="admm")
+
     def test_calc_adjustment_with_zero_parameters(self):
         params = np.array([[0, 0, 0, 0, 0, 0, 0]])
 
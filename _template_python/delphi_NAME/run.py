@@ -39,7 +39,7 @@ def run_module(params):
     logger = get_structured_logger(
         __name__, filename=params["common"].get("log_filename"),
         log_exceptions=params["common"].get("log_exceptions", True))
-    mapper = GeoMapper()
+    mapper = GeoMapper.get_shared()
     run_stats = []
     ## build the base version of the signal at the most detailed geo level you can get.
     ## compute stuff here or farm out to another function or file
@@ -11,7 +11,7 @@ from datetime import datetime
 import pandas as pd
 from delphi_utils import GeoMapper
 
-gmpr = GeoMapper()
+gmpr = GeoMapper.get_shared()
 
 def store_backfill_file(df, _end_date, backfill_dir, numtype, geo, weekday):
     """
@@ -14,7 +14,7 @@ from delphi_utils import GeoMapper
 from .config import Config
 from .backfill import store_backfill_file, merge_backfill_file
 
-gmpr = GeoMapper()
+gmpr = GeoMapper.get_shared()
 def load_chng_data(filepath, dropdate, base_geo,
                    col_names, col_types, counts_col):
     """Load in and set up daily count data from Change.
@@ -109,6 +109,11 @@ def run_module(params: Dict[str, Dict[str, Any]]):
             - "types": list of str, sensor types to generate.
             - "wip_signal": list of str or bool, to be passed to delphi_utils.add_prefix.
             - "ftp_conn": dict, connection information for source FTP.
+            - "output_format" (optional): str, "csv" (default) or "parquet" to also write the
+                partitioned Parquet dataset.
+            - "record_hashes" (optional): bool, whether to record the hashes of the CSV files in
+                the manifest of export_dir, so that unchanged files are not rewritten and the
+                archiver does not re-read them.
     """
     start_time = time.time()
 
@@ -179,7 +184,9 @@ def run_module(params: Dict[str, Dict[str, Any]]):
                     numtype,
                     params["indicator"]["se"],
                     params["indicator"]["wip_signal"],
-                    logger
+                    logger,
+                    params["indicator"].get("output_format", "csv"),
+                    params["indicator"].get("record_hashes", False)
                 )
                 if numtype == "covid":
                     data = load_combined_data(file_dict["denom"],
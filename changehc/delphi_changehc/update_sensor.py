@@ -20,7 +20,8 @@ from .constants import SMOOTHED, SMOOTHED_ADJ, SMOOTHED_CLI, SMOOTHED_ADJ_CLI,\
 from .sensor import CHCSensor
 
 
-def write_to_csv(df, geo_level, write_se, day_shift, out_name, logger, output_path=".", start_date=None, end_date=None):
+def write_to_csv(df, geo_level, write_se, day_shift, out_name, logger, output_path=".",
+                 start_date=None, end_date=None, output_format="csv", record_hashes=False):
     """Write sensor values to csv.
 
     Args:
@@ -32,6 +33,10 @@ def write_to_csv(df, geo_level, write_se, day_shift, out_name, logger, output_pa
         output_path: outfile path to write the csv (default is current directory)
         start_date: the first date of the dates to be written
         end_date: the last date of the dates to be written
+        output_format: "csv" for daily CSV files, or "parquet" to also write the partitioned
+            Parquet dataset, which the validator and archiver do not read
+        record_hashes: whether to record the hashes of the CSV files in the manifest of
+            output_path, leaving files with unchanged contents in place
     """
     df = df.copy()
 
@@ -62,8 +67,19 @@ def write_to_csv(df, geo_level, write_se, day_shift, out_name, logger, output_pa
         start_date=start_date,
         end_date=end_date,
         sensor=out_name,
-        write_empty_days=True
+        write_empty_days=True,
+        record_hashes=record_hashes
     )
+    if output_format == "parquet":
+        create_export_csv(
+            df,
+            export_dir=output_path,
+            geo_res=geo_level,
+            start_date=start_date,
+            end_date=end_date,
+            sensor=out_name,
+            output_format="parquet"
+        )
     logger.debug("wrote {0} rows for {1} {2}".format(
         df.size, df["geo_id"].unique().size, geo_level
     ))
@@ -84,7 +100,9 @@ class CHCSensorUpdater:  # pylint: disable=too-many-instance-attributes
                  numtype,
                  se,
                  wip_signal,
-                 logger):
+                 logger,
+                 output_format="csv",
+                 record_hashes=False):
         """Init Sensor Updater.
 
         Args:
@@ -98,8 +116,14 @@ class CHCSensorUpdater:  # pylint: disable=too-many-instance-attributes
             se: boolean to write out standard errors, if true, use an obfuscated name
             wip_signal: Prefix for WIP signals
             logger: the structured logger
+            output_format: "csv" for daily CSV files, or "parquet" to also write a partitioned
+                Parquet dataset next to them
+            record_hashes: boolean to record the hashes of the CSV files in the manifest of the
+                export directory, leaving files with unchanged contents in place
         """
         self.logger = logger
+        self.output_format = output_format
+        self.record_hashes = record_hashes
         self.startdate, self.enddate, self.dropdate = [
             pd.to_datetime(t) for t in (startdate, enddate, dropdate)]
         # handle dates
@@ -148,7 +172,7 @@ class CHCSensorUpdater:  # pylint: disable=too-many-instance-attributes
         """
         # get right geography
         geo = self.geo
-        gmpr = GeoMapper()
+        gmpr = GeoMapper.get_shared()
         if geo not in {"county", "state", "msa", "hrr", "nation", "hhs"}:
             self.logger.error("{0} is invalid, pick one of 'county', "
                           "'state', 'msa', 'hrr', 'hss','nation'".format(geo))
@@ -162,9 +186,10 @@ class CHCSensorUpdater:  # pylint: disable=too-many-instance-attributes
                                                  date_col=Config.DATE_COL)
         elif geo == "state":
             data_frame = gmpr.replace_geocode(data, "fips", "state_id", new_col="state",
-                                              date_col=Config.DATE_COL)
+                                              date_col=Config.DATE_COL, engine="sparse")
         else:
-            data_frame = gmpr.replace_geocode(data, "fips", geo, date_col=Config.DATE_COL)
+            data_frame = gmpr.replace_geocode(data, "fips", geo, date_col=Config.DATE_COL,
+                                              engine="sparse")
 
         unique_geo_ids = pd.unique(data_frame[geo])
         data_frame.set_index([geo, Config.DATE_COL],inplace=True)
@@ -204,13 +229,13 @@ class CHCSensorUpdater:  # pylint: disable=too-many-instance-attributes
             [1, 1e5],
             self.logger,
         ) if self.weekday else None
+        if self.weekday:
+            data_frame = Weekday.calc_adjustment(wd_params, data_frame, ["num"], Config.DATE_COL)
         # run sensor fitting code (maybe in parallel)
         if not self.parallel:
             dfs = []
             for geo_id, sub_data in data_frame.groupby(level=0):
                 sub_data.reset_index(inplace=True)
-                if self.weekday:
-                    sub_data = Weekday.calc_adjustment(wd_params, sub_data, ["num"], Config.DATE_COL)
                 sub_data.set_index(Config.DATE_COL, inplace=True)
                 res = CHCSensor.fit(sub_data, self.burnindate, geo_id, self.logger)
                 res = pd.DataFrame(res).loc[final_sensor_idxs]
@@ -222,8 +247,6 @@ class CHCSensorUpdater:  # pylint: disable=too-many-instance-attributes
                 pool_results = []
                 for geo_id, sub_data in data_frame.groupby(level=0,as_index=False):
                     sub_data.reset_index(inplace=True)
-                    if self.weekday:
-                        sub_data = Weekday.calc_adjustment(wd_params, sub_data, ["num"], Config.DATE_COL)
                     sub_data.set_index(Config.DATE_COL, inplace=True)
                     pool_results.append(
                         pool.apply_async(
@@ -255,7 +278,9 @@ class CHCSensorUpdater:  # pylint: disable=too-many-instance-attributes
             day_shift=Config.DAY_SHIFT,
             out_name=self.signal_name,
             output_path=output_path,
-            logger=self.logger
+            logger=self.logger,
+            output_format=self.output_format,
+            record_hashes=self.record_hashes
         )
         stats = []
         if len(dates) > 0:
@@ -13,6 +13,7 @@ from moto import mock_s3
 import pytest
 
 # first party
+from delphi_utils.manifest import MANIFEST_FILE, Manifest, hash_file
 from delphi_changehc.config import Config
 from delphi_changehc.update_sensor import write_to_csv, CHCSensorUpdater
 
@@ -232,6 +233,75 @@ class TestWriteToCsv:
 
         td.cleanup()
 
+    def test_write_to_parquet_results(self):
+        """Tests that the Parquet dataset is written next to the CSV files."""
+        res0 = pd.DataFrame({
+            "val": [0.1, 0.5, 1.5] + [1, 3],
+            "se": [0.1, 1, 1.1] + [0.5, 0.5],
+            "sample_size": [np.nan] * 5,
+            "timestamp": pd.to_datetime(["2020-05-02", "2020-05-03", "2020-05-05"] +
+                                        ["2020-05-02", "2020-05-05"]),
+            "geo_id": ["a"] * 3 + ["b"] * 2,
+        })
+
+        td = TemporaryDirectory()
+        write_to_csv(
+            res0,
+            geo_level="geography",
+            write_se=False,
+            day_shift=CONFIG.DAY_SHIFT,
+            out_name="name_of_signal",
+            output_path=td.name,
+            logger=TEST_LOGGER,
+            output_format="parquet"
+        )
+
+        # the validator and archiver read the CSV files
+        assert sorted(os.listdir(td.name)) == [
+            "20200502_geography_name_of_signal.csv",
+            "20200503_geography_name_of_signal.csv",
+            "20200504_geography_name_of_signal.csv",
+            "20200505_geography_name_of_signal.csv",
+            "parquet"
+        ]
+        output_data = pd.read_parquet(join(td.name, "parquet"))
+        output_data = output_data.sort_values(["date", "geo_id"])
+        assert list(output_data.date.astype(str)) == \
+            ["20200502", "20200502", "20200503", "20200505", "20200505"]
+        assert list(output_data.geo_id) == ["a", "b", "a", "a", "b"]
+        assert np.array_equal(output_data.val.values, np.array([0.1, 1, 0.5, 1.5, 3]))
+        assert np.isnan(output_data.se.values).all()
+        td.cleanup()
+
+    def test_write_to_csv_record_hashes(self):
+        """Tests that the hashes of the CSV files are recorded in the manifest."""
+        res0 = pd.DataFrame({
+            "val": [0.1, 0.5, 1.5],
+            "se": [0.1, 1, 1.1],
+            "sample_size": [np.nan] * 3,
+            "timestamp": pd.to_datetime(["2020-05-02", "2020-05-03", "2020-05-04"]),
+            "geo_id": ["a"] * 3,
+        })
+
+        td = TemporaryDirectory()
+        write_to_csv(
+            res0,
+            geo_level="geography",
+            write_se=False,
+            day_shift=CONFIG.DAY_SHIFT,
+            out_name="name_of_signal",
+            output_path=td.name,
+            logger=TEST_LOGGER,
+            record_hashes=True
+        )
+
+        csv_files = [f for f in os.listdir(td.name) if f.endswith(".csv")]
+        assert sorted(os.listdir(td.name)) == sorted(csv_files + [MANIFEST_FILE])
+        manifest = Manifest(td.name)
+        for fname in csv_files:
+            assert manifest.get(fname) == hash_file(join(td.name, fname))
+        td.cleanup()
+
     def test_write_to_csv_with_se_results(self):
         """Tests that the standard error is written when requested."""
         res0 = pd.DataFrame({
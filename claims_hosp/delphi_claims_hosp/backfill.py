@@ -16,7 +16,7 @@ from delphi_utils import GeoMapper
 
 from .config import Config
 
-gmpr = GeoMapper()
+gmpr = GeoMapper.get_shared()
 
 def store_backfill_file(claims_filepath, _end_date, backfill_dir):
     """
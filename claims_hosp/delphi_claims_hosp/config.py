@@ -51,6 +51,7 @@ class Config:
 
 
     SMOOTHER_BANDWIDTH = 100  # bandwidth for the linear left Gaussian filter
+    SMOOTHER_ENGINE = "quadratic"  # "quadratic" or "linear" implementation of the filter
     MIN_DEN = 100  # number of total visits needed to produce a sensor
     MAX_BACKWARDS_PAD_LENGTH = (
         7  # maximum number of days used to average a backwards padding
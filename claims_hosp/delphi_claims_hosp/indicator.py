@@ -22,19 +22,20 @@ class ClaimsHospIndicator:
     """Class to fit a hospitalizations indicator using CLI counts from claims-based data."""
 
     @staticmethod
-    def gauss_smooth(num, den):
+    def gauss_smooth(num, den, engine=Config.SMOOTHER_ENGINE):
         """Smooth using the left_gauss_linear.
 
         Args:
             num: array of numerator counts
             den: array of denominator counts
+            engine: "quadratic" or "linear" implementation of left_gauss_linear
 
         Returns:
             tuple: (array of smoothed num, array of smoothed den)
 
         """
-        num_smooth = left_gauss_linear(num)
-        den_smooth = left_gauss_linear(den)
+        num_smooth = left_gauss_linear(num, engine=engine)
+        den_smooth = left_gauss_linear(den, engine=engine)
         den_smooth = np.clip(den_smooth, 0, None)
         num_smooth = np.clip(num_smooth, 0, den_smooth)
         return num_smooth, den_smooth
@@ -103,7 +104,8 @@ class ClaimsHospIndicator:
         return new_num, new_den
 
     @staticmethod
-    def fit(y_data, first_date, geo_id, num_col="num", den_col="den"):
+    def fit(y_data, first_date, geo_id, num_col="num", den_col="den",
+            smoother_engine=Config.SMOOTHER_ENGINE):
         """Fitting routine.
 
         Args:
@@ -112,6 +114,7 @@ class ClaimsHospIndicator:
             geo_id: unique identifier for the location column
             num_col: str name of numerator column
             den_col: str name of denominator column
+            smoother_engine: "quadratic" or "linear" implementation of left_gauss_linear
 
         Returns:
             dictionary of results
@@ -123,7 +126,7 @@ class ClaimsHospIndicator:
         # calculate smoothed counts and jeffreys rate
         # the left_gauss_linear smoother is not guaranteed to return values greater than 0
         smoothed_total_counts, smoothed_total_visits = ClaimsHospIndicator.gauss_smooth(
-            total_counts.flatten(), total_visits)
+            total_counts.flatten(), total_visits, smoother_engine)
 
         smoothed_total_rates = (
                 (smoothed_total_counts + 0.5) / (smoothed_total_visits + 1)
@@ -52,6 +52,13 @@ def run_module(params):
             - "weekday": list of bool, which weekday adjustments to perform. For each value in the
                 list, signals will be generated with weekday adjustments (True) or without
                 adjustments (False).
+            - "output_format" (optional): str, "csv" (default) or "parquet" to also write the
+                partitioned Parquet dataset.
+            - "record_hashes" (optional): bool, whether to record the hashes of the CSV files in
+                the manifest of export_dir, so that unchanged files are not rewritten and the
+                archiver does not re-read them.
+            - "smoother_engine" (optional): str, "quadratic" (default) or "linear", the
+                implementation of the left Gaussian smoother. "linear" runs in linear time.
     """
     start_time = time.time()
     logger = get_structured_logger(
@@ -135,7 +142,10 @@ def run_module(params):
                 params["indicator"]["parallel"],
                 weekday,
                 params["indicator"]["write_se"],
-                signal_name
+                signal_name,
+                params["indicator"].get("output_format", "csv"),
+                params["indicator"].get("record_hashes", False),
+                params["indicator"].get("smoother_engine", Config.SMOOTHER_ENGINE)
             )
             updater.update_indicator(
                 claims_file,
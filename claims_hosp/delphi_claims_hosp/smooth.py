@@ -11,20 +11,31 @@ Modified: 2020-09-27
 """
 import numpy as np
 
+from delphi_utils.smooth import truncated_left_gauss_linear
+
 from .config import Config
 
 
-def left_gauss_linear(arr, bandwidth=Config.SMOOTHER_BANDWIDTH):
+def left_gauss_linear(arr, bandwidth=Config.SMOOTHER_BANDWIDTH, engine=Config.SMOOTHER_ENGINE):
     """
     Smooth the y-values using a local linear left Gaussian filter.
 
     Args:
         arr: one dimensional signal to smooth.
         bandwidth: smoothing bandwidth (in terms of variance)
+        engine: "quadratic" to fit each value on the whole past, or "linear" to only
+            use the past values with a non-negligible weight, in linear time. The engines
+            agree to within floating point error, except on signals with nans: a nan makes
+            every later quadratic fit nan, but only the linear fits whose window contains it.
 
     Returns: a smoothed 1D signal.
 
     """
+    if engine == "linear":
+        return truncated_left_gauss_linear(arr, bandwidth)
+    if engine != "quadratic":
+        raise ValueError(f"Invalid engine '{engine}'")
+
     n_rows = len(arr)
     out_arr = np.zeros_like(arr)
     X = np.vstack([np.ones(n_rows), np.arange(n_rows)]).T  # pylint: disable=invalid-name
@@ -16,7 +16,8 @@ import pandas as pd
 from delphi_utils import GeoMapper
 
 # first party
-from delphi_utils import Weekday
+from delphi_utils import Weekday, create_export_csv, write_export_text
+from delphi_utils.manifest import Manifest
 from .config import Config, GeoConstants
 from .load_data import load_data
 from .indicator import ClaimsHospIndicator
@@ -29,7 +30,8 @@ class ClaimsHospIndicatorUpdater:
     # all variables are used
 
     def __init__(self, startdate, enddate, dropdate, geo, parallel, weekday,
-                 write_se, signal_name):
+                 write_se, signal_name, output_format="csv", record_hashes=False,
+                 smoother_engine=Config.SMOOTHER_ENGINE):
         """
         Initialize updater for the claims-based hospitalization indicator.
 
@@ -42,6 +44,12 @@ class ClaimsHospIndicatorUpdater:
             weekday: boolean to adjust for weekday effects
             write_se: boolean to write out standard errors, if true, use an obfuscated name
             signal_name: string signal name
+            output_format: "csv" for daily CSV files, or "parquet" to also write a partitioned
+                Parquet dataset next to them
+            record_hashes: boolean to record the hashes of the CSV files in the manifest of the
+                export directory, leaving files with unchanged contents in place
+            smoother_engine: "quadratic" or "linear" implementation of the left Gaussian
+                smoother, see smooth.left_gauss_linear
 
         """
         self.startdate, self.enddate, self.dropdate = [pd.to_datetime(t) for t in
@@ -49,6 +57,9 @@ class ClaimsHospIndicatorUpdater:
 
         self.geo, self.parallel, self.weekday, self.write_se, self.signal_name = \
             geo.lower(), parallel, weekday, write_se, signal_name
+        self.output_format = output_format
+        self.record_hashes = record_hashes
+        self.smoother_engine = smoother_engine
 
         # init in shift_dates, declared here for pylint
         self.burnindate, self.fit_dates, self.burn_in_dates, self.output_dates = \
@@ -94,7 +105,7 @@ class ClaimsHospIndicatorUpdater:
             reindexed dataframe
 
         """
-        geo_map = GeoMapper()
+        geo_map = GeoMapper.get_shared()
         if self.geo == "county":
             data_frame = geo_map.fips_to_megacounty(data,
                                                     Config.MIN_DEN,
@@ -105,12 +116,14 @@ class ClaimsHospIndicatorUpdater:
             data_frame = geo_map.replace_geocode(data,
                                                  from_code="fips",
                                                  new_col=self.geo,
-                                                 new_code="state_id")
+                                                 new_code="state_id",
+                                                 engine="sparse")
             data_frame[self.geo] = data_frame[self.geo]
         elif self.geo in ["msa", "hhs", "nation"]:
             data_frame = geo_map.replace_geocode(data,
                                                  from_code="fips",
-                                                 new_code=self.geo)
+                                                 new_code=self.geo,
+                                                 engine="sparse")
         elif self.geo == "hrr":
             data_frame = data  # data is already adjusted in aggregation step above
         else:
@@ -160,6 +173,8 @@ class ClaimsHospIndicatorUpdater:
             [1, 1e5],
             logger,
         ) if self.weekday else None
+        if self.weekday:
+            data_frame = Weekday.calc_adjustment(wd_params, data_frame, ["num"], Config.DATE_COL)
 
         # run fitting code (maybe in parallel)
         rates = {}
@@ -168,11 +183,9 @@ class ClaimsHospIndicatorUpdater:
         if not self.parallel:
             for geo_id, sub_data in data_frame.groupby(level=0):
                 sub_data.reset_index(inplace=True)
-                if self.weekday:
-                    sub_data = Weekday.calc_adjustment(
-                        wd_params, sub_data, ["num"], Config.DATE_COL)
                 sub_data.set_index(Config.DATE_COL, inplace=True)
-                res = ClaimsHospIndicator.fit(sub_data, self.burnindate, geo_id)
+                res = ClaimsHospIndicator.fit(sub_data, self.burnindate, geo_id,
+                                              smoother_engine=self.smoother_engine)
                 res = pd.DataFrame(res)
                 rates[geo_id] = np.array(res.loc[final_output_inds, "rate"])
                 std_errs[geo_id] = np.array(res.loc[final_output_inds, "se"])
@@ -184,14 +197,12 @@ class ClaimsHospIndicatorUpdater:
                 pool_results = []
                 for geo_id, sub_data in data_frame.groupby(level=0, as_index=False):
                     sub_data.reset_index(inplace=True)
-                    if self.weekday:
-                        sub_data = Weekday.calc_adjustment(
-                            wd_params, sub_data, ["num"], Config.DATE_COL)
                     sub_data.set_index(Config.DATE_COL, inplace=True)
                     pool_results.append(
                         pool.apply_async(
                             ClaimsHospIndicator.fit,
                             args=(sub_data, self.burnindate, geo_id,),
+                            kwds={"smoother_engine": self.smoother_engine},
                         )
                     )
                 pool_results = [proc.get() for proc in pool_results]
@@ -213,16 +224,21 @@ class ClaimsHospIndicatorUpdater:
             "include": valid_inds,
         }
 
-        self.write_to_csv(output_dict, outpath)
+        self.write_to_csv(output_dict, outpath, self.output_format, self.record_hashes)
         logging.debug("wrote files to %s", outpath)
 
-    def write_to_csv(self, output_dict, output_path="./receiving"):
+    def write_to_csv(self, output_dict, output_path="./receiving", output_format="csv",
+                     record_hashes=False):
         """
         Write values to csv.
 
         Args:
             output_dict: dictionary containing values, se, unique dates, and unique geo_id
             output_path: outfile path to write the csv
+            output_format: "csv" for daily CSV files, or "parquet" to also write the partitioned
+                Parquet dataset under output_path, which the validator and archiver do not read
+            record_hashes: boolean to record the hashes of the CSV files in the manifest of
+                output_path, leaving files with unchanged contents in place
 
         """
         if self.write_se:
@@ -235,6 +251,7 @@ class ClaimsHospIndicatorUpdater:
         all_rates = output_dict["rates"]
         all_se = output_dict["se"]
         all_include = output_dict["include"]
+        exported = Manifest(output_path) if record_hashes else None
         out_n = 0
         for i, date in enumerate(dates):
             filename = "%s/%s_%s_%s.csv" % (
@@ -243,25 +260,70 @@ class ClaimsHospIndicatorUpdater:
                 geo_level,
                 self.signal_name,
             )
-            with open(filename, "w") as outfile:
-                outfile.write("geo_id,val,se,direction,sample_size\n")
-                for geo_id in geo_ids:
-                    val = all_rates[geo_id][i]
-                    se = all_se[geo_id][i]
-                    if all_include[geo_id][i]:
-                        assert not np.isnan(val), "value for included value is nan"
-                        assert not np.isnan(se), "se for included rate is nan"
-                        if val > 90:
-                            logging.warning("value suspicious, %s: %d", geo_id, val)
-                        assert se < 5, f"se suspicious, {geo_id}: {se}"
-                        if self.write_se:
-                            assert val > 0 and se > 0, "p=0, std_err=0 invalid"
-                            outfile.write(
-                                "%s,%f,%s,%s,%s\n" % (geo_id, val, se, "NA", "NA"))
-                        else:
-                            # for privacy reasons we will not report the standard error
-                            outfile.write(
-                                "%s,%f,%s,%s,%s\n" % (geo_id, val, "NA", "NA", "NA"))
-                        out_n += 1
+            lines = ["geo_id,val,se,direction,sample_size\n"]
+            for geo_id in geo_ids:
+                val = all_rates[geo_id][i]
+                se = all_se[geo_id][i]
+                if all_include[geo_id][i]:
+                    assert not np.isnan(val), "value for included value is nan"
+                    assert not np.isnan(se), "se for included rate is nan"
+                    if val > 90:
+                        logging.warning("value suspicious, %s: %d", geo_id, val)
+                    assert se < 5, f"se suspicious, {geo_id}: {se}"
+                    if self.write_se:
+                        assert val > 0 and se > 0, "p=0, std_err=0 invalid"
+                        lines.append("%s,%f,%s,%s,%s\n" % (geo_id, val, se, "NA", "NA"))
+                    else:
+                        # for privacy reasons we will not report the standard error
+                        lines.append("%s,%f,%s,%s,%s\n" % (geo_id, val, "NA", "NA", "NA"))
+                    out_n += 1
+            write_export_text("".join(lines), filename, exported)
+        if exported is not None:
+            exported.save()
 
         logging.debug("wrote %d rows for %d %s", out_n, len(geo_ids), geo_level)
+        if output_format == "parquet":
+            self.write_to_parquet(output_dict, output_path)
+
+    def write_to_parquet(self, output_dict, output_path="./receiving"):
+        """
+        Write the included values to the partitioned Parquet dataset.
+
+        Applies the same checks as write_to_csv, over all dates and geo_ids at once.
+
+        Args:
+            output_dict: dictionary containing values, se, unique dates, and unique geo_id
+            output_path: export directory holding the Parquet dataset
+
+        """
+        geo_ids = output_dict["geo_ids"]
+        if not geo_ids:
+            return
+        dates = pd.DatetimeIndex(output_dict["dates"]) + Config.DAY_SHIFT
+        df = pd.DataFrame({
+            "geo_id": np.repeat(geo_ids, len(dates)),
+            "timestamp": np.tile(dates, len(geo_ids)),
+            "val": np.concatenate([output_dict["rates"][geo_id] for geo_id in geo_ids]),
+            "se": np.concatenate([output_dict["se"][geo_id] for geo_id in geo_ids]),
+            "include": np.concatenate([output_dict["include"][geo_id] for geo_id in geo_ids]),
+        })
+        df = df[df["include"].astype(bool)].drop(columns="include")
+
+        assert not df["val"].isna().any(), "value for included value is nan"
+        assert not df["se"].isna().any(), "se for included rate is nan"
+        for geo_id, val in df.loc[df["val"] > 90, ["geo_id", "val"]].itertuples(index=False):
+            logging.warning("value suspicious, %s: %d", geo_id, val)
+        assert not (df["se"] >= 5).any(), "se suspicious"
+        if self.write_se:
+            assert ((df["val"] > 0) & (df["se"] > 0)).all(), "p=0, std_err=0 invalid"
+        else:
+            # for privacy reasons we will not report the standard error
+            df["se"] = np.nan
+        df["direction"] = np.nan
+        df["sample_size"] = np.nan
+
+        if not df.empty:
+            create_export_csv(df, output_path, output_dict["geo_level"], self.signal_name,
+                              output_format="parquet")
+        logging.debug("wrote %d rows for %d %s", len(df), len(geo_ids),
+                      output_dict["geo_level"])
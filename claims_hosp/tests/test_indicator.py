@@ -98,3 +98,19 @@ class TestLoadData:
                 assert np.nanmax(res0["se"]) <= 100 * (0.5 / np.sqrt(Config.MIN_DEN))
                 assert np.nanmin(res0["se"]) > 0
                 assert res0["incl"].sum() > 0
+
+    def test_fit_smoother_engine(self):
+        date_range = pd.date_range("2020-05-01", "2020-05-20")
+        loc_index_fips_data = self.fips_data.set_index(["fips", "timestamp"])
+        fips = self.fips_data.fips.unique()[0]
+        sub_data = loc_index_fips_data.loc[fips].reindex(date_range, fill_value=0)
+
+        # The quadratic engine stays the default, and the linear engine is opt-in
+        assert Config.SMOOTHER_ENGINE == "quadratic"
+        default = ClaimsHospIndicator.fit(sub_data, date_range[0], fips)
+        quadratic = ClaimsHospIndicator.fit(sub_data, date_range[0], fips,
+                                            smoother_engine="quadratic")
+        linear = ClaimsHospIndicator.fit(sub_data, date_range[0], fips,
+                                         smoother_engine="linear")
+        assert np.array_equal(default["rate"], quadratic["rate"], equal_nan=True)
+        assert np.allclose(linear["rate"], quadratic["rate"], rtol=1e-8, equal_nan=True)
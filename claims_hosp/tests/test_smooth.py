@@ -1,5 +1,6 @@
 # third party
 import numpy as np
+import pytest
 
 # first party
 from delphi_claims_hosp.smooth import left_gauss_linear
@@ -12,3 +13,25 @@ class TestLeftGaussSmoother:
 
         signal = np.arange(1, 10) + np.random.normal(0, 1, 9)
         assert np.allclose(left_gauss_linear(signal, 0.1)[1:], signal[1:])
+
+    def test_gauss_linear_engines(self):
+        signal = np.cumsum(np.random.normal(100, 20, 500))
+        quadratic = left_gauss_linear(signal, engine="quadratic")
+        linear = left_gauss_linear(signal, engine="linear")
+        assert np.isnan(quadratic[0]) and np.isnan(linear[0])
+        assert np.allclose(linear[1:], quadratic[1:], rtol=1e-10, atol=0)
+
+        with pytest.raises(ValueError):
+            left_gauss_linear(signal, engine="cubic")
+
+    def test_gauss_linear_engines_nan(self):
+        signal = np.cumsum(np.random.normal(100, 20, 300))
+        signal[10] = np.nan
+        quadratic = left_gauss_linear(signal, engine="quadratic")
+        linear = left_gauss_linear(signal, engine="linear")
+
+        # A nan makes every later quadratic fit nan, but only the linear fits within its window
+        assert np.isnan(quadratic[10:]).all()
+        assert np.isnan(linear[10:20]).all()
+        assert not np.isnan(linear[100:]).any()
+        assert np.allclose(linear[1:10], quadratic[1:10], rtol=1e-10, atol=0)
@@ -11,6 +11,7 @@ import logging
 import pytest
 
 # first party
+from delphi_utils.manifest import MANIFEST_FILE, Manifest, hash_file
 from delphi_claims_hosp.config import Config, GeoConstants
 from delphi_claims_hosp.update_indicator import ClaimsHospIndicatorUpdater
 
@@ -181,6 +182,105 @@ class TestClaimsHospIndicatorUpdater:
 
         td.cleanup()
 
+    def test_write_to_parquet_results(self):
+        updater = ClaimsHospIndicatorUpdater(
+            "02-01-2020",
+            "06-01-2020",
+            "06-12-2020",
+            self.geo,
+            self.parallel,
+            self.weekday,
+            self.write_se,
+            Config.signal_name
+        )
+
+        res0 = {
+            "rates": {
+                "a": [0.1, 0.5, 1.5],
+                "b": [1, 2, 3]
+            },
+            "se": {
+                "a": [0.1, 1, 1.1],
+                "b": [0.5, np.nan, 0.5]
+            },
+            "dates": [
+                pd.to_datetime("2020-05-01"),
+                pd.to_datetime("2020-05-02"),
+                pd.to_datetime("2020-05-04")
+            ],
+            "include": {
+                "a": [True, True, True],
+                "b": [True, False, True]
+            },
+            "geo_ids": ["a", "b"],
+            "geo_level": "geography",
+        }
+
+        td = TemporaryDirectory()
+        updater.write_to_csv(res0, td.name, output_format="parquet")
+
+        # check outputs, written next to the CSV files read by the validator and archiver
+        assert sorted(os.listdir(td.name)) == [
+            "20200501_geography_" + Config.signal_name + ".csv",
+            "20200502_geography_" + Config.signal_name + ".csv",
+            "20200504_geography_" + Config.signal_name + ".csv",
+            "parquet"
+        ]
+        output_data = pd.read_parquet(join(td.name, "parquet"))
+        assert output_data.direction.isna().all()
+        assert set(output_data.signal) == {Config.signal_name}
+        assert set(output_data.geo_res) == {"geography"}
+        output_data = output_data.sort_values(["date", "geo_id"])
+        assert list(output_data.date.astype(str)) == \
+            ["20200501", "20200501", "20200502", "20200504", "20200504"]
+        assert list(output_data.geo_id) == ["a", "b", "a", "a", "b"]
+        assert np.array_equal(output_data.val.values, np.array([0.1, 1, 0.5, 1.5, 3]))
+
+        # for privacy we do not usually report SEs
+        assert np.isnan(output_data.se.values).all()
+        assert np.isnan(output_data.sample_size.values).all()
+
+        td.cleanup()
+
+    def test_write_to_csv_record_hashes(self):
+        updater = ClaimsHospIndicatorUpdater(
+            "02-01-2020",
+            "06-01-2020",
+            "06-12-2020",
+            self.geo,
+            self.parallel,
+            self.weekday,
+            self.write_se,
+            Config.signal_name
+        )
+        res0 = {
+            "rates": {"a": [0.1, 0.5], "b": [1, 2]},
+            "se": {"a": [0.1, 1], "b": [0.5, np.nan]},
+            "dates": [pd.to_datetime("2020-05-01"), pd.to_datetime("2020-05-02")],
+            "include": {"a": [True, True], "b": [True, False]},
+            "geo_ids": ["a", "b"],
+            "geo_level": "geography",
+        }
+
+        td = TemporaryDirectory()
+        updater.write_to_csv(res0, td.name, record_hashes=True)
+
+        manifest = Manifest(td.name)
+        csv_files = [f"2020050{day}_geography_{Config.signal_name}.csv" for day in (1, 2)]
+        assert sorted(os.listdir(td.name)) == sorted(csv_files + [MANIFEST_FILE])
+        for fname in csv_files:
+            assert manifest.get(fname) == hash_file(join(td.name, fname))
+
+        # Files with unchanged contents are left in place
+        mtimes = {fname: os.stat(join(td.name, fname)).st_mtime_ns for fname in csv_files}
+        res0["rates"]["a"][1] = 0.6
+        updater.write_to_csv(res0, td.name, record_hashes=True)
+        assert os.stat(join(td.name, csv_files[0])).st_mtime_ns == mtimes[csv_files[0]]
+        assert Manifest(td.name).get(csv_files[1]) == hash_file(join(td.name, csv_files[1]))
+        assert pd.read_csv(join(td.name, csv_files[1])).val.tolist() == [0.6]
+
+        td.cleanup()
+
     def test_write_to_csv_with_se_results(self):
         obfuscated_name = PARAMS["indicator"]["obfuscated_prefix"]
         signal_name = obfuscated_name + "_" + Config.signal_weekday_name
@@ -19,8 +19,8 @@ class GeoMaps:
     """Class to map counties to other geographic resolutions."""
 
     def __init__(self):
-        """Create the underlying GeoMapper."""
-        self.gmpr = GeoMapper()
+        """Attach the shared GeoMapper."""
+        self.gmpr = GeoMapper.get_shared()
         self.geo_func = {"county": partial(self.county_to_megacounty,
                                            threshold_visits=Config.MIN_RECENT_VISITS,
                                            threshold_len=Config.RECENT_LENGTH),
@@ -118,16 +118,13 @@ class GeoMaps:
             tuple of (data frame at daily-HRR resolution, geo_id column name)
 
         """
-        data = self.gmpr.add_geocode(data,
-                                     "fips",
-                                     "hrr",
-                                     from_col="PatCountyFIPS")
-        data.drop(columns="PatCountyFIPS", inplace=True)
-
         ## do a weighted sum by the wpop column to get each HRR's contribution
-        tmp = data.groupby(["ServiceDate", "hrr"])
-        wtsum = lambda g: g["weight"].values @ g[Config.COUNT_COLS]
-        data = tmp.apply(wtsum).reset_index()
+        data = self.gmpr.replace_geocode(data[["ServiceDate", "PatCountyFIPS"] + Config.COUNT_COLS],
+                                         "fips",
+                                         "hrr",
+                                         from_col="PatCountyFIPS",
+                                         date_col="ServiceDate",
+                                         engine="sparse")
 
         return data.groupby("hrr"), "hrr"
 
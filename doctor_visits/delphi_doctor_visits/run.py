@@ -42,6 +42,14 @@ def run_module(params):
             - "se": bool, whether to write out standard errors
             - "obfuscated_prefix": str, prefix for signal name if write_se is True.
             - "parallel": bool, whether to update sensor in parallel.
+            - "weekday_cache_dir" (optional): str, directory to save the weekday adjustment fits
+                in, so that the next run reuses them if the counts are unchanged or warm starts
+                from them otherwise.
+            - "output_format" (optional): str, "csv" (default) or "parquet" to also write the
+                partitioned Parquet dataset.
+            - "record_hashes" (optional): bool, whether to record the hashes of the CSV files in
+                the manifest of export_dir, so that unchanged files are not rewritten and the
+                archiver does not re-read them.
     """
     start_time = time.time()
     logger = get_structured_logger(
@@ -116,6 +124,7 @@ def run_module(params):
                 weekday=weekday,
                 se=params["indicator"]["se"],
                 logger=logger,
+                weekday_cache_dir=params["indicator"].get("weekday_cache_dir"),
             )
             if sensor is None:
                 logger.error("No sensors calculated, no output will be produced")
@@ -126,7 +135,9 @@ def run_module(params):
                 assert prefix is not None, "template has no obfuscated prefix"
                 out_name = prefix + "_" + out_name
 
-            write_to_csv(sensor, geo, se, out_name, logger, export_dir)
+            write_to_csv(sensor, geo, se, out_name, logger, export_dir,
+                         params["indicator"].get("output_format", "csv"),
+                         params["indicator"].get("record_hashes", False))
             max_dates.append(sensor.date.max())
             n_csv_export.append(sensor.date.unique().shape[0])
             logger.debug(f"wrote files to {export_dir}")
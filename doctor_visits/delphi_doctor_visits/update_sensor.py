@@ -17,13 +17,15 @@ import numpy as np
 import pandas as pd
 
 # first party
-from delphi_utils import Weekday
+from delphi_utils import Weekday, create_export_csv, write_export_text
+from delphi_utils.manifest import Manifest
 from .config import Config
 from .geo_maps import GeoMaps
 from .sensor import DoctorVisitsSensor
 
 
-def write_to_csv(output_df: pd.DataFrame, geo_level, se, out_name, logger, output_path="."):
+def write_to_csv(output_df: pd.DataFrame, geo_level, se, out_name, logger, output_path=".",
+                 output_format="csv", record_hashes=False):
     """Write sensor values to csv.
 
     Args:
@@ -31,10 +33,15 @@ def write_to_csv(output_df: pd.DataFrame, geo_level, se, out_name, logger, outpu
       se: boolean to write out standard errors, if true, use an obfuscated name
       out_name: name of the output file
       output_path: outfile path to write the csv (default is current directory)
+      output_format: "csv" for daily CSV files, or "parquet" to also write the partitioned
+        Parquet dataset, which the validator and archiver do not read
+      record_hashes: whether to record the hashes of the CSV files in the manifest of
+        output_path, leaving files with unchanged contents in place
     """
     if se:
         logger.info(f"========= WARNING: WRITING SEs TO {out_name} =========")
 
+    exported = Manifest(output_path) if record_hashes else None
     out_n = 0
     for d in set(output_df["date"]):
         filename = "%s/%s_%s_%s.csv" % (output_path,
@@ -42,33 +49,67 @@ def write_to_csv(output_df: pd.DataFrame, geo_level, se, out_name, logger, outpu
                                         geo_level,
                                         out_name)
         single_date_df = output_df[output_df["date"] == d]
-        with open(filename, "w") as outfile:
-            outfile.write("geo_id,val,se,direction,sample_size\n")
-
-            for line in single_date_df.itertuples():
-                geo_id = line.geo_id
-                sensor = 100 * line.val # report percentages
-                se_val = 100 * line.se
-                assert not np.isnan(sensor), "sensor value is nan, check pipeline"
-                assert sensor < 90, f"strangely high percentage {geo_id, sensor}"
-                if not np.isnan(se_val):
-                    assert se_val < 5, f"standard error suspiciously high! investigate {geo_id}"
-
-                if se:
-                    assert sensor > 0 and se_val > 0, "p=0, std_err=0 invalid"
-                    outfile.write(
-                        "%s,%f,%s,%s,%s\n" % (geo_id, sensor, se_val, "NA", "NA"))
-                else:
-                    # for privacy reasons we will not report the standard error
-                    outfile.write(
-                        "%s,%f,%s,%s,%s\n" % (geo_id, sensor, "NA", "NA", "NA"))
-                out_n += 1
+        lines = ["geo_id,val,se,direction,sample_size\n"]
+        for line in single_date_df.itertuples():
+            geo_id = line.geo_id
+            sensor = 100 * line.val # report percentages
+            se_val = 100 * line.se
+            assert not np.isnan(sensor), "sensor value is nan, check pipeline"
+            assert sensor < 90, f"strangely high percentage {geo_id, sensor}"
+            if not np.isnan(se_val):
+                assert se_val < 5, f"standard error suspiciously high! investigate {geo_id}"
+
+            if se:
+                assert sensor > 0 and se_val > 0, "p=0, std_err=0 invalid"
+                lines.append("%s,%f,%s,%s,%s\n" % (geo_id, sensor, se_val, "NA", "NA"))
+            else:
+                # for privacy reasons we will not report the standard error
+                lines.append("%s,%f,%s,%s,%s\n" % (geo_id, sensor, "NA", "NA", "NA"))
+            out_n += 1
+        write_export_text("".join(lines), filename, exported)
+    if exported is not None:
+        exported.save()
     logger.debug(f"wrote {out_n} rows for {geo_level}")
+    if output_format == "parquet":
+        write_to_parquet(output_df, geo_level, se, out_name, logger, output_path)
+
+
+def write_to_parquet(output_df: pd.DataFrame, geo_level, se, out_name, logger, output_path="."):
+    """Write sensor values to the partitioned Parquet dataset.
+
+    Applies the same checks as write_to_csv, over all dates at once.
+
+    Args:
+      output_df: dataframe containing date, geo_id, val and se columns
+      se: boolean to write out standard errors, if true, use an obfuscated name
+      out_name: name of the signal
+      output_path: export directory holding the Parquet dataset
+    """
+    df = pd.DataFrame({
+        "geo_id": output_df["geo_id"].values,
+        "timestamp": (output_df["date"] + Config.DAY_SHIFT).values,
+        "val": 100 * output_df["val"].values, # report percentages
+        "se": 100 * output_df["se"].values,
+        "direction": np.nan,
+        "sample_size": np.nan,
+    })
+    assert not df["val"].isna().any(), "sensor value is nan, check pipeline"
+    assert (df["val"] < 90).all(), "strangely high percentage"
+    assert not (df["se"] >= 5).any(), "standard error suspiciously high! investigate"
+    if se:
+        assert ((df["val"] > 0) & (df["se"] > 0)).all(), "p=0, std_err=0 invalid"
+    else:
+        # for privacy reasons we will not report the standard error
+        df["se"] = np.nan
+
+    if not df.empty:
+        create_export_csv(df, output_path, geo_level, out_name, output_format="parquet")
+    logger.debug(f"wrote {len(df)} rows for {geo_level}")
 
 
 def update_sensor(
         filepath, startdate, enddate, dropdate, geo, parallel,
-        weekday, se, logger
+        weekday, se, logger, weekday_cache_dir=None
 ):
     """Generate sensor values.
 
@@ -82,6 +123,8 @@ def update_sensor(
       weekday: boolean to adjust for weekday effects
       se: boolean to write out standard errors, if true, use an obfuscated name
       logger: the structured logger
+      weekday_cache_dir: directory to save the weekday fits in, to reuse or warm start them in
+        the next run, or None to fit them from scratch
     """
     # as of 2020-05-11, input file expected to have 10 columns
     # id cols: ServiceDate, PatCountyFIPS, PatAgeGroup, Pat HRR ID/Pat HRR Name
@@ -132,6 +175,9 @@ def update_sensor(
         Config.DATE_COL,
         [1, 1e5, 1e10, 1e15],
         logger,
+        max_workers=min(10, cpu_count()) if parallel else None,
+        cache_dir=weekday_cache_dir,
+        cache_name=f"doctor_visits_{geo}",
     ) if weekday else None
     if weekday and np.any(np.all(params == 0,axis=1)):
         # Weekday correction failed for at least one count type
@@ -143,7 +189,12 @@ def update_sensor(
     # get right geography
     geo_map = GeoMaps()
     mapping_func = geo_map.geo_func[geo.lower()]
-    data_groups, _ = mapping_func(data)
+    data_groups, geo_col = mapping_func(data)
+    if weekday:
+        data_groups = Weekday.calc_adjustment(params,
+                                              data_groups.obj,
+                                              Config.CLI_COLS + Config.FLU1_COL,
+                                              Config.DATE_COL).groupby(geo_col)
     unique_geo_ids = list(data_groups.groups.keys())
 
     # run sensor fitting code (maybe in parallel)
@@ -151,12 +202,6 @@ def update_sensor(
     if not parallel:
         for geo_id in unique_geo_ids:
             sub_data = data_groups.get_group(geo_id).copy()
-            if weekday:
-                sub_data = Weekday.calc_adjustment(params,
-                                                   sub_data,
-                                                   Config.CLI_COLS + Config.FLU1_COL,
-                                                   Config.DATE_COL)
-
             res = DoctorVisitsSensor.fit(
                 sub_data,
                 fit_dates,
@@ -178,12 +223,6 @@ def update_sensor(
             pool_results = []
             for geo_id in unique_geo_ids:
                 sub_data = data_groups.get_group(geo_id).copy()
-                if weekday:
-                    sub_data = Weekday.calc_adjustment(params,
-                                                       sub_data,
-                                                       Config.CLI_COLS + Config.FLU1_COL,
-                                                       Config.DATE_COL)
-
                 pool_results.append(
                     pool.apply_async(
                         DoctorVisitsSensor.fit,
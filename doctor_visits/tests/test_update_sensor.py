@@ -1,8 +1,16 @@
 """Tests for update_sensor.py."""
 import logging
+from unittest import mock
+from os import listdir, stat
+from os.path import join
+from tempfile import TemporaryDirectory
+
+import numpy as np
 import pandas as pd
 
-from delphi_doctor_visits.update_sensor import update_sensor
+from delphi_utils import Weekday
+from delphi_utils.manifest import MANIFEST_FILE, Manifest, hash_file
+from delphi_doctor_visits.update_sensor import update_sensor, write_to_csv
 
 TEST_LOGGER = logging.getLogger()
 
@@ -22,3 +30,56 @@ class TestUpdateSensor:
 
         comparison = pd.read_csv("./comparison/update_sensor/all.csv", parse_dates=["date"])
         pd.testing.assert_frame_equal(actual.reset_index(drop=True), comparison)
+
+    def test_update_sensor_weekday_cache(self):
+        with mock.patch.object(Weekday, "get_params", return_value=np.zeros((4, 11))) as fit:
+            update_sensor(
+                filepath="./test_data/SYNEDI_AGG_OUTPATIENT_07022020_1455CDT.csv.gz",
+                startdate="2020-02-04",
+                enddate="2020-02-05",
+                dropdate="2020-02-06",
+                geo="state",
+                parallel=False,
+                weekday=True,
+                se=False,
+                logger=TEST_LOGGER,
+                weekday_cache_dir="./weekday_cache",
+            )
+        assert fit.call_args.kwargs["cache_dir"] == "./weekday_cache"
+        assert fit.call_args.kwargs["cache_name"] == "doctor_visits_state"
+
+    def test_write_to_parquet(self):
+        sensor = pd.read_csv("./comparison/update_sensor/all.csv", parse_dates=["date"])
+        with TemporaryDirectory() as csv_dir, TemporaryDirectory() as parquet_dir:
+            write_to_csv(sensor, "state", False, "smoothed_cli", TEST_LOGGER, csv_dir)
+            write_to_csv(sensor, "state", False, "smoothed_cli", TEST_LOGGER, parquet_dir,
+                         output_format="parquet")
+            # the dataset is written next to the CSV files read by the validator and archiver
+            assert sorted(listdir(parquet_dir)) == sorted(listdir(csv_dir) + ["parquet"])
+            dataset = pd.read_parquet(join(parquet_dir, "parquet"))
+            assert "direction" in dataset.columns
+            for date, partition in dataset.groupby("date"):
+                expected = pd.read_csv(join(csv_dir, f"{date}_state_smoothed_cli.csv"))
+                partition = partition.sort_values("geo_id")
+                assert list(partition.geo_id) == list(expected.geo_id)
+                assert np.allclose(partition.val, expected.val, atol=1e-6)
+                assert partition.se.isna().all()
+
+    def test_write_to_csv_record_hashes(self):
+        sensor = pd.read_csv("./comparison/update_sensor/all.csv", parse_dates=["date"])
+        with TemporaryDirectory() as plain_dir, TemporaryDirectory() as hashed_dir:
+            write_to_csv(sensor, "state", False, "smoothed_cli", TEST_LOGGER, plain_dir)
+            write_to_csv(sensor, "state", False, "smoothed_cli", TEST_LOGGER, hashed_dir,
+                         record_hashes=True)
+            assert sorted(listdir(hashed_dir)) == sorted(listdir(plain_dir) + [MANIFEST_FILE])
+            manifest = Manifest(hashed_dir)
+            for fname in listdir(plain_dir):
+                assert manifest.get(fname) == hash_file(join(plain_dir, fname))
+
+            # Files with unchanged contents are left in place
+            mtimes = {fname: stat(join(hashed_dir, fname)).st_mtime_ns
+                      for fname in listdir(plain_dir)}
+            write_to_csv(sensor, "state", False, "smoothed_cli", TEST_LOGGER, hashed_dir,
+                         record_hashes=True)
+            for fname, mtime in mtimes.items():
+                assert stat(join(hashed_dir, fname)).st_mtime_ns == mtime
@@ -581,7 +581,7 @@ def fetch_new_reports(params, logger=None):
             ret[key] = latest_key_df
 
     # add nation from state
-    geomapper = GeoMapper()
+    geomapper = GeoMapper.get_shared()
     for sig in SIGNALS:
         state_key = ("state", sig, NOT_PROP)
         if state_key not in ret:
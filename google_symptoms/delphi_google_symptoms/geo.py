@@ -5,7 +5,7 @@ import pandas as pd
 from delphi_utils import GeoMapper
 from .constants import METRICS, COMBINED_METRIC
 
-gmpr = GeoMapper()
+gmpr = GeoMapper.get_shared()
 
 def generate_transition_matrix(geo_res):
     """
@@ -117,10 +117,8 @@ def run_module(params):
                         metric=metric,
                         smoother=smoother)
             df = df_pull
-            df["val"] = df[metric].astype(float)
-            df["val"] = df[["geo_id", "val"]].groupby(
-                "geo_id")["val"].transform(
-                SMOOTHERS_MAP[smoother][0].smooth)
+            df["val"] = SMOOTHERS_MAP[smoother][0].smooth_frame(
+                df, value_col=metric, geo_col="geo_id")
             df["se"] = np.nan
             df["sample_size"] = np.nan
             # Drop early entries where data insufficient for smoothing
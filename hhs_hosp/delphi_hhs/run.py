@@ -81,7 +81,7 @@ def run_module(params):
     logger = get_structured_logger(
         __name__, filename=params["common"].get("log_filename"),
         log_exceptions=params["common"].get("log_exceptions", True))
-    mapper = GeoMapper()
+    mapper = GeoMapper.get_shared()
     request_all_states = ",".join(mapper.get_geo_values("state_id"))
     end_day = date.today()
     if "epidata" in params["common"] and \
@@ -102,15 +102,20 @@ def run_module(params):
             continue
         dfs.append(pd.DataFrame(response['epidata']))
     all_columns = pd.concat(dfs)
-    geo_mapper = GeoMapper()
+    geo_mapper = GeoMapper.get_shared()
     stats = []
+    geo_dfs = {}
     for sensor, smoother, geo in product(SIGNALS, SMOOTHERS, GEOS):
         logger.info("Generating signal and exporting to CSV",
                     geo_res = geo,
                     sensor = sensor,
                     smoother = smoother)
-        df = make_signal(all_columns, sensor)
-        df = transform_signal(sensor, smoother, geo, df, geo_mapper)
+        if sensor not in geo_dfs:
+            # aggregate each signal to every geo once, and reuse it for every smoother
+            geo_dfs = {sensor: aggregate_signal(
+                sensor, make_signal(all_columns, sensor), GEOS, geo_mapper
+            )}
+        df = smooth_signal(sensor, smoother, geo, geo_dfs[sensor][geo].copy())
         if df.empty:
             continue
         sensor_name = sensor + smoother[1]
@@ -138,25 +143,32 @@ def run_module(params):
 
 def smooth_values(df, smoother):
     """Smooth the value column in the dataframe."""
-    df["val"] = df["val"].astype(float)
-    df["val"] = df[["geo_id", "val"]].groupby("geo_id")["val"].transform(
-        smoother.smooth
-    )
+    df["val"] = smoother.smooth_frame(df, value_col="val", geo_col="geo_id")
     return df
 
 def transform_signal(sensor, smoother, geo, df, geo_mapper):
     """Transform base df into specified geo/smoothing/prop configuration."""
+    df = aggregate_signal(sensor, df, [geo], geo_mapper)[geo]
+    return smooth_signal(sensor, smoother, geo, df)
+
+def aggregate_signal(sensor, df, geos, geo_mapper):
+    """Transform base df into each of the given geos, returning a dict keyed by geo."""
     df = geo_mapper.add_geocode(df, "state_id", "state_code", from_col="state")
     # handling population:
     #   add population column
-    #   sum admission counts *and* population counts during make_geo
+    #   sum admission counts *and* population counts during make_geos
     #   *then* divide counts by population to get the proportion
     if sensor.endswith("_prop"):
         df=geo_mapper.add_population_column(df, "state_code")
-    df = make_geo(df, geo, geo_mapper)
+    geo_dfs = make_geos(df, geos, geo_mapper)
     if sensor.endswith("_prop"):
-        df["val"]=round(df["val"]/df["population"]*100000, 7)
-        df.drop("population", axis=1, inplace=True)
+        for geo_df in geo_dfs.values():
+            geo_df["val"]=round(geo_df["val"]/geo_df["population"]*100000, 7)
+            geo_df.drop("population", axis=1, inplace=True)
+    return geo_dfs
+
+def smooth_signal(sensor, smoother, geo, df):
+    """Apply the smoother to a df already transformed into the given geo."""
     df = smooth_values(df, smoother[0])
     # Fix N/A MA values, see issue #1360
     if geo == "state" and sensor.startswith(CONFIRMED_FLU):
@@ -167,14 +179,19 @@ def transform_signal(sensor, smoother, geo, df, geo_mapper):
 
 def make_geo(state, geo, geo_mapper):
     """Transform incoming geo (state) to another geo."""
-    if geo == "state":
-        exported = state.rename(columns={"state": "geo_id"})
-        exported = exported.drop(columns="state_code")
-    else:
-        exported = geo_mapper.replace_geocode(state, "state_code", geo, new_col="geo_id")
-    exported["se"] = np.nan
-    exported["sample_size"] = np.nan
-    return exported
+    return make_geos(state, [geo], geo_mapper)[geo]
+
+def make_geos(state, geos, geo_mapper):
+    """Transform incoming geo (state) to each of the given geos in one pass."""
+    exported = geo_mapper.fan_out(
+        state, "state_code", [geo for geo in geos if geo != "state"], new_col="geo_id"
+    )
+    if "state" in geos:
+        exported["state"] = state.rename(columns={"state": "geo_id"}).drop(columns="state_code")
+    for geo_df in exported.values():
+        geo_df["se"] = np.nan
+        geo_df["sample_size"] = np.nan
+    return {geo: exported[geo] for geo in geos}
 
 
 def make_signal(all_columns, sig):
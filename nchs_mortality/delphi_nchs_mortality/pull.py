@@ -123,7 +123,7 @@ Columns available:
     df = pd.concat([df, df_ny]).reset_index().sort_values(["state", "timestamp"])
     # Add population info
     keep_columns.extend(["timestamp", "geo_id", "population"])
-    gmpr = GeoMapper()
+    gmpr = GeoMapper.get_shared()
     df = gmpr.add_population_column(df, "state_name", geocode_col="state")
     df = gmpr.add_geocode(df, "state_name", "state_id", from_col="state", new_col="geo_id")
     return df[keep_columns]
@@ -9,7 +9,7 @@ import pandas as pd
 from delphi_utils import GeoMapper
 
 
-gmpr = GeoMapper()
+gmpr = GeoMapper.get_shared()
 
 def store_backfill_file(df, _end_date, backfill_dir):
     """
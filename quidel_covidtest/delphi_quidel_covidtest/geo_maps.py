@@ -1,6 +1,6 @@
 """Contains geographic mapping tools."""
 from itertools import product
-from functools import reduce
+from functools import lru_cache, reduce
 
 import pandas as pd
 
@@ -8,7 +8,7 @@ from delphi_utils import GeoMapper
 from .constants import (AGE_GROUPS, MIN_OBS)
 
 DATA_COLS = ['totalTest', 'numUniqueDevices', 'positiveTest']
-GMPR = GeoMapper()  # Use geo utils
+GMPR = GeoMapper.get_shared()  # Use geo utils
 GEO_KEY_DICT = {
         "county": "fips",
         "msa": "msa",
@@ -73,20 +73,28 @@ def add_parent_state(data, geo_res, geo_key):
       population (since a msa/hrr may span multiple states)
     - map from county to the corresponding state
     """
-    fips_to_state = GMPR.get_crosswalk(from_code="fips", to_code="state")
-    if geo_res == "county":
-        mix_map = fips_to_state[["fips", "state_id"]]  # pylint: disable=unsubscriptable-object
-    else:
-        fips_to_geo_res = GMPR.get_crosswalk(from_code="fips", to_code=geo_res)
-        mix_map = fips_to_geo_res[["fips", geo_res]].merge(
-                fips_to_state[["fips", "state_id"]],  # pylint: disable=unsubscriptable-object
-                on="fips",
-                how="inner")
-        mix_map = GMPR.add_population_column(mix_map, "fips").groupby(
-                geo_res).max().reset_index().drop(
-                ["fips", "population"], axis = 1)
+    mix_map = parent_state_map(geo_res)
     # Merge the info of parent state to the data
     data = data.merge(mix_map, how="left", on=geo_key).drop(
         columns=["population"]).dropna()
     data = data.groupby(["timestamp", geo_key, "state_id"]).sum(numeric_only=True).reset_index()
     return data
+
+@lru_cache(maxsize=None)
+def parent_state_map(geo_res):
+    """
+    Return the mapping from geo_res to its parent state used by add_parent_state.
+
+    The mapping only depends on the crosswalks, so it is computed once per geo_res.
+    """
+    fips_to_state = GMPR.get_crosswalk(from_code="fips", to_code="state")
+    if geo_res == "county":
+        return fips_to_state[["fips", "state_id"]]  # pylint: disable=unsubscriptable-object
+    fips_to_geo_res = GMPR.get_crosswalk(from_code="fips", to_code=geo_res)
+    mix_map = fips_to_geo_res[["fips", geo_res]].merge(
+            fips_to_state[["fips", "state_id"]],  # pylint: disable=unsubscriptable-object
+            on="fips",
+            how="inner")
+    return GMPR.add_population_column(mix_map, "fips").groupby(
+            geo_res).max().reset_index().drop(
+            ["fips", "population"], axis = 1)